@@ -0,0 +1,121 @@
+"""Alta de cuentas apoyada en índices únicos.
+
+El email es único por índice: el registro inserta directamente y un
+``DuplicateKeyError`` significa "ya registrado", sin un ``find_one`` previo
+ni la carrera entre la consulta y la inserción que permitía dos cuentas con
+el mismo email. El ingreso con Google es un solo upsert por email.
+
+El usuario y su perfil de jardinero se escriben en una transacción cuando
+el servidor las soporta (replica set o mongos); en un mongod suelto se
+escriben uno tras otro y, si falla el perfil, se deshace el usuario.
+"""
+from datetime import datetime
+from typing import Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+TRANSACTION_TOPOLOGIES = ("ReplicaSetWithPrimary", "Sharded")
+
+
+def ensure_account_indexes(db):
+    db.users.create_index("email", unique=True, name="users_email_unique")
+    db.users.create_index("user_id", unique=True, name="users_user_id_unique")
+    # Solo las cuentas vinculadas a Google tienen google_id
+    db.users.create_index("google_id", unique=True, name="users_google_id_unique",
+                          partialFilterExpression={"google_id": {"$type": "string"}})
+    db.gardeners.create_index("user_id", unique=True, name="gardeners_user_id_unique")
+
+
+def new_gardener_profile(user_id: str) -> dict:
+    return {
+        "user_id": user_id,
+        "tools": [],
+        "coverage_areas": [],
+        "base_rates": {},
+        "availability": {},
+        "is_available": True,
+        "rating": 0.0,
+        "completed_jobs": 0,
+        "specialties": [],
+        "bio": None,
+        "years_experience": 0,
+        "created_at": datetime.utcnow()
+    }
+
+
+def supports_transactions(db) -> bool:
+    description = getattr(db.client, "topology_description", None)
+    return description is not None and description.topology_type_name in TRANSACTION_TOPOLOGIES
+
+
+def _write(db, write):
+    """Ejecutar ``write(session)`` en una transacción si se puede, si no sin sesión"""
+    if not supports_transactions(db):
+        return write(None)
+    with db.client.start_session() as session:
+        return session.with_transaction(write)
+
+
+def insert_account(db, user_doc: dict, gardener_doc: Optional[dict] = None):
+    """Insertar usuario y perfil. ``DuplicateKeyError`` si el email ya está registrado"""
+    if gardener_doc is None:
+        db.users.insert_one(user_doc)
+        return
+    if supports_transactions(db):
+        def write(session):
+            db.users.insert_one(user_doc, session=session)
+            db.gardeners.insert_one(gardener_doc, session=session)
+        _write(db, write)
+        return
+
+    db.users.insert_one(user_doc)
+    try:
+        db.gardeners.insert_one(gardener_doc)
+    except Exception:
+        # Sin transacciones: no dejar un jardinero sin perfil
+        db.users.delete_one({"user_id": user_doc["user_id"]})
+        raise
+
+
+def upsert_google_account(db, user_doc: dict, gardener_doc: Optional[dict] = None) -> dict:
+    """Vincular o crear la cuenta de Google con un upsert por email.
+
+    ``user_doc`` es el usuario a crear si no existe. A uno existente que aún
+    no estaba vinculado se le fijan ``google_id`` y ``auth_provider``, y el
+    avatar si no tenía: una segunda escritura que ocurre una sola vez por
+    cuenta.
+    """
+    def write(session):
+        before = db.users.find_one_and_update(
+            {"email": user_doc["email"]},
+            {"$setOnInsert": user_doc},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE,
+            session=session
+        )
+        if before is None and gardener_doc is not None:
+            db.gardeners.insert_one(gardener_doc, session=session)
+        return before
+
+    try:
+        existing = _write(db, write)
+    except DuplicateKeyError:
+        # El google_id ya está en otra cuenta (cambió el email en Google) o
+        # un upsert concurrente creó la misma: usar esa
+        existing = db.users.find_one({"$or": [{"email": user_doc["email"]}, {"google_id": user_doc["google_id"]}]})
+        if existing is None:
+            raise
+        return existing
+
+    if existing is None:
+        return user_doc
+    update = {}
+    if not existing.get("google_id"):
+        update.update(google_id=user_doc["google_id"], auth_provider=user_doc["auth_provider"])
+    if not existing.get("avatar_url") and user_doc.get("avatar_url"):
+        update["avatar_url"] = user_doc["avatar_url"]
+    if update:
+        db.users.update_one({"user_id": existing["user_id"]}, {"$set": update})
+        existing.update(update)
+    return existing
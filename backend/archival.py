@@ -0,0 +1,92 @@
+"""Partición caliente/fría de servicios.
+
+Los servicios terminados (COMPLETED, CANCELLED) sin cambios durante más de
+``service_archive_days`` se mueven en lotes a ``services_archive``. Así los
+índices y consultas sobre estados activos solo ven el conjunto vivo.
+
+Como un servicio archivado no se modificó en esa ventana, su ``created_at``
+siempre es anterior al inicio de la ventana caliente. Los listados de
+historial consultan primero ``services`` y solo leen el archivo cuando la
+página llega más atrás que esa ventana. Si se amplía la ventana después de
+haber archivado, los servicios ya archivados dentro de la nueva ventana solo
+aparecen cuando la página cruza el límite anterior.
+"""
+import heapq
+from datetime import datetime, timedelta
+from itertools import islice
+from typing import Optional
+
+from pymongo import ReplaceOne
+
+TERMINAL_STATUSES = ["completed", "cancelled"]
+
+
+def ensure_service_indexes(db):
+    services = db.services
+    services.create_index("service_id")
+    services.create_index([("client_id", 1), ("created_at", -1)])
+    services.create_index([("gardener_id", 1), ("created_at", -1)])
+    services.create_index([("status", 1), ("created_at", -1)])
+    # Búsqueda de terminados para archivar
+    services.create_index([("status", 1), ("updated_at", 1)])
+
+    archive = db.services_archive
+    archive.create_index("service_id")
+    archive.create_index([("client_id", 1), ("created_at", -1)])
+    archive.create_index([("gardener_id", 1), ("created_at", -1)])
+    archive.create_index("created_at")
+
+
+def archive_terminal_services(db, older_than_days: int, batch_size: int = 500, max_batches: int = 50) -> dict:
+    """Mover servicios terminados antiguos a services_archive, por lotes"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    query = {"status": {"$in": TERMINAL_STATUSES}, "updated_at": {"$lt": cutoff}}
+    moved = 0
+
+    for _ in range(max_batches):
+        batch = list(db.services.find(query).sort("updated_at", 1).limit(batch_size))
+        if not batch:
+            break
+
+        # Upsert por _id: si un lote se interrumpe, reintentarlo no duplica documentos
+        db.services_archive.bulk_write(
+            [ReplaceOne({"_id": service["_id"]}, service, upsert=True) for service in batch],
+            ordered=False
+        )
+        # Volver a filtrar por el estado por si alguno cambió mientras tanto
+        ids = [s["_id"] for s in batch]
+        result = db.services.delete_many({"_id": {"$in": ids}, **query})
+        moved += result.deleted_count
+        if result.deleted_count < len(ids):
+            # Los que siguen vivos no pueden quedar también en el archivo:
+            # find_services_history los mostraría dos veces
+            still_live = [doc["_id"] for doc in db.services.find({"_id": {"$in": ids}}, {"_id": 1})]
+            if still_live:
+                db.services_archive.delete_many({"_id": {"$in": still_live}})
+
+        if len(batch) < batch_size:
+            break
+
+    return {"moved": moved, "cutoff": cutoff}
+
+
+def find_services_history(db, query: dict, limit: Optional[int] = None, before: Optional[datetime] = None,
+                          hot_window_days: int = 30, session=None) -> list:
+    """Servicios más recientes primero, leyendo el archivo solo si hace falta"""
+    if before is not None:
+        query = {**query, "created_at": {"$lt": before}}
+
+    cursor = db.services.find(query, session=session).sort("created_at", -1)
+    if limit:
+        cursor = cursor.limit(limit)
+    services = list(cursor)
+
+    hot_window_start = datetime.utcnow() - timedelta(days=hot_window_days)
+    if limit and len(services) == limit and services[-1]["created_at"] >= hot_window_start:
+        return services
+
+    archived = db.services_archive.find(query, session=session).sort("created_at", -1)
+    if limit:
+        archived = archived.limit(limit)
+    merged = heapq.merge(services, archived, key=lambda service: service["created_at"], reverse=True)
+    return list(islice(merged, limit)) if limit else list(merged)
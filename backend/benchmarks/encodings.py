@@ -0,0 +1,114 @@
+"""Bytes enviados y CPU de cada codificación de respuesta.
+
+Para cada endpoint de listado arma una respuesta con la forma real
+(documentos de Mongo -> modelos -> jsonable) y mide, por codificación, el
+tamaño del cuerpo y el mejor tiempo de serializar + comprimir. La segunda
+tabla varía la cantidad de servicios para ver desde qué tamaño la
+compresión paga su costo, y así elegir COMPRESSION_MIN_BYTES.
+
+Las codificaciones cuyo paquete no está instalado (brotli, zstandard,
+msgpack) se omiten.
+
+Uso (desde backend/):
+    python -m benchmarks.encodings
+    python -m benchmarks.encodings --sizes 1,5,10,25,100
+"""
+import argparse
+import json
+import random
+import sys
+
+from fastapi.encoders import jsonable_encoder
+
+from benchmarks.hotpaths import SEED, make_notification_doc, make_service_doc, measure
+from encoding import ApiResponse, Compressor, brotli, msgpack, zstandard
+from server import Notification, ServiceResponse
+from servicedocs import expand_service
+
+
+def build_payloads(rng: random.Random) -> dict:
+    services = [ServiceResponse(**expand_service(make_service_doc(rng))) for _ in range(100)]
+    notifications = [Notification(**make_notification_doc(rng)) for _ in range(50)]
+    return {
+        "GET /api/services/my-requests (100)": jsonable_encoder(services),
+        "GET /api/services/available (50)": jsonable_encoder(services[:50]),
+        "GET /api/notifications (50)": jsonable_encoder(notifications),
+        "POST /api/services/request (1)": jsonable_encoder(services[0]),
+    }
+
+
+def build_encoders() -> dict:
+    compressor = Compressor()
+    as_json = lambda content: ApiResponse(content).body
+    encoders = {
+        "json": as_json,
+        "json+gzip1": lambda content: Compressor(gzip_level=1).compress("gzip", as_json(content)),
+        "json+gzip6": lambda content: compressor.compress("gzip", as_json(content)),
+    }
+    if brotli is not None:
+        encoders["json+br4"] = lambda content: compressor.compress("br", as_json(content))
+    if zstandard is not None:
+        encoders["json+zstd3"] = lambda content: compressor.compress("zstd", as_json(content))
+    if msgpack is not None:
+        encoders["msgpack"] = lambda content: msgpack.packb(content, use_bin_type=True)
+        encoders["msgpack+gzip6"] = lambda content: compressor.compress(
+            "gzip", msgpack.packb(content, use_bin_type=True))
+    return encoders
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamaño y CPU de las codificaciones de respuesta")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.1, help="Segundos mínimos por repetición")
+    parser.add_argument("--sizes", default="1,2,5,10,25,50,100",
+                        help="Cantidades de servicios para la tabla de umbral")
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados como JSON")
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    payloads = build_payloads(rng)
+    encoders = build_encoders()
+    results = {}
+
+    for endpoint, content in payloads.items():
+        results[endpoint] = {}
+        for name, encode in encoders.items():
+            results[endpoint][name] = {
+                "bytes": len(encode(content)),
+                "us": measure(lambda: encode(content), args.repeat, args.min_time),
+            }
+
+    services = payloads["GET /api/services/my-requests (100)"]
+    threshold = {}
+    for count in (int(size) for size in args.sizes.split(",")):
+        content = services[:count]
+        raw = len(encoders["json"](content))
+        threshold[count] = {"json_bytes": raw}
+        for name in ("json+gzip6", "json+br4", "json+zstd3"):
+            if name in encoders:
+                encode = encoders[name]
+                extra_us = measure(lambda: encode(content), args.repeat, args.min_time) - \
+                    measure(lambda: encoders["json"](content), args.repeat, args.min_time)
+                threshold[count][name] = {"saved_bytes": raw - len(encode(content)), "extra_us": extra_us}
+
+    if args.json:
+        print(json.dumps({"endpoints": results, "threshold": threshold}, indent=2))
+        return 0
+
+    for endpoint, rows in results.items():
+        identity = rows["json"]["bytes"]
+        print(f"\n{endpoint}")
+        print(f"  {'codificación':<16} {'bytes':>8} {'% json':>7} {'µs':>9}")
+        for name, row in rows.items():
+            print(f"  {name:<16} {row['bytes']:>8} {row['bytes'] / identity * 100:>6.0f}% {row['us']:>9.1f}")
+
+    print("\nUmbral: bytes ahorrados y µs extra de comprimir, por tamaño de la respuesta")
+    for count, row in threshold.items():
+        cells = [f"{name}: -{cell['saved_bytes']}B +{cell['extra_us']:.0f}µs"
+                 for name, cell in row.items() if name != "json_bytes"]
+        print(f"  {count:>3} servicios {row['json_bytes']:>7}B  " + "  ".join(cells))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
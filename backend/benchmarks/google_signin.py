@@ -0,0 +1,89 @@
+"""Ingreso con Google: verificación local del ID token vs descargar las claves.
+
+Usa ``FakeIdentityProvider`` (sin red) con una latencia simulada por
+llamada al proveedor. "sin cache" descarga discovery y JWKS en cada
+ingreso (un verificador sin cache); "cache" verifica
+contra las claves en memoria de ``OpenIDProvider``. Imprime la latencia por
+ingreso, los ingresos por segundo con ``--concurrency`` tareas y las
+llamadas salientes por ingreso (con cache solo las del calentamiento).
+
+Uso (desde backend/):
+    python -m benchmarks.google_signin
+    python -m benchmarks.google_signin --logins 2000 --latency-ms 80 --concurrency 50
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+from oidc import FakeIdentityProvider
+
+
+class DelayedTransport(httpx.AsyncBaseTransport):
+    """Transporte en memoria con la latencia de ida y vuelta de una red real"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, latency_seconds: float):
+        self.transport = transport
+        self.latency_seconds = latency_seconds
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(self.latency_seconds)
+        return await self.transport.handle_async_request(request)
+
+
+async def run(mode: str, logins: int, latency_seconds: float, concurrency: int) -> dict:
+    idp = FakeIdentityProvider()
+    provider = idp.provider()
+    provider._client_kwargs["transport"] = DelayedTransport(idp.transport, latency_seconds)
+    tokens = [idp.issue_id_token(f"sub-{index}", f"user{index}@example.com", "Bench") for index in range(100)]
+    await provider.refresh()
+    warmup = idp.outbound_requests
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def login(index: int):
+        async with semaphore:
+            started = time.perf_counter()
+            if mode == "sin cache":
+                # Las mismas dos descargas por ingreso, sin el lock de refresh()
+                await provider._get(provider.metadata_url)
+                await provider._get(provider.metadata["jwks_uri"])
+            claims = await provider.verify_id_token(tokens[index % len(tokens)])
+            assert claims["sub"] == f"sub-{index % len(tokens)}"
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login(index) for index in range(logins)))
+    elapsed = time.perf_counter() - started
+    await provider.aclose()
+    return {
+        "median_ms": statistics.median(latencies) * 1000,
+        "p99_ms": sorted(latencies)[int(len(latencies) * 0.99) - 1] * 1000,
+        "per_second": logins / elapsed,
+        "outbound_per_login": (idp.outbound_requests - warmup) / logins,
+        "warmup": warmup,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Verificación de ID tokens de Google")
+    parser.add_argument("--logins", type=int, default=500)
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="Latencia simulada por llamada al proveedor")
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'modo':<10} {'mediana ms':>11} {'p99 ms':>8} {'ingresos/s':>11} {'salientes/ingreso':>18}")
+    results = {}
+    for mode in ("sin cache", "cache"):
+        results[mode] = result = asyncio.run(run(mode, args.logins, args.latency_ms / 1000, args.concurrency))
+        print(f"{mode:<10} {result['median_ms']:>11.2f} {result['p99_ms']:>8.2f} "
+              f"{result['per_second']:>11.0f} {result['outbound_per_login']:>18.2f}")
+    print(f"calentamiento: {results['cache']['warmup']} llamadas (discovery + JWKS)")
+    return 1 if results["cache"]["outbound_per_login"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
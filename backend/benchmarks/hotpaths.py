@@ -0,0 +1,196 @@
+"""Microbenchmarks de las funciones que corren en cada solicitud.
+
+Cubre calculate_service_price, create_access_token, la decodificación del JWT
+en get_current_user, la construcción de ServiceResponse y Notification a
+partir de documentos con la forma real de Mongo, y validate_phone_number.
+
+Los datos se generan con semilla fija. Cada caso reporta el mejor tiempo por
+llamada de varias repeticiones (el menos afectado por ruido del sistema).
+
+Uso (desde backend/):
+    python -m benchmarks.hotpaths
+    python -m benchmarks.hotpaths --save-baseline benchmarks/hotpaths_baseline.json
+    python -m benchmarks.hotpaths --baseline benchmarks/hotpaths_baseline.json --max-regression 25
+"""
+import argparse
+import json
+import random
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+
+from fastapi.security import HTTPAuthorizationCredentials
+
+from server import (
+    Notification,
+    NotificationType,
+    PruningDifficulty,
+    ServiceResponse,
+    ServiceStatus,
+    ServiceType,
+    calculate_service_price,
+    create_access_token,
+    get_current_user,
+    validate_phone_number,
+)
+from servicedocs import compact_service, expand_service
+
+SEED = 1234
+
+
+class _UsersStandIn:
+    def __init__(self, user: dict):
+        self.user = user
+
+    def find_one(self, query, *args, **kwargs):
+        return self.user
+
+
+class _DatabaseStandIn:
+    """Base mínima para aislar el costo de get_current_user de la red"""
+
+    def __init__(self, user: dict):
+        self.users = _UsersStandIn(user)
+
+
+def make_service_doc(rng: random.Random) -> dict:
+    created_at = datetime(2024, 1, 1) + timedelta(minutes=rng.randint(0, 500_000))
+    service_type = rng.choice(list(ServiceType))
+    accepted = rng.random() < 0.5
+    return compact_service({
+        "_id": uuid.UUID(int=rng.getrandbits(128)).hex[:24],
+        "service_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "client_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "gardener_id": str(uuid.UUID(int=rng.getrandbits(128))) if accepted else None,
+        "client_name": "María González",
+        "gardener_name": "Juan Pérez" if accepted else None,
+        "service_type": service_type.value,
+        "address": f"Av. Corrientes {rng.randint(100, 9000)}, Buenos Aires",
+        "latitude": -34.6 + rng.uniform(-0.2, 0.2),
+        "longitude": -58.4 + rng.uniform(-0.2, 0.2),
+        "terrain_width": round(rng.uniform(5, 40), 1),
+        "terrain_length": round(rng.uniform(5, 40), 1),
+        "images": [f"/uploads/{uuid.UUID(int=rng.getrandbits(128))}.jpg" for _ in range(rng.randint(0, 3))],
+        "pruning_difficulty": PruningDifficulty.MEDIUM.value if service_type == ServiceType.PRUNING else None,
+        "scheduled_date": None,
+        "is_immediate": True,
+        "estimated_price": round(rng.uniform(500, 5000), 2),
+        "estimated_duration": rng.randint(30, 300),
+        "final_price": None,
+        "actual_duration": None,
+        "status": (ServiceStatus.ACCEPTED if accepted else ServiceStatus.PENDING).value,
+        "created_at": created_at,
+        "updated_at": created_at,
+        "started_at": None,
+        "completed_at": None,
+        "notes": "Cortar también el frente",
+        "client_rating": None,
+        "gardener_rating": None,
+        "client_review": None,
+        "gardener_review": None,
+    })
+
+
+def make_notification_doc(rng: random.Random) -> dict:
+    return {
+        "_id": uuid.UUID(int=rng.getrandbits(128)).hex[:24],
+        "notification_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "user_id": str(uuid.UUID(int=rng.getrandbits(128))),
+        "type": NotificationType.NEW_SERVICE_AVAILABLE.value,
+        "title": "¡Nuevo trabajo disponible!",
+        "message": "Nuevo servicio de grass_cutting en Av. Corrientes 1234",
+        "data": {"service_id": str(uuid.UUID(int=rng.getrandbits(128)))},
+        "read": rng.random() < 0.3,
+        "created_at": datetime(2024, 1, 1) + timedelta(minutes=rng.randint(0, 500_000)),
+    }
+
+
+def build_cases() -> dict:
+    rng = random.Random(SEED)
+    service_docs = [make_service_doc(rng) for _ in range(64)]
+    notification_docs = [make_notification_doc(rng) for _ in range(64)]
+    phones = [f"+549{rng.randint(1000000000, 9999999999)}" for _ in range(32)] + ["1234", "+0123"]
+    user = {"user_id": str(uuid.UUID(int=rng.getrandbits(128))), "role": "client", "full_name": "María González"}
+    token = create_access_token({"sub": user["user_id"]})
+    credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+    db = _DatabaseStandIn(user)
+    price_inputs = [
+        (rng.choice(list(ServiceType)), rng.uniform(5, 40), rng.uniform(5, 40), rng.choice(list(PruningDifficulty)))
+        for _ in range(64)
+    ]
+
+    def cycle(items):
+        index = 0
+        size = len(items)
+
+        def next_item():
+            nonlocal index
+            index = (index + 1) % size
+            return items[index]
+        return next_item
+
+    next_service, next_notification = cycle(service_docs), cycle(notification_docs)
+    next_phone, next_price = cycle(phones), cycle(price_inputs)
+
+    return {
+        "calculate_service_price": lambda: calculate_service_price(*next_price()),
+        "create_access_token": lambda: create_access_token({"sub": user["user_id"]}),
+        "get_current_user (jwt decode)": lambda: get_current_user(credentials, db),
+        "ServiceResponse(expand(doc))": lambda: ServiceResponse(**expand_service(next_service())),
+        "Notification(**doc)": lambda: Notification(**next_notification()),
+        "validate_phone_number": lambda: validate_phone_number(next_phone()),
+    }
+
+
+def measure(func, repeat: int, min_time: float) -> float:
+    """Mejor tiempo por llamada, en microsegundos"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(number, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Microbenchmarks de funciones calientes de server.py")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Segundos mínimos por repetición")
+    parser.add_argument("--filter", default=None, help="Solo casos que contengan este texto")
+    parser.add_argument("--save-baseline", default=None)
+    parser.add_argument("--baseline", default=None)
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="Porcentaje máximo de empeoramiento respecto de la línea base")
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in build_cases().items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = measure(func, args.repeat, args.min_time)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    failed = False
+    print(f"{'caso':<32} {'µs/llamada':>11} {'base':>9} {'Δ':>8}")
+    for name, value in results.items():
+        line = f"{name:<32} {value:>11.2f}"
+        if name in baseline:
+            delta = (value / baseline[name] - 1) * 100
+            regressed = delta > args.max_regression
+            failed = failed or regressed
+            line += f" {baseline[name]:>9.2f} {delta:>+7.1f}%{'  ❌' if regressed else ''}"
+        print(line)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nLínea base guardada en {args.save_baseline}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+"""Tiempo de importación de ``server`` y de ``create_app()``.
+
+Cada medición corre en un proceso nuevo para que no influyan módulos ya
+cargados. Con ``--max-ms`` termina con error si la mediana supera el límite,
+así puede usarse como chequeo en CI.
+
+Uso (desde backend/):
+    python -m benchmarks.import_time --runs 5 --max-ms 1500
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MEASURE_SNIPPET = """
+import time
+started = time.perf_counter()
+import server
+imported = time.perf_counter()
+server.create_app()
+created = time.perf_counter()
+print((imported - started) * 1000, (created - imported) * 1000)
+"""
+
+
+def measure_once() -> tuple:
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE_SNIPPET],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout.split()
+    return float(output[0]), float(output[1])
+
+
+def slowest_imports(limit: int = 10) -> list:
+    """Módulos con mayor tiempo acumulado según ``python -X importtime``"""
+    stderr = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import server"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = [part.strip() for part in line[len("import time:"):].split("|")]
+        rows.append((int(cumulative), module))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque de PASTO! API")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Falla si la mediana de import + create_app supera este valor")
+    args = parser.parse_args()
+
+    samples = [measure_once() for _ in range(args.runs)]
+    import_ms = statistics.median(sample[0] for sample in samples)
+    create_ms = statistics.median(sample[1] for sample in samples)
+    total_ms = import_ms + create_ms
+
+    print(f"import server:  {import_ms:8.1f} ms")
+    print(f"create_app():   {create_ms:8.1f} ms")
+    print(f"total:          {total_ms:8.1f} ms")
+    print("\nMódulos más lentos (acumulado):")
+    for cumulative_us, module in slowest_imports():
+        print(f"  {cumulative_us / 1000:8.1f} ms  {module}")
+
+    if args.max_ms is not None and total_ms > args.max_ms:
+        print(f"\n❌ El arranque supera el límite de {args.max_ms:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
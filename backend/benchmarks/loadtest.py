@@ -0,0 +1,254 @@
+"""Prueba de carga local con escenarios mixtos.
+
+Usuarios virtuales concurrentes, con un cliente HTTP asíncrono:
+    - clientes que solicitan servicios y consultan sus solicitudes
+    - jardineros que consultan /api/services/available, aceptan y avanzan estados
+    - usuarios que consultan notificaciones periódicamente
+
+Se reporta throughput, p50/p95/p99 y tasa de error por endpoint. Los
+resultados pueden guardarse como línea base y compararse en corridas
+posteriores.
+
+Uso (desde backend/, con un mongod local):
+    python -m benchmarks.loadtest --in-process --mongo-url mongodb://localhost:27017/ --duration 30
+    python -m benchmarks.loadtest --base-url http://localhost:8001 --clients 50 --gardeners 20
+    python -m benchmarks.loadtest --in-process --save-baseline baseline.json
+    python -m benchmarks.loadtest --in-process --compare baseline.json --max-regression 15
+
+Contra un servidor externo, levantarlo con RATE_LIMIT_ENABLED=false para que
+el registro de usuarios de prueba no sea limitado.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import defaultdict
+
+import httpx
+
+SERVICE_TYPES = ["grass_cutting", "pruning", "cleaning", "maintenance"]
+STATUS_FLOW = ["on_way", "in_progress", "completed"]
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint: str, elapsed: float, ok: bool):
+        self.latencies[endpoint].append(elapsed)
+        if not ok:
+            self.errors[endpoint] += 1
+
+    def summary(self, duration: float) -> dict:
+        endpoints = {}
+        for endpoint, samples in sorted(self.latencies.items()):
+            ordered = sorted(samples)
+            endpoints[endpoint] = {
+                "requests": len(ordered),
+                "rps": len(ordered) / duration,
+                "p50_ms": percentile(ordered, 50) * 1000,
+                "p95_ms": percentile(ordered, 95) * 1000,
+                "p99_ms": percentile(ordered, 99) * 1000,
+                "error_rate": self.errors[endpoint] / len(ordered),
+            }
+        total = sum(len(samples) for samples in self.latencies.values())
+        return {
+            "duration_s": duration,
+            "requests": total,
+            "rps": total / duration,
+            "error_rate": sum(self.errors.values()) / total if total else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+def percentile(ordered: list, pct: float) -> float:
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class LoadTest:
+    def __init__(self, http: httpx.AsyncClient, args):
+        self.http = http
+        self.args = args
+        self.stats = Stats()
+        self.random = random.Random(args.seed)
+        self.deadline = 0.0
+
+    async def call(self, endpoint: str, method: str, path: str, token: str = None,
+                   expected=(200,), **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        started = time.perf_counter()
+        try:
+            response = await self.http.request(method, path, headers=headers, **kwargs)
+            ok = response.status_code in expected
+        except httpx.HTTPError:
+            response, ok = None, False
+        self.stats.record(endpoint, time.perf_counter() - started, ok)
+        return response if ok else None
+
+    async def register(self, role: str) -> str:
+        response = await self.http.post("/api/auth/register", json={
+            "email": f"load_{role}_{uuid.uuid4().hex[:12]}@example.com",
+            "password": "LoadTest123!",
+            "full_name": f"Load {role}",
+            "role": role,
+        })
+        response.raise_for_status()
+        return response.json()["access_token"]
+
+    async def think(self):
+        await asyncio.sleep(self.random.uniform(0, self.args.think_time * 2))
+
+    def running(self) -> bool:
+        return time.monotonic() < self.deadline
+
+    async def client_user(self, token: str):
+        while self.running():
+            width, length = self.random.uniform(5, 40), self.random.uniform(5, 40)
+            await self.call("POST /api/services/request", "POST", "/api/services/request", token, json={
+                "service_type": self.random.choice(SERVICE_TYPES),
+                "address": f"Calle {self.random.randint(1, 5000)}, Buenos Aires",
+                "latitude": -34.6 + self.random.uniform(-0.2, 0.2),
+                "longitude": -58.4 + self.random.uniform(-0.2, 0.2),
+                "terrain_width": round(width, 1),
+                "terrain_length": round(length, 1),
+                "is_immediate": True,
+                "notes": "Prueba de carga",
+            })
+            await self.think()
+            await self.call("GET /api/services/my-requests", "GET", "/api/services/my-requests", token)
+            await self.think()
+
+    async def gardener_user(self, token: str):
+        while self.running():
+            response = await self.call("GET /api/services/available", "GET", "/api/services/available", token)
+            if response is not None and response.json() and self.random.random() < self.args.accept_ratio:
+                service = self.random.choice(response.json()[:5])
+                # Otro jardinero puede haberlo aceptado antes: 400 es un resultado esperado
+                accepted = await self.call("POST /api/services/{id}/accept", "POST",
+                                           f"/api/services/{service['service_id']}/accept", token,
+                                           expected=(200, 400))
+                if accepted is not None and accepted.status_code == 200:
+                    for next_status in STATUS_FLOW:
+                        await self.call("POST /api/services/{id}/update-status", "POST",
+                                        f"/api/services/{service['service_id']}/update-status", token,
+                                        json={"status": next_status})
+                await self.call("GET /api/services/my-jobs", "GET", "/api/services/my-jobs", token)
+            await self.think()
+
+    async def notification_poller(self, token: str):
+        while self.running():
+            await self.call("GET /api/notifications", "GET", "/api/notifications", token)
+            await asyncio.sleep(self.args.poll_interval)
+
+    async def run(self) -> dict:
+        args = self.args
+        client_tokens = [await self.register("client") for _ in range(args.clients)]
+        gardener_tokens = [await self.register("gardener") for _ in range(args.gardeners)]
+
+        users = [self.client_user(token) for token in client_tokens]
+        users += [self.gardener_user(token) for token in gardener_tokens]
+        poller_tokens = (client_tokens + gardener_tokens)[:args.pollers]
+        users += [self.notification_poller(token) for token in poller_tokens]
+
+        started = time.monotonic()
+        self.deadline = started + args.duration
+        await asyncio.gather(*users)
+        return self.stats.summary(time.monotonic() - started)
+
+
+def print_summary(summary: dict):
+    print(f"\n{'endpoint':<40} {'req':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'error':>7}")
+    for endpoint, row in summary["endpoints"].items():
+        print(f"{endpoint:<40} {row['requests']:>7} {row['rps']:>8.1f} {row['p50_ms']:>8.1f} "
+              f"{row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} {row['error_rate']:>6.1%}")
+    print(f"\nTotal: {summary['requests']} solicitudes, {summary['rps']:.1f} req/s, "
+          f"error {summary['error_rate']:.2%}")
+
+
+def compare(summary: dict, baseline: dict, max_regression: float) -> bool:
+    """Comparar contra la línea base; False si algún endpoint empeoró más de lo permitido"""
+    ok = True
+    print(f"\n{'endpoint':<40} {'p95 base':>9} {'p95 act':>9} {'Δ p95':>8} {'Δ req/s':>8}")
+    for endpoint, row in summary["endpoints"].items():
+        base = baseline["endpoints"].get(endpoint)
+        if not base:
+            continue
+        p95_delta = (row["p95_ms"] / base["p95_ms"] - 1) * 100 if base["p95_ms"] else 0.0
+        rps_delta = (row["rps"] / base["rps"] - 1) * 100 if base["rps"] else 0.0
+        regressed = p95_delta > max_regression
+        ok = ok and not regressed
+        print(f"{endpoint:<40} {base['p95_ms']:>9.1f} {row['p95_ms']:>9.1f} {p95_delta:>+7.1f}% "
+              f"{rps_delta:>+7.1f}%{'  ❌' if regressed else ''}")
+    return ok
+
+
+async def main_async(args) -> dict:
+    limits = httpx.Limits(max_connections=args.max_connections)
+    timeout = httpx.Timeout(args.timeout)
+    if args.in_process:
+        from config import Settings
+        from server import create_app
+        settings = Settings.from_env().model_copy(update={"rate_limit_enabled": False})
+        if args.mongo_url:
+            settings = settings.model_copy(update={"mongo_url": args.mongo_url})
+        if args.db_name:
+            settings = settings.model_copy(update={"db_name": args.db_name})
+        app = create_app(settings)
+        transport = httpx.ASGITransport(app=app)
+        # ASGITransport no corre el lifespan: sin él no hay índices, cola de
+        # trabajos (notificaciones) ni tareas de fondo. Al salir cierra deps.
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://loadtest", timeout=timeout) as http:
+                return await LoadTest(http, args).run()
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits, timeout=timeout) as http:
+        return await LoadTest(http, args).run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prueba de carga local de PASTO! API")
+    target = parser.add_mutually_exclusive_group()
+    target.add_argument("--in-process", action="store_true", help="Correr la app dentro de este proceso")
+    target.add_argument("--base-url", default="http://localhost:8001")
+    parser.add_argument("--mongo-url", default=None, help="Mongo para el modo en proceso")
+    parser.add_argument("--db-name", default="pasto_loadtest", help="Base para el modo en proceso")
+    parser.add_argument("--clients", type=int, default=20)
+    parser.add_argument("--gardeners", type=int, default=10)
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--think-time", type=float, default=0.2)
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--accept-ratio", type=float, default=0.3)
+    parser.add_argument("--max-connections", type=int, default=100)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--save-baseline", default=None, help="Guardar resultados como línea base (JSON)")
+    parser.add_argument("--compare", default=None, help="Línea base (JSON) contra la que comparar")
+    parser.add_argument("--max-regression", type=float, default=20.0,
+                        help="Empeoramiento máximo permitido del p95, en porcentaje")
+    args = parser.parse_args()
+
+    summary = asyncio.run(main_async(args))
+    print_summary(summary)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(summary, f, indent=2)
+        print(f"\nLínea base guardada en {args.save_baseline}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if not compare(summary, baseline, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Costo del middleware de métricas por solicitud.
+
+Corre la app en proceso (sin red) con métricas activadas y desactivadas y
+compara la latencia media de un endpoint. La diferencia es lo que agrega la
+instrumentación en el camino caliente.
+
+Uso (desde backend/):
+    python -m benchmarks.metrics_overhead --requests 5000
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+from config import Settings
+from server import create_app
+
+
+async def mean_latency(metrics_enabled: bool, path: str, requests: int, rounds: int) -> float:
+    app = create_app(Settings(metrics_enabled=metrics_enabled))
+    transport = httpx.ASGITransport(app=app)
+    samples = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        for _ in range(100):
+            await http.get(path)
+        for _ in range(rounds):
+            started = time.perf_counter()
+            for _ in range(requests):
+                await http.get(path)
+            samples.append((time.perf_counter() - started) / requests)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Overhead del middleware de métricas")
+    parser.add_argument("--path", default="/api/health")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--max-overhead", type=float, default=None,
+                        help="Falla si el overhead relativo supera este porcentaje")
+    args = parser.parse_args()
+
+    baseline = asyncio.run(mean_latency(False, args.path, args.requests, args.rounds))
+    instrumented = asyncio.run(mean_latency(True, args.path, args.requests, args.rounds))
+    overhead_us = (instrumented - baseline) * 1e6
+    overhead_pct = (instrumented / baseline - 1) * 100
+
+    print(f"sin métricas:  {baseline * 1e6:8.1f} µs/solicitud")
+    print(f"con métricas:  {instrumented * 1e6:8.1f} µs/solicitud")
+    print(f"overhead:      {overhead_us:8.1f} µs ({overhead_pct:+.2f}%)")
+
+    if args.max_overhead is not None and overhead_pct > args.max_overhead:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Lecturas en secundarios y leer lo propio, contra un replica set local.
+
+Corre la app en proceso con SECONDARY_READS_ENABLED sobre una base
+temporal. En cada ronda un cliente crea una solicitud y consulta "mis
+solicitudes" enseguida, y un jardinero la acepta y consulta "mis trabajos".
+Cada respuesta debe incluir el servicio recién escrito (sesión causal). Un
+CommandListener cuenta qué nodo atendió cada lectura de ``services`` para
+confirmar que los historiales van a los secundarios.
+
+Replica set local de tres miembros:
+    for port in 27017 27018 27019; do
+        mkdir -p /tmp/rs/$port
+        mongod --replSet rs0 --port $port --dbpath /tmp/rs/$port --bind_ip localhost --fork --logpath /tmp/rs/$port.log
+    done
+    mongosh --port 27017 --eval 'rs.initiate({_id: "rs0", members: [
+        {_id: 0, host: "localhost:27017"}, {_id: 1, host: "localhost:27018"}, {_id: 2, host: "localhost:27019"}]})'
+
+Uso (desde backend/):
+    python -m benchmarks.read_scaling
+    python -m benchmarks.read_scaling --mongo-url "mongodb://localhost:27017/?replicaSet=rs0" --rounds 200
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+import uuid
+from collections import Counter
+
+import httpx
+from pymongo import MongoClient, monitoring
+
+from config import Settings
+from server import create_app
+
+DEFAULT_URL = "mongodb://localhost:27017,localhost:27018,localhost:27019/?replicaSet=rs0"
+
+
+class ReadCounter(monitoring.CommandListener):
+    """Lecturas de services por nodo (host:puerto)"""
+
+    def __init__(self):
+        self.reads = Counter()
+
+    def started(self, event):
+        if event.command_name in ("find", "aggregate") and event.command.get(event.command_name) == "services":
+            self.reads["%s:%s" % event.connection_id] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def register(http: httpx.AsyncClient, role: str) -> dict:
+    response = await http.post("/api/auth/register", json={
+        "email": f"rs_{role}_{uuid.uuid4().hex[:12]}@example.com",
+        "password": "ReadScaling123!",
+        "full_name": f"Read scaling {role}",
+        "role": role,
+    })
+    response.raise_for_status()
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+async def run(app, rounds: int) -> dict:
+    transport = httpx.ASGITransport(app=app)
+    misses = Counter()
+    latencies = {"my-requests": [], "my-jobs": []}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as http:
+        client, gardener = await register(http, "client"), await register(http, "gardener")
+        for index in range(rounds):
+            created = await http.post("/api/services/request", headers=client, json={
+                "service_type": "grass_cutting",
+                "address": f"Calle {index}, Buenos Aires",
+                "latitude": -34.6,
+                "longitude": -58.4,
+                "terrain_width": 10,
+                "terrain_length": 10,
+                "is_immediate": True,
+            })
+            created.raise_for_status()
+            service_id = created.json()["service_id"]
+
+            started = time.perf_counter()
+            listed = await http.get("/api/services/my-requests", headers=client)
+            latencies["my-requests"].append(time.perf_counter() - started)
+            if service_id not in {service["service_id"] for service in listed.json()}:
+                misses["my-requests"] += 1
+
+            (await http.post(f"/api/services/{service_id}/accept", headers=gardener)).raise_for_status()
+            started = time.perf_counter()
+            listed = await http.get("/api/services/my-jobs", headers=gardener)
+            latencies["my-jobs"].append(time.perf_counter() - started)
+            if service_id not in {service["service_id"] for service in listed.json()}:
+                misses["my-jobs"] += 1
+    return {"misses": misses, "latencies": latencies}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lecturas en secundarios con sesiones causales")
+    parser.add_argument("--mongo-url", default=DEFAULT_URL)
+    parser.add_argument("--rounds", type=int, default=50)
+    parser.add_argument("--max-staleness", type=int, default=90)
+    args = parser.parse_args()
+
+    counter = ReadCounter()
+    mongo = MongoClient(args.mongo_url, event_listeners=[counter])
+    primary = "%s:%s" % mongo.primary
+    db_name = f"read_scaling_{uuid.uuid4().hex[:8]}"
+    settings = Settings(
+        mongo_url=args.mongo_url,
+        db_name=db_name,
+        secondary_reads_enabled=True,
+        read_max_staleness_seconds=args.max_staleness,
+        background_jobs_enabled=False,
+        rate_limit_enabled=False,
+        metrics_enabled=False,
+        slow_query_ms=0,
+    )
+    try:
+        result = asyncio.run(run(create_app(settings, db=mongo[db_name]), args.rounds))
+    finally:
+        mongo.drop_database(db_name)
+        mongo.close()
+
+    print(f"primario: {primary}")
+    print("lecturas de services por nodo:")
+    for node, count in sorted(counter.reads.items()):
+        print(f"  {node:<22} {count:>6}{'  (primario)' if node == primary else ''}")
+    for endpoint, samples in result["latencies"].items():
+        print(f"{endpoint:<12} mediana {statistics.median(samples) * 1000:7.2f} ms  "
+              f"sin lo propio: {result['misses'][endpoint]}/{args.rounds}")
+
+    return 1 if sum(result["misses"].values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,62 @@
+"""Tiempo de planificar una ruta diaria con routing.plan_route.
+
+Genera paradas al azar (semilla fija) dentro de un radio de ~15 km de
+Buenos Aires y mide el mejor tiempo de matriz + vecino más cercano + 2-opt,
+junto con cuánto acorta 2-opt el recorrido inicial.
+
+Uso (desde backend/):
+    python -m benchmarks.route_planning
+    python -m benchmarks.route_planning --stops 10,30,60 --max-ms 10
+"""
+import argparse
+import random
+import sys
+from datetime import datetime
+
+from benchmarks.hotpaths import SEED, measure
+from routing import plan_route
+
+
+def make_stops(rng: random.Random, count: int) -> list:
+    return [
+        {
+            "service_id": f"bench-{index}",
+            "latitude": -34.6 + rng.uniform(-0.13, 0.13),
+            "longitude": -58.4 + rng.uniform(-0.16, 0.16),
+            "estimated_duration": rng.randint(30, 180),
+            "scheduled_date": None,
+        }
+        for index in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de planificación de rutas")
+    parser.add_argument("--stops", default="10,30,60")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.2, help="Segundos mínimos por repetición")
+    parser.add_argument("--max-ms", type=float, default=None,
+                        help="Fallar si 30 paradas (o el caso más chico) tarda más que esto")
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    start_time = datetime(2024, 1, 1, 8)
+    print(f"{'paradas':>8} {'ms':>9} {'km vecino':>10} {'km 2-opt':>9} {'mejora':>7}")
+    failed = False
+    for count in (int(value) for value in args.stops.split(",")):
+        stops = make_stops(rng, count)
+        start = (-34.6, -58.4)
+        elapsed_ms = measure(lambda: plan_route(stops, start=start, start_time=start_time),
+                             args.repeat, args.min_time) / 1000
+        route = plan_route(stops, start=start, start_time=start_time)
+        gain = (1 - route["total_km"] / route["nearest_neighbour_km"]) * 100 if route["nearest_neighbour_km"] else 0
+        print(f"{count:>8} {elapsed_ms:>9.2f} {route['nearest_neighbour_km']:>10.1f} "
+              f"{route['total_km']:>9.1f} {gain:>6.1f}%")
+        if args.max_ms is not None and count == 30 and elapsed_ms > args.max_ms:
+            failed = True
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
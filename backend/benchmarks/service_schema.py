@@ -0,0 +1,54 @@
+"""Tamaño de los documentos de servicios: esquema anterior vs compacto.
+
+Genera servicios con la forma real (semilla fija) y compara el tamaño BSON
+de cada uno en el esquema anterior (todos los campos, nulos explícitos) y
+en el compacto de ``servicedocs``, y el costo de ``expand_service`` al leer.
+Con ``--mongo-url`` además imprime el reporte de la base (tamaño medio,
+índices, aciertos de cache) y el de la última migración.
+
+Uso (desde backend/):
+    python -m benchmarks.service_schema
+    python -m benchmarks.service_schema --mongo-url mongodb://localhost:27017/ --db-name pasto_db
+"""
+import argparse
+import random
+import sys
+
+import bson
+
+from benchmarks.hotpaths import SEED, make_service_doc, measure
+from servicedocs import MIGRATION_ID, MIGRATIONS_COLLECTION, expand_service, storage_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Tamaño del esquema de servicios")
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--min-time", type=float, default=0.1, help="Segundos mínimos por repetición")
+    parser.add_argument("--mongo-url", default=None)
+    parser.add_argument("--db-name", default="pasto_db")
+    args = parser.parse_args()
+
+    rng = random.Random(SEED)
+    compact = [make_service_doc(rng) for _ in range(args.count)]
+    legacy = [{**expand_service(doc), "released": True} for doc in compact]
+    legacy_bytes = sum(len(bson.encode(doc)) for doc in legacy) / len(legacy)
+    compact_bytes = sum(len(bson.encode(doc)) for doc in compact) / len(compact)
+
+    print(f"{'esquema':<10} {'bytes/doc':>10} {'campos/doc':>11}")
+    print(f"{'anterior':<10} {legacy_bytes:>10.0f} {sum(map(len, legacy)) / len(legacy):>11.1f}")
+    print(f"{'compacto':<10} {compact_bytes:>10.0f} {sum(map(len, compact)) / len(compact):>11.1f}")
+    print(f"ahorro: {(1 - compact_bytes / legacy_bytes) * 100:.1f}%")
+    print(f"expand_service: {measure(lambda: expand_service(compact[0]), args.repeat, args.min_time):.2f} µs/doc")
+
+    if args.mongo_url:
+        from pymongo import MongoClient
+        db = MongoClient(args.mongo_url)[args.db_name]
+        for name in ("services", "services_archive"):
+            print(storage_report(db, name))
+        print(db[MIGRATIONS_COLLECTION].find_one({"_id": MIGRATION_ID}, {"_id": 0}))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
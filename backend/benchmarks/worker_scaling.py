@@ -0,0 +1,97 @@
+"""Benchmark de throughput de 1 a N workers.
+
+Levanta ``launcher.py`` con 1, 2, ... N workers, espera a que /api/health
+responda y mide requests por segundo con un cliente HTTP asíncrono.
+
+Uso (desde backend/):
+    python -m benchmarks.worker_scaling --max-workers 8 --duration 10
+    python -m benchmarks.worker_scaling --path /api/services/available --token <JWT>
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(workers: int, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [sys.executable, "launcher.py", "--workers", str(workers), "--port", str(port),
+         "--host", "127.0.0.1"],
+        cwd=BACKEND_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+
+
+def wait_until_ready(base_url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{base_url}/api/health", timeout=1.0).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("El servidor no respondió a tiempo")
+
+
+async def drive_load(base_url: str, path: str, token: str, concurrency: int, duration: float) -> dict:
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    completed = 0
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async with httpx.AsyncClient(base_url=base_url, headers=headers, limits=limits) as http:
+        async def worker():
+            nonlocal completed, errors
+            while time.monotonic() < deadline:
+                try:
+                    response = await http.get(path)
+                    if response.status_code >= 400:
+                        errors += 1
+                except httpx.HTTPError:
+                    errors += 1
+                completed += 1
+
+        started = time.monotonic()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    return {"requests": completed, "errors": errors, "rps": completed / elapsed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de PASTO! API según cantidad de workers")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--port", type=int, default=8101)
+    parser.add_argument("--path", default="/api/health")
+    parser.add_argument("--token", default=None)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+
+    base_url = f"http://127.0.0.1:{args.port}"
+    baseline = None
+    print(f"{'workers':>8} {'req/s':>10} {'speedup':>8} {'errores':>8}")
+    for workers in range(1, args.max_workers + 1):
+        process = start_server(workers, args.port)
+        try:
+            wait_until_ready(base_url)
+            result = asyncio.run(drive_load(base_url, args.path, args.token, args.concurrency, args.duration))
+        finally:
+            process.terminate()
+            process.wait()
+        baseline = baseline or result["rps"]
+        print(f"{workers:>8} {result['rps']:>10.1f} {result['rps'] / baseline:>7.2f}x {result['errors']:>8}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+"""Configuración de PASTO! API"""
+import os
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class Settings(BaseModel):
+    mongo_url: str = 'mongodb://localhost:27017/'
+    db_name: str = 'pasto_db'
+    google_client_id: Optional[str] = None
+    google_client_secret: Optional[str] = None
+    google_metadata_url: str = 'https://accounts.google.com/.well-known/openid-configuration'
+    # Discovery y JWKS se renuevan en segundo plano; Cache-Control puede acortar el plazo
+    google_keys_refresh_seconds: int = 3600
+    twilio_account_sid: Optional[str] = None
+    twilio_auth_token: Optional[str] = None
+    twilio_verify_service_sid: Optional[str] = None
+    sms_timeout_seconds: float = 5.0
+    # Fallos seguidos del proveedor que abren el circuito, y cuánto queda abierto
+    sms_breaker_failures: int = 5
+    sms_breaker_reset_seconds: float = 30.0
+    upload_dir: str = 'uploads'
+    phone_verification_ttl_seconds: int = 600
+    phone_verification_max_attempts: int = 5
+    metrics_enabled: bool = True
+    compression_enabled: bool = True
+    # Cuerpos más chicos se envían sin comprimir (ver benchmarks/encodings.py)
+    compression_min_bytes: int = 1024
+    # Umbral del registro de consultas lentas; 0 lo desactiva
+    slow_query_ms: float = 100
+    background_jobs_enabled: bool = True
+    notification_read_ttl_days: int = 30
+    notification_archive_days: int = 90
+    notification_archive_dir: str = 'archive/notifications'
+    notification_archive_batch_size: int = 1000
+    service_archive_days: int = 30
+    # Servicios programados: aparecen en "available" y se recuerdan con esta anticipación
+    schedule_release_lead_minutes: int = 120
+    schedule_reminder_lead_minutes: int = 60
+    scheduler_horizon_hours: int = 24
+    scheduler_refresh_seconds: int = 60
+    heatmap_cache_seconds: int = 30
+    heatmap_recent_days: int = 7
+    service_archive_batch_size: int = 500
+    retention_interval_seconds: int = 3600
+    stats_reconcile_interval_seconds: int = 86400
+    idempotency_ttl_seconds: int = 86400
+    # Workers de asyncio de la cola de trabajos por proceso; 0 solo encola
+    job_workers: int = 2
+    job_max_attempts: int = 5
+    job_retry_backoff_seconds: float = 2.0
+    # Listados de admin, historiales, búsqueda y estadísticas en secundarios
+    secondary_reads_enabled: bool = False
+    # Atraso máximo aceptado de un secundario (MongoDB exige al menos 90)
+    read_max_staleness_seconds: int = 90
+    # Borrado de usuarios en segundo plano: lotes por ejecución y pausa entre ejecuciones
+    user_deletion_batch_size: int = 500
+    user_deletion_batches_per_run: int = 10
+    user_deletion_pause_seconds: float = 2.0
+    rate_limit_enabled: bool = True
+    # "memory" (por proceso) o "mongo" (compartido entre workers)
+    rate_limit_backend: str = 'memory'
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        """Construir la configuración a partir de variables de entorno"""
+        return cls(
+            mongo_url=os.environ.get('MONGO_URL', 'mongodb://localhost:27017/'),
+            db_name=os.environ.get('MONGO_DB_NAME', 'pasto_db'),
+            google_client_id=os.environ.get('GOOGLE_CLIENT_ID'),
+            google_client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'),
+            google_metadata_url=os.environ.get(
+                'GOOGLE_METADATA_URL', 'https://accounts.google.com/.well-known/openid-configuration'),
+            google_keys_refresh_seconds=int(os.environ.get('GOOGLE_KEYS_REFRESH_SECONDS', 3600)),
+            twilio_account_sid=os.environ.get('TWILIO_ACCOUNT_SID'),
+            twilio_auth_token=os.environ.get('TWILIO_AUTH_TOKEN'),
+            twilio_verify_service_sid=os.environ.get('TWILIO_VERIFY_SERVICE_SID'),
+            sms_timeout_seconds=float(os.environ.get('SMS_TIMEOUT_SECONDS', 5.0)),
+            sms_breaker_failures=int(os.environ.get('SMS_BREAKER_FAILURES', 5)),
+            sms_breaker_reset_seconds=float(os.environ.get('SMS_BREAKER_RESET_SECONDS', 30.0)),
+            upload_dir=os.environ.get('UPLOAD_DIR', 'uploads'),
+            phone_verification_ttl_seconds=int(os.environ.get('PHONE_VERIFICATION_TTL_SECONDS', 600)),
+            phone_verification_max_attempts=int(os.environ.get('PHONE_VERIFICATION_MAX_ATTEMPTS', 5)),
+            metrics_enabled=os.environ.get('METRICS_ENABLED', 'true').lower() != 'false',
+            compression_enabled=os.environ.get('COMPRESSION_ENABLED', 'true').lower() != 'false',
+            compression_min_bytes=int(os.environ.get('COMPRESSION_MIN_BYTES', 1024)),
+            slow_query_ms=float(os.environ.get('SLOW_QUERY_MS', 100)),
+            background_jobs_enabled=os.environ.get('BACKGROUND_JOBS_ENABLED', 'true').lower() != 'false',
+            notification_read_ttl_days=int(os.environ.get('NOTIFICATION_READ_TTL_DAYS', 30)),
+            notification_archive_days=int(os.environ.get('NOTIFICATION_ARCHIVE_DAYS', 90)),
+            notification_archive_dir=os.environ.get('NOTIFICATION_ARCHIVE_DIR', 'archive/notifications'),
+            notification_archive_batch_size=int(os.environ.get('NOTIFICATION_ARCHIVE_BATCH_SIZE', 1000)),
+            service_archive_days=int(os.environ.get('SERVICE_ARCHIVE_DAYS', 30)),
+            schedule_release_lead_minutes=int(os.environ.get('SCHEDULE_RELEASE_LEAD_MINUTES', 120)),
+            schedule_reminder_lead_minutes=int(os.environ.get('SCHEDULE_REMINDER_LEAD_MINUTES', 60)),
+            scheduler_horizon_hours=int(os.environ.get('SCHEDULER_HORIZON_HOURS', 24)),
+            scheduler_refresh_seconds=int(os.environ.get('SCHEDULER_REFRESH_SECONDS', 60)),
+            heatmap_cache_seconds=int(os.environ.get('HEATMAP_CACHE_SECONDS', 30)),
+            heatmap_recent_days=int(os.environ.get('HEATMAP_RECENT_DAYS', 7)),
+            service_archive_batch_size=int(os.environ.get('SERVICE_ARCHIVE_BATCH_SIZE', 500)),
+            retention_interval_seconds=int(os.environ.get('RETENTION_INTERVAL_SECONDS', 3600)),
+            stats_reconcile_interval_seconds=int(os.environ.get('STATS_RECONCILE_INTERVAL_SECONDS', 86400)),
+            idempotency_ttl_seconds=int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400)),
+            job_workers=int(os.environ.get('JOB_WORKERS', 2)),
+            job_max_attempts=int(os.environ.get('JOB_MAX_ATTEMPTS', 5)),
+            job_retry_backoff_seconds=float(os.environ.get('JOB_RETRY_BACKOFF_SECONDS', 2.0)),
+            secondary_reads_enabled=os.environ.get('SECONDARY_READS_ENABLED', 'false').lower() == 'true',
+            read_max_staleness_seconds=int(os.environ.get('READ_MAX_STALENESS_SECONDS', 90)),
+            user_deletion_batch_size=int(os.environ.get('USER_DELETION_BATCH_SIZE', 500)),
+            user_deletion_batches_per_run=int(os.environ.get('USER_DELETION_BATCHES_PER_RUN', 10)),
+            user_deletion_pause_seconds=float(os.environ.get('USER_DELETION_PAUSE_SECONDS', 2.0)),
+            rate_limit_enabled=os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() != 'false',
+            rate_limit_backend=os.environ.get('RATE_LIMIT_BACKEND', 'memory'),
+        )
@@ -0,0 +1,293 @@
+"""Dependencias de la aplicación con inicialización diferida.
+
+Nada se conecta al importar: el cliente de Mongo, el proveedor OpenID de
+Google y el proveedor de SMS se crean la primera vez que se usan, dentro del
+proceso worker.
+Cualquiera de ellos puede inyectarse ya construido (tests, benchmarks).
+"""
+import os
+import threading
+import time
+
+from fastapi import Request
+
+from config import Settings
+from maintenance import BackgroundJobs, LeaseLock
+from metrics import MetricsRegistry, MongoCommandMetrics, MongoPoolMetrics
+from slowlog import SlowQueryLog
+from ratelimit import InMemoryBackend, MongoBackend, RateLimiter
+from retention import ensure_notification_indexes
+from archival import ensure_service_indexes
+from rollups import ensure_rollup_indexes
+from idempotency import ensure_idempotency_indexes
+from jobqueue import JobQueue, ensure_job_indexes
+from search import ensure_search_indexes
+from scheduler import ensure_scheduler_indexes
+from heatmap import HeatmapCache, ensure_heatmap_indexes
+from accounts import ensure_account_indexes
+from readrouting import ReadRouter
+from oidc import OpenIDProvider
+from sms import CircuitBreaker, FakeSmsProvider, TwilioVerifyProvider
+from verification import MongoVerificationStore, ensure_verification_indexes
+
+
+class LocalStorage:
+    """Almacenamiento de archivos subidos en disco local"""
+
+    def __init__(self, directory: str, url_prefix: str = "/uploads"):
+        self.directory = directory
+        self.url_prefix = url_prefix
+
+    def save(self, filename: str, content: bytes) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, filename), "wb") as buffer:
+            buffer.write(content)
+        return f"{self.url_prefix}/{filename}"
+
+    def delete_prefix(self, prefix: str, limit: int = 500) -> int:
+        """Borrar hasta ``limit`` archivos cuyo nombre empieza con ``prefix``"""
+        if not os.path.isdir(self.directory):
+            return 0
+        deleted = 0
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if deleted >= limit:
+                    break
+                if entry.name.startswith(prefix) and entry.is_file():
+                    os.remove(entry.path)
+                    deleted += 1
+        return deleted
+
+
+class AppDependencies:
+    def __init__(self, settings: Settings, *, db=None, oidc=None, sms=None, storage=None,
+                 rate_limiter=None, verifications=None):
+        self.settings = settings
+        self._lock = threading.RLock()
+        self._client = None
+        self._db = db
+        self._oidc = oidc
+        self._sms = sms
+        self._storage = storage
+        self._rate_limiter = rate_limiter
+        self._verifications = verifications
+        self.metrics = MetricsRegistry()
+        self.slow_queries = SlowQueryLog(settings.slow_query_ms) if settings.slow_query_ms > 0 else None
+        self.metrics.add_collector(self._collect_rate_limits)
+        self.metrics.add_collector(self._collect_mongo_cache)
+        self.metrics.add_collector(self._collect_sms)
+        self.jobs = BackgroundJobs()
+        self.queue = JobQueue(
+            lambda: self.db.jobs,
+            self.metrics,
+            workers=settings.job_workers,
+            max_attempts=settings.job_max_attempts,
+            backoff_seconds=settings.job_retry_backoff_seconds
+        )
+        self.metrics.add_collector(self._collect_job_queue)
+        self.heatmap = HeatmapCache(settings.heatmap_cache_seconds, settings.heatmap_recent_days)
+        self.reads = ReadRouter(lambda: self.db, settings.secondary_reads_enabled, settings.read_max_staleness_seconds)
+
+    @property
+    def db(self):
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    from pymongo import MongoClient
+                    self._client = MongoClient(self.settings.mongo_url, event_listeners=self._mongo_listeners())
+                    self._db = self._client[self.settings.db_name]
+                    if self.slow_queries is not None:
+                        self.slow_queries.attach(self._client, self.settings.db_name)
+        return self._db
+
+    def _mongo_listeners(self) -> list:
+        listeners = []
+        if self.settings.metrics_enabled:
+            listeners += [MongoCommandMetrics(self.metrics), MongoPoolMetrics(self.metrics)]
+        if self.slow_queries is not None:
+            listeners.append(self.slow_queries)
+        return listeners
+
+    @property
+    def google_enabled(self) -> bool:
+        return self._oidc is not None or bool(self.settings.google_client_id)
+
+    @property
+    def oidc(self) -> OpenIDProvider:
+        """Verificación local de ID tokens de Google (metadatos y claves en memoria)"""
+        if self._oidc is None:
+            with self._lock:
+                if self._oidc is None:
+                    self._oidc = OpenIDProvider(
+                        self.settings.google_metadata_url,
+                        self.settings.google_client_id,
+                        self.settings.google_client_secret,
+                        refresh_seconds=self.settings.google_keys_refresh_seconds
+                    )
+        return self._oidc
+
+    @property
+    def sms(self):
+        """Proveedor de SMS: Twilio Verify si está configurado, si no el simulado"""
+        if self._sms is None:
+            with self._lock:
+                if self._sms is None:
+                    self._sms = self._create_sms_provider()
+        return self._sms
+
+    def _create_sms_provider(self):
+        settings = self.settings
+        if not (settings.twilio_account_sid and settings.twilio_auth_token and settings.twilio_verify_service_sid):
+            return FakeSmsProvider()
+        return TwilioVerifyProvider(
+            settings.twilio_account_sid,
+            settings.twilio_auth_token,
+            settings.twilio_verify_service_sid,
+            timeout_seconds=settings.sms_timeout_seconds,
+            breaker=CircuitBreaker(settings.sms_breaker_failures, settings.sms_breaker_reset_seconds)
+        )
+
+    @property
+    def storage(self) -> LocalStorage:
+        if self._storage is None:
+            self._storage = LocalStorage(self.settings.upload_dir)
+        return self._storage
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        if self._rate_limiter is None:
+            with self._lock:
+                if self._rate_limiter is None:
+                    if self.settings.rate_limit_backend == 'mongo':
+                        backend = MongoBackend(self.db.rate_limits)
+                    else:
+                        backend = InMemoryBackend()
+                    self._rate_limiter = RateLimiter(backend, enabled=self.settings.rate_limit_enabled)
+        return self._rate_limiter
+
+    @property
+    def verifications(self):
+        """Almacén de verificaciones de teléfono"""
+        if self._verifications is None:
+            with self._lock:
+                if self._verifications is None:
+                    self._verifications = MongoVerificationStore(
+                        self.db.phone_verifications,
+                        ttl_seconds=self.settings.phone_verification_ttl_seconds,
+                        max_attempts=self.settings.phone_verification_max_attempts
+                    )
+        return self._verifications
+
+    def _collect_rate_limits(self) -> list:
+        if self._rate_limiter is None:
+            return []
+        samples = []
+        for rule, counters in self._rate_limiter.stats().items():
+            for outcome, value in counters.items():
+                samples.append(({"rule": rule, "outcome": outcome}, value))
+        return [("pasto_rate_limit_requests_total", "counter",
+                 "Solicitudes evaluadas por el rate limiter", samples)]
+
+    def _collect_sms(self) -> list:
+        if self._sms is None:
+            return []
+        samples = [({"operation": operation, "outcome": outcome}, value)
+                   for (operation, outcome), value in self._sms.stats().items()]
+        breaker_state = self._sms.breaker.state
+        return [
+            ("pasto_sms_requests_total", "counter", "Solicitudes al proveedor de SMS", samples),
+            ("pasto_sms_circuit_open", "gauge", "1 si el circuito del proveedor de SMS está abierto",
+             [({}, 0 if breaker_state == "closed" else 1)]),
+        ]
+
+    def _collect_mongo_cache(self) -> list:
+        """Uso de la cache de WiredTiger (un serverStatus por scrape)"""
+        if self._client is None:
+            return []
+        cache = self._client.admin.command("serverStatus", repl=0, metrics=0, locks=0).get(
+            "wiredTiger", {}).get("cache", {})
+        if not cache:
+            return []
+        return [
+            ("pasto_mongo_cache_bytes", "gauge", "Bytes en la cache de WiredTiger", [
+                ({"kind": "used"}, cache.get("bytes currently in the cache", 0)),
+                ({"kind": "dirty"}, cache.get("tracked dirty bytes in the cache", 0)),
+                ({"kind": "max"}, cache.get("maximum bytes configured", 0)),
+            ]),
+        ]
+
+    def _collect_job_queue(self) -> list:
+        """Trabajos por estado (una agregación por scrape)"""
+        if self._db is None:
+            return []
+        return [("pasto_jobs", "gauge", "Trabajos en la cola por estado",
+                 [({"state": state}, count) for state, count in self.queue.counts().items()])]
+
+    def ensure_indexes(self):
+        """Crear los índices que usa la aplicación (idempotente)"""
+        ensure_notification_indexes(self.db, self.settings.notification_read_ttl_days)
+        ensure_service_indexes(self.db)
+        ensure_rollup_indexes(self.db)
+        ensure_job_indexes(self.db)
+        ensure_search_indexes(self.db)
+        ensure_scheduler_indexes(self.db)
+        ensure_heatmap_indexes(self.db)
+
+    def ensure_required_indexes(self, wait_seconds: float = 300):
+        """Índices de los que depende la corrección, antes de atender solicitudes:
+        únicos de cuentas (el registro no consulta antes de insertar), único de
+        teléfono con su migración y TTL de verificaciones y claves de
+        idempotencia. Los workers los crean de a uno bajo un lease (la migración
+        corre una sola vez); un fallo detiene el arranque"""
+        lock = LeaseLock(self.db.job_locks, "required_indexes", lease_seconds=wait_seconds)
+        deadline = time.monotonic() + wait_seconds
+        while not lock.acquire():
+            if time.monotonic() >= deadline:
+                raise RuntimeError("Otro worker no terminó de crear los índices requeridos")
+            time.sleep(0.5)
+        try:
+            try:
+                ensure_account_indexes(self.db)
+            except Exception as e:
+                raise RuntimeError(
+                    f"No se pudieron crear los índices únicos de cuentas (¿emails duplicados?): {e}") from e
+            ensure_verification_indexes(self.db, self.settings.phone_verification_ttl_seconds)
+            ensure_idempotency_indexes(self.db)
+        finally:
+            lock.release()
+
+    async def aclose(self):
+        """Cerrar los pools de los proveedores de SMS y OpenID y las demás conexiones"""
+        if self._sms is not None:
+            await self._sms.aclose()
+        if self._oidc is not None:
+            await self._oidc.aclose()
+        self.close()
+
+    def close(self):
+        """Cerrar las conexiones abiertas por este proceso"""
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+            self._db = None
+
+
+def get_deps(request: Request) -> AppDependencies:
+    return request.app.state.deps
+
+
+def get_db(request: Request):
+    return request.app.state.deps.db
+
+
+def get_secondary_db(request: Request):
+    """Base para lecturas que toleran el atraso acotado de un secundario"""
+    return request.app.state.deps.reads.secondary
+
+
+def get_queue(request: Request) -> JobQueue:
+    return request.app.state.deps.queue
+
+
+def get_rate_limiter(request: Request) -> RateLimiter:
+    return request.app.state.deps.rate_limiter
@@ -0,0 +1,175 @@
+"""Codificación de respuestas: compresión negociada y MessagePack.
+
+``EncodingMiddleware`` comprime las respuestas con el mejor algoritmo que
+acepte el cliente (``Accept-Encoding``): zstd o brotli si están instalados,
+si no gzip. Las respuestas menores a ``minimum_size`` bytes se envían sin
+comprimir: en cuerpos chicos el ahorro no paga la CPU ni el encabezado
+(``python -m benchmarks.encodings`` mide ambos para elegir el umbral).
+
+``ApiResponse`` es la clase de respuesta por defecto de la app: serializa a
+JSON, o a MessagePack si el cliente lo pide con ``Accept:
+application/msgpack`` y el paquete está instalado.
+"""
+import gzip
+from contextvars import ContextVar
+from typing import Optional
+
+from fastapi.responses import JSONResponse
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MSGPACK_MEDIA_TYPE = "application/msgpack"
+COMPRESSIBLE_TYPES = ("application/json", MSGPACK_MEDIA_TYPE, "text/")
+
+# Encabezado Accept de la solicitud en curso, para elegir el formato al serializar
+accepted_media_types: ContextVar[str] = ContextVar("accepted_media_types", default="")
+
+
+def _parse_accept(header: str) -> dict:
+    """``"gzip, br;q=0.8"`` -> ``{"gzip": 1.0, "br": 0.8}``"""
+    accepted = {}
+    for part in header.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name.lower()] = quality
+    return accepted
+
+
+def wants_msgpack(accept: str) -> bool:
+    if msgpack is None or MSGPACK_MEDIA_TYPE not in accept:
+        return False
+    accepted = _parse_accept(accept)
+    quality = accepted.get(MSGPACK_MEDIA_TYPE, 0)
+    return quality > 0 and quality >= accepted.get("application/json", 0)
+
+
+class ApiResponse(JSONResponse):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if msgpack is not None:
+            # El formato depende de Accept: las caches no deben mezclarlos
+            self.headers.add_vary_header("Accept")
+
+    def render(self, content) -> bytes:
+        if wants_msgpack(accepted_media_types.get()):
+            self.media_type = MSGPACK_MEDIA_TYPE
+            return msgpack.packb(content, use_bin_type=True)
+        return super().render(content)
+
+
+class Compressor:
+    def __init__(self, gzip_level: int = 6, brotli_quality: int = 4, zstd_level: int = 3):
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.zstd_level = zstd_level
+        # Preferencia ante calidades iguales: zstd comprime como brotli con menos CPU
+        self.available = [name for name, module in (("zstd", zstandard), ("br", brotli)) if module] + ["gzip"]
+        self._zstd = zstandard.ZstdCompressor(level=zstd_level) if zstandard else None
+
+    def choose(self, accept_encoding: str) -> Optional[str]:
+        accepted = _parse_accept(accept_encoding)
+        wildcard = accepted.get("*", 0)
+        best, best_quality = None, 0.0
+        for name in self.available:
+            quality = accepted.get(name, wildcard)
+            if quality > best_quality:
+                best, best_quality = name, quality
+        return best
+
+    def compress(self, encoding: str, body: bytes) -> bytes:
+        if encoding == "br":
+            return brotli.compress(body, quality=self.brotli_quality)
+        if encoding == "zstd":
+            return self._zstd.compress(body)
+        return gzip.compress(body, compresslevel=self.gzip_level, mtime=0)
+
+
+class EncodingMiddleware:
+    """Middleware ASGI puro: publica el Accept para ``ApiResponse`` y comprime.
+
+    Con ``compressor=None`` no comprime. Las respuestas en streaming pasan
+    sin comprimir.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, compressor: Optional[Compressor] = None):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compressor = compressor
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope["headers"])
+        token = accepted_media_types.set(headers.get(b"accept", b"").decode("latin-1"))
+        encoding = None
+        if self.compressor is not None:
+            encoding = self.compressor.choose(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                accepted_media_types.reset(token)
+            return
+
+        start_message = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, passthrough
+            if passthrough:
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+
+            body = message.get("body", b"")
+            response_headers = dict(start_message["headers"])
+            content_type = response_headers.get(b"content-type", b"").decode("latin-1")
+            if (message.get("more_body") or len(body) < self.minimum_size
+                    or b"content-encoding" in response_headers
+                    or not content_type.startswith(COMPRESSIBLE_TYPES)):
+                passthrough = True
+                await send(start_message)
+                await send(message)
+                return
+
+            compressed = self.compressor.compress(encoding, body)
+            new_headers = [(name, value) for name, value in start_message["headers"]
+                           if name not in (b"content-length", b"vary")]
+            vary = response_headers.get(b"vary")
+            new_headers += [
+                (b"content-encoding", encoding.encode("latin-1")),
+                (b"content-length", str(len(compressed)).encode("latin-1")),
+                (b"vary", vary + b", Accept-Encoding" if vary else b"Accept-Encoding"),
+            ]
+            passthrough = True
+            await send({**start_message, "headers": new_headers})
+            await send({"type": "http.response.body", "body": compressed})
+
+        try:
+            await self.app(scope, receive, send_compressed)
+        finally:
+            accepted_media_types.reset(token)
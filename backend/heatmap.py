@@ -0,0 +1,208 @@
+"""Mapa de calor de demanda por celdas de geohash.
+
+Los contadores se mantienen con ``$inc`` en cada alta, publicación,
+aceptación o cancelación, a la precisión más fina (``STORAGE_PRECISION``):
+    demand_tiles        por celda: servicios pendientes publicados y la suma
+                        de sus precios estimados
+    demand_tiles_daily  por celda y día: servicios creados y suma de precios;
+                        vencen por TTL pasada la ventana de "recientes"
+
+Las precisiones más gruesas se obtienen sumando por prefijo. Cada proceso
+guarda el mapa agregado en memoria durante unos segundos: miles de
+jardineros refrescando el mapa cuestan una lectura de las celdas por
+proceso y por TTL, nunca un pipeline por solicitud.
+"""
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ReplaceOne, UpdateOne
+
+STORAGE_PRECISION = 6
+MIN_PRECISION = 3
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {char: index for index, char in enumerate(_BASE32)}
+
+
+def geohash_encode(latitude: float, longitude: float, precision: int = STORAGE_PRECISION) -> str:
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        target, interval = (longitude, lng_range) if even else (latitude, lat_range)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if target >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(_BASE32[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def geohash_bounds(geohash: str) -> tuple:
+    """(lat_min, lat_max, lng_min, lng_max) de la celda"""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            interval = lng_range if even else lat_range
+            middle = (interval[0] + interval[1]) / 2
+            if value >> shift & 1:
+                interval[0] = middle
+            else:
+                interval[1] = middle
+            even = not even
+    return lat_range[0], lat_range[1], lng_range[0], lng_range[1]
+
+
+def _day(moment: datetime) -> str:
+    return f"{moment:%Y-%m-%d}"
+
+
+def ensure_heatmap_indexes(db):
+    db.demand_tiles_daily.create_index("expires_at", expireAfterSeconds=0)
+    db.demand_tiles_daily.create_index("day")
+
+
+def _pending_update(service: dict, sign: int) -> UpdateOne:
+    geohash = geohash_encode(service["latitude"], service["longitude"])
+    return UpdateOne({"_id": geohash}, {"$inc": {
+        "pending": sign,
+        "pending_price": sign * float(service.get("estimated_price") or 0.0),
+    }}, upsert=True)
+
+
+def record_tile_created(db, service: dict, recent_days: int):
+    """Alta de un servicio: cuenta como reciente y, si ya está publicado, como pendiente"""
+    geohash = geohash_encode(service["latitude"], service["longitude"])
+    created_at = service["created_at"]
+    day = _day(created_at)
+    db.demand_tiles_daily.update_one(
+        {"_id": f"{geohash}:{day}"},
+        {"$inc": {"created": 1, "created_price": float(service.get("estimated_price") or 0.0)},
+         "$setOnInsert": {"geohash": geohash, "day": day,
+                          "expires_at": datetime(created_at.year, created_at.month, created_at.day)
+                          + timedelta(days=recent_days + 1)}},
+        upsert=True
+    )
+    if service.get("released", True):
+        db.demand_tiles.bulk_write([_pending_update(service, 1)])
+
+
+def record_tile_released(db, service: dict):
+    """Un servicio programado se publicó: pasa a contar como pendiente"""
+    db.demand_tiles.bulk_write([_pending_update(service, 1)])
+
+
+def record_tile_status_change(db, before: dict, new_status):
+    """Un servicio publicado dejó de estar pendiente (aceptado, cancelado)"""
+    old_value, new_value = getattr(before["status"], "value", before["status"]), getattr(new_status, "value", new_status)
+    if old_value == new_value or before.get("released") is False:
+        return
+    if old_value == "pending":
+        db.demand_tiles.bulk_write([_pending_update(before, -1)])
+    elif new_value == "pending":
+        db.demand_tiles.bulk_write([_pending_update(before, 1)])
+
+
+def reconcile_demand_tiles(db, recent_days: int) -> dict:
+    """Reconstruir los contadores desde services (corrige cualquier desvío)"""
+    tiles = {}
+    for service in db.services.find({"status": "pending", "released": {"$ne": False}},
+                                    {"latitude": 1, "longitude": 1, "estimated_price": 1}):
+        tile = tiles.setdefault(geohash_encode(service["latitude"], service["longitude"]),
+                                {"pending": 0, "pending_price": 0.0})
+        tile["pending"] += 1
+        tile["pending_price"] += float(service.get("estimated_price") or 0.0)
+
+    operations = [ReplaceOne({"_id": geohash}, {"_id": geohash, **tile}, upsert=True)
+                  for geohash, tile in tiles.items()]
+    if operations:
+        db.demand_tiles.bulk_write(operations, ordered=False)
+    db.demand_tiles.delete_many({"_id": {"$nin": list(tiles)}})
+
+    since = datetime.utcnow() - timedelta(days=recent_days)
+    daily = {}
+    for service in db.services.find({"created_at": {"$gte": datetime(since.year, since.month, since.day)}},
+                                    {"latitude": 1, "longitude": 1, "estimated_price": 1, "created_at": 1}):
+        geohash = geohash_encode(service["latitude"], service["longitude"])
+        day = _day(service["created_at"])
+        doc = daily.setdefault(f"{geohash}:{day}", {
+            "geohash": geohash, "day": day, "created": 0, "created_price": 0.0,
+            "expires_at": datetime.strptime(day, "%Y-%m-%d") + timedelta(days=recent_days + 1),
+        })
+        doc["created"] += 1
+        doc["created_price"] += float(service.get("estimated_price") or 0.0)
+    daily_operations = [ReplaceOne({"_id": key}, {"_id": key, **doc}, upsert=True) for key, doc in daily.items()]
+    if daily_operations:
+        db.demand_tiles_daily.bulk_write(daily_operations, ordered=False)
+
+    return {"tiles": len(tiles), "daily_tiles": len(daily)}
+
+
+def build_heatmap(db, precision: int, recent_days: int) -> list:
+    """Celdas a la precisión pedida, sumando las celdas finas por prefijo"""
+    cells = {}
+
+    def cell(geohash: str) -> dict:
+        prefix = geohash[:precision]
+        return cells.setdefault(prefix, {"pending": 0, "pending_price": 0.0, "recent": 0})
+
+    for tile in db.demand_tiles.find({"pending": {"$gt": 0}}):
+        target = cell(tile["_id"])
+        target["pending"] += tile["pending"]
+        target["pending_price"] += tile["pending_price"]
+
+    first_day = _day(datetime.utcnow() - timedelta(days=recent_days - 1))
+    for tile in db.demand_tiles_daily.find({"day": {"$gte": first_day}}, {"geohash": 1, "created": 1}):
+        cell(tile["geohash"])["recent"] += tile["created"]
+
+    tiles = []
+    for geohash, counts in cells.items():
+        lat_min, lat_max, lng_min, lng_max = geohash_bounds(geohash)
+        tiles.append({
+            "geohash": geohash,
+            "latitude": round((lat_min + lat_max) / 2, 5),
+            "longitude": round((lng_min + lng_max) / 2, 5),
+            "pending": counts["pending"],
+            "avg_estimated_price": round(counts["pending_price"] / counts["pending"], 2) if counts["pending"] else None,
+            "recent": counts["recent"],
+        })
+    return tiles
+
+
+class HeatmapCache:
+    """Mapa agregado por precisión, recalculado como mucho una vez por TTL en cada proceso"""
+
+    def __init__(self, ttl_seconds: float = 30, recent_days: int = 7):
+        self.ttl_seconds = ttl_seconds
+        self.recent_days = recent_days
+        self._entries = {}
+
+    def get(self, db, precision: int) -> tuple:
+        """(generado_en, celdas) desde la cache o recalculado"""
+        entry = self._entries.get(precision)
+        if entry is None or entry[0] <= time.monotonic():
+            entry = (time.monotonic() + self.ttl_seconds, datetime.utcnow(),
+                     build_heatmap(db, precision, self.recent_days))
+            self._entries[precision] = entry
+        return entry[1], entry[2]
+
+
+def tiles_in_bounds(tiles: list, bounds: Optional[tuple]) -> list:
+    if bounds is None:
+        return tiles
+    min_lat, min_lng, max_lat, max_lng = bounds
+    visible = []
+    for tile in tiles:
+        # Celdas que se superponen con el área visible, aunque su centro quede afuera
+        lat_min, lat_max, lng_min, lng_max = geohash_bounds(tile["geohash"])
+        if lat_min <= max_lat and lat_max >= min_lat and lng_min <= max_lng and lng_max >= min_lng:
+            visible.append(tile)
+    return visible
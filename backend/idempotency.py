@@ -0,0 +1,131 @@
+"""Soporte de ``Idempotency-Key`` para POSTs que los clientes reintentan.
+
+La primera solicitud con una clave la reserva (documento "in_progress" con
+un vencimiento corto) y, al terminar, guarda la respuesta. Un reintento con
+la misma clave y el mismo contenido recibe la respuesta guardada sin volver
+a ejecutar el handler. Reusar la clave con otro contenido es un error 422, y
+un reintento mientras la original sigue en curso recibe 409.
+
+Las claves son por usuario y ruta; vencen por índice TTL.
+"""
+import hashlib
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from pymongo.errors import DuplicateKeyError
+
+from encoding import ApiResponse
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAY_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+
+def ensure_idempotency_indexes(db):
+    db.idempotency_keys.create_index("expires_at", expireAfterSeconds=0)
+
+
+def fingerprint(payload) -> str:
+    """Huella del contenido de la solicitud"""
+    if isinstance(payload, bytes):
+        return hashlib.sha256(payload).hexdigest()
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class IdempotencyKey:
+    """Clave de la solicitud actual; sin header, todas las operaciones son no-op"""
+
+    def __init__(self, collection=None, key_id: Optional[str] = None,
+                 ttl_seconds: int = 86400, lock_seconds: int = 60):
+        self.collection = collection
+        self.key_id = key_id
+        self.ttl_seconds = ttl_seconds
+        self.lock_seconds = lock_seconds
+        self.reserved = False
+        self.completed = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.key_id is not None
+
+    def _reserve(self, request_fingerprint: str) -> bool:
+        now = datetime.utcnow()
+        try:
+            self.collection.insert_one({
+                "_id": self.key_id,
+                "state": "in_progress",
+                "fingerprint": request_fingerprint,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.lock_seconds),
+            })
+        except DuplicateKeyError:
+            return False
+        self.reserved = True
+        return True
+
+    def replay(self, request_fingerprint: str) -> Optional[ApiResponse]:
+        """Reservar la clave, o devolver la respuesta guardada si ya se usó"""
+        if not self.enabled or self._reserve(request_fingerprint):
+            return None
+
+        record = self.collection.find_one({"_id": self.key_id})
+        now = datetime.utcnow()
+        if record is None or (record["state"] == "in_progress" and record["expires_at"] < now):
+            # Reserva abandonada (el proceso murió antes de responder): tomarla
+            self.collection.delete_one({"_id": self.key_id, "state": "in_progress", "expires_at": {"$lt": now}})
+            if self._reserve(request_fingerprint):
+                return None
+            record = self.collection.find_one({"_id": self.key_id})
+
+        if record is not None and record["fingerprint"] != request_fingerprint:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail="La clave de idempotencia ya se usó con otra solicitud"
+            )
+        if record is None or record["state"] == "in_progress":
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Hay una solicitud con la misma clave de idempotencia en curso",
+                headers={"Retry-After": "1"}
+            )
+        # Misma negociación que la respuesta original (JSON o msgpack, Vary: Accept)
+        return ApiResponse(
+            content=record["response_body"],
+            status_code=record["status_code"],
+            headers={REPLAY_HEADER: "true"}
+        )
+
+    def store(self, response, status_code: int = 200):
+        """Guardar la respuesta para futuros reintentos"""
+        if not self.reserved:
+            return response
+        self.collection.update_one(
+            {"_id": self.key_id},
+            {"$set": {
+                "state": "completed",
+                "status_code": status_code,
+                "response_body": jsonable_encoder(response),
+                "completed_at": datetime.utcnow(),
+                "expires_at": datetime.utcnow() + timedelta(seconds=self.ttl_seconds),
+            }}
+        )
+        self.completed = True
+        return response
+
+    def release(self):
+        """Liberar una reserva sin respuesta (el handler falló) para permitir el reintento"""
+        if self.reserved and not self.completed:
+            self.collection.delete_one({"_id": self.key_id, "state": "in_progress"})
+
+
+def idempotency_key_id(user_id: str, method: str, path: str, key: str) -> str:
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La clave de idempotencia es demasiado larga"
+        )
+    return f"{user_id}:{method}:{path}:{key}"
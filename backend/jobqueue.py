@@ -0,0 +1,261 @@
+"""Cola de trabajos persistente en Mongo, procesada dentro de cada worker.
+
+Los handlers HTTP encolan efectos secundarios lentos (notificaciones,
+SMS, ratings) y responden sin esperarlos. Cada trabajo es un documento en
+``jobs``; los workers de asyncio de cada proceso lo toman con un
+``find_one_and_update`` atómico, así que con varios procesos cada trabajo
+corre una sola vez (al menos una vez si un proceso muere a mitad: el lease
+vence y otro lo retoma). Mientras un trabajo corre, una tarea de cada
+proceso extiende su lease cada ``lease_seconds / 3``: un trabajo largo (el
+borrado de una cuenta grande) no se retoma en otro worker mientras su
+proceso siga vivo.
+
+Estados: queued -> running -> done, o de vuelta a queued con backoff
+exponencial si falla, hasta ``dead`` al agotar los intentos. Los terminados
+vencen por TTL; los muertos quedan para inspección y reintento manual.
+"""
+import asyncio
+import inspect
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from pymongo import ReturnDocument
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+DEAD = "dead"
+STATES = (QUEUED, RUNNING, DONE, DEAD)
+
+
+def ensure_job_indexes(db):
+    jobs = db.jobs
+    # Búsqueda del próximo trabajo listo y de leases vencidos
+    jobs.create_index([("state", 1), ("run_at", 1)])
+    jobs.create_index([("state", 1), ("locked_until", 1)])
+    # Solo los terminados tienen expires_at
+    jobs.create_index("expires_at", expireAfterSeconds=0)
+
+
+class JobQueue:
+    def __init__(self, collection: Callable, metrics=None, *, workers: int = 2, poll_interval: float = 1.0,
+                 lease_seconds: int = 60, max_attempts: int = 5, backoff_seconds: float = 2.0,
+                 max_backoff_seconds: float = 600, done_ttl_seconds: int = 86400):
+        # La colección se resuelve al primer uso para no conectar al crear la app
+        self._collection = collection
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.done_ttl_seconds = done_ttl_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self.handlers = {}
+        # Trabajos de este proceso en curso: _id -> attempts del claim
+        self._running = {}
+        self._tasks = []
+        self._loop = None
+        self._wakeup = None
+
+        self._processed = None
+        self._duration = None
+        if metrics is not None:
+            self._processed = metrics.counter(
+                "pasto_jobs_processed_total", "Trabajos ejecutados por nombre y resultado", ("name", "outcome"))
+            self._duration = metrics.histogram(
+                "pasto_job_duration_seconds", "Duración de los trabajos por nombre", ("name",))
+
+    @property
+    def collection(self):
+        return self._collection()
+
+    def register(self, name: str, func: Callable[[dict], Optional[dict]]):
+        """Registrar el handler de un tipo de trabajo; recibe el payload.
+
+        Puede ser una corutina: corre en el event loop de los workers (o en uno
+        propio con ``run_pending``), así usa clientes asíncronos del proceso.
+        """
+        self.handlers[name] = func
+
+    def _call(self, handler: Callable, payload: dict):
+        if not inspect.iscoroutinefunction(handler):
+            return handler(payload)
+        if self._loop is not None:
+            return asyncio.run_coroutine_threadsafe(handler(payload), self._loop).result()
+        return asyncio.run(handler(payload))
+
+    def enqueue(self, name: str, payload: Optional[dict] = None, *, delay_seconds: float = 0,
+                max_attempts: Optional[int] = None) -> str:
+        """Persistir un trabajo y despertar a los workers locales"""
+        now = datetime.utcnow()
+        job_id = str(uuid.uuid4())
+        self.collection.insert_one({
+            "_id": job_id,
+            "name": name,
+            "payload": payload or {},
+            "state": QUEUED,
+            "attempts": 0,
+            "max_attempts": max_attempts or self.max_attempts,
+            "run_at": now + timedelta(seconds=delay_seconds),
+            "created_at": now,
+            "updated_at": now,
+        })
+        if self._loop is not None and not delay_seconds:
+            # enqueue puede llamarse desde el loop o desde un hilo
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        return job_id
+
+    def claim(self) -> Optional[dict]:
+        """Tomar el próximo trabajo listo, o uno cuyo lease venció"""
+        now = datetime.utcnow()
+        return self.collection.find_one_and_update(
+            {"$or": [
+                {"state": QUEUED, "run_at": {"$lte": now}},
+                {"state": RUNNING, "locked_until": {"$lt": now}},
+            ]},
+            {"$set": {"state": RUNNING, "owner": self.owner, "updated_at": now,
+                      "locked_until": now + timedelta(seconds=self.lease_seconds)},
+             "$inc": {"attempts": 1}},
+            sort=[("run_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _finish(self, job: dict, update: dict):
+        # Solo si el lease sigue siendo nuestro: otro worker pudo retomarlo
+        self.collection.update_one(
+            {"_id": job["_id"], "owner": self.owner, "attempts": job["attempts"]},
+            {"$set": {**update, "updated_at": datetime.utcnow()}, "$unset": {"locked_until": ""}}
+        )
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.max_backoff_seconds, self.backoff_seconds * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _fail(self, job: dict, error: str) -> str:
+        now = datetime.utcnow()
+        if job["attempts"] >= job["max_attempts"]:
+            self._finish(job, {"state": DEAD, "last_error": error, "failed_at": now})
+            return "dead"
+        self._finish(job, {"state": QUEUED, "last_error": error,
+                           "run_at": now + timedelta(seconds=self._backoff(job["attempts"]))})
+        return "retried"
+
+    def extend_leases(self) -> int:
+        """Renovar el lease de los trabajos que este proceso está ejecutando"""
+        running = list(self._running.items())
+        if not running:
+            return 0
+        now = datetime.utcnow()
+        result = self.collection.update_many(
+            {"$or": [{"_id": job_id, "attempts": attempts} for job_id, attempts in running],
+             "owner": self.owner, "state": RUNNING},
+            {"$set": {"locked_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now}}
+        )
+        return result.modified_count
+
+    def run_one(self) -> bool:
+        """Ejecutar un trabajo (síncrono). Devuelve False si no había ninguno listo"""
+        job = self.claim()
+        if job is None:
+            return False
+        self._running[job["_id"]] = job["attempts"]
+        try:
+            self._run_claimed(job)
+        finally:
+            self._running.pop(job["_id"], None)
+        return True
+
+    def _run_claimed(self, job: dict):
+        handler = self.handlers.get(job["name"])
+        started = time.perf_counter()
+        if job["attempts"] > job["max_attempts"]:
+            # El proceso murió a mitad del último intento
+            outcome = self._fail(job, job.get("last_error") or "lease vencido")
+        elif handler is None:
+            self._finish(job, {"state": DEAD, "last_error": f"sin handler para {job['name']}",
+                               "failed_at": datetime.utcnow()})
+            outcome = "dead"
+        else:
+            try:
+                result = self._call(handler, job["payload"])
+            except Exception as e:
+                outcome = self._fail(job, f"{type(e).__name__}: {e}")
+            else:
+                self._finish(job, {"state": DONE, "result": result, "completed_at": datetime.utcnow(),
+                                   "expires_at": datetime.utcnow() + timedelta(seconds=self.done_ttl_seconds)})
+                outcome = "done"
+
+        if self._processed is not None:
+            self._processed.inc((job["name"], outcome))
+            self._duration.observe((job["name"],), time.perf_counter() - started)
+
+    def run_pending(self, max_jobs: int = 1000) -> int:
+        """Procesar los trabajos listos hasta vaciar la cola (scripts y tests)"""
+        processed = 0
+        while processed < max_jobs and self.run_one():
+            processed += 1
+        return processed
+
+    async def _work(self):
+        while True:
+            # Limpiar antes de buscar: un enqueue durante la búsqueda no se pierde
+            self._wakeup.clear()
+            try:
+                if await asyncio.to_thread(self.run_one):
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Mongo caído: esperar y volver a intentar
+                print(f"Warning: job queue worker failed: {e}")
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _heartbeat(self):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            try:
+                await asyncio.to_thread(self.extend_leases)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: job lease heartbeat failed: {e}")
+
+    def start(self):
+        if self.workers <= 0:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        for index in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._work(), name=f"jobqueue:{index}"))
+        self._tasks.append(asyncio.create_task(self._heartbeat(), name="jobqueue:heartbeat"))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = None
+
+    def counts(self) -> dict:
+        counts = {state: 0 for state in STATES}
+        for row in self.collection.aggregate([{"$group": {"_id": "$state", "count": {"$sum": 1}}}]):
+            counts[row["_id"]] = row["count"]
+        return counts
+
+    def retry(self, job_id: str) -> bool:
+        """Volver a encolar un trabajo muerto con los intentos en cero"""
+        result = self.collection.update_one(
+            {"_id": job_id, "state": DEAD},
+            {"$set": {"state": QUEUED, "attempts": 0, "run_at": datetime.utcnow(),
+                      "updated_at": datetime.utcnow()}}
+        )
+        return result.modified_count == 1
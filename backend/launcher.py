@@ -0,0 +1,94 @@
+"""Lanzador de producción multi-proceso para PASTO! API.
+
+Corre N workers de uvicorn bajo gunicorn. La app se importa en cada worker
+después del fork (``preload_app = False``) y los clientes externos se crean
+al primer uso dentro de cada worker (ver ``dependencies.py``), así que ningún
+socket de Mongo se comparte entre procesos.
+
+Señales soportadas por el proceso maestro:
+    HUP   reinicio gradual: levanta workers nuevos y drena los viejos
+    TERM  apagado gradual (espera ``graceful_timeout`` segundos)
+    TTIN  agrega un worker
+    TTOU  quita un worker
+
+Detrás del ingress o proxy, ``--forwarded-allow-ips`` (o FORWARDED_ALLOW_IPS)
+debe listar sus direcciones: uvicorn toma entonces la IP del cliente de
+``X-Forwarded-For``. Si no, todas las solicitudes llegan con la IP del
+proxy y el rate limiting por IP trata a todos los usuarios como uno solo.
+
+Uso:
+    python launcher.py                  # workers = cantidad de CPUs
+    python launcher.py --workers 4 --port 8001
+    python launcher.py --forwarded-allow-ips "10.0.0.10,10.0.0.11"
+"""
+import argparse
+import multiprocessing
+import os
+
+from gunicorn.app.base import BaseApplication
+
+
+def default_workers() -> int:
+    """Cantidad de workers por defecto: WEB_CONCURRENCY o un worker por CPU"""
+    env_value = os.environ.get("WEB_CONCURRENCY")
+    if env_value:
+        return max(1, int(env_value))
+    return max(1, multiprocessing.cpu_count())
+
+
+class PastoApplication(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+
+    def load(self):
+        # Se ejecuta dentro de cada worker, después del fork
+        from server import app
+        return app
+
+
+def build_options(args) -> dict:
+    return {
+        "bind": f"{args.host}:{args.port}",
+        "workers": args.workers or default_workers(),
+        "worker_class": "uvicorn.workers.UvicornWorker",
+        "preload_app": False,
+        "graceful_timeout": args.graceful_timeout,
+        "timeout": args.timeout,
+        "keepalive": 5,
+        # Proxies cuyo X-Forwarded-For se acepta (UvicornWorker lo pasa a uvicorn)
+        "forwarded_allow_ips": args.forwarded_allow_ips,
+        # Reciclar workers periódicamente; el jitter evita que reinicien todos a la vez
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests // 10 if args.max_requests else 0,
+        "accesslog": "-" if args.access_log else None,
+        "errorlog": "-",
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PASTO! API - lanzador multi-worker")
+    parser.add_argument("--host", default=os.environ.get("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8001)))
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Cantidad de workers (por defecto, uno por CPU)")
+    parser.add_argument("--graceful-timeout", type=int, default=30)
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--max-requests", type=int, default=0)
+    parser.add_argument("--access-log", action="store_true")
+    parser.add_argument("--forwarded-allow-ips", default=os.environ.get("FORWARDED_ALLOW_IPS", "127.0.0.1"),
+                        help="IPs de los proxies de confianza, separadas por comas ('*' para cualquiera)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    PastoApplication(build_options(parse_args(argv))).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Infraestructura para tareas de mantenimiento en segundo plano.
+
+Las tareas periódicas corren como tareas de asyncio en cada worker, pero el
+trabajo pesado (pymongo es síncrono) se ejecuta en un hilo. Un lease en la
+colección ``job_locks`` asegura que, con varios workers o varias máquinas,
+cada tarea corra en un solo proceso a la vez. Una tarea periódica conserva
+el lease hasta su próxima ejecución: con N workers corre una vez por
+intervalo en toda la flota, no una vez por worker.
+"""
+import asyncio
+import os
+import random
+import socket
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+
+def ensure_ttl_index(collection, field: str, expire_after_seconds: int, **kwargs):
+    """Crear un índice TTL, ajustando el vencimiento si el índice ya existe"""
+    try:
+        collection.create_index(field, expireAfterSeconds=expire_after_seconds, **kwargs)
+    except OperationFailure as e:
+        # IndexOptionsConflict: mismo índice con otro vencimiento
+        if e.code not in (85, 86):
+            raise
+        collection.database.command({
+            "collMod": collection.name,
+            "index": {"keyPattern": {field: 1}, "expireAfterSeconds": expire_after_seconds},
+        })
+
+
+class LeaseLock:
+    """Lock con vencimiento guardado en Mongo; se libera solo si el proceso muere"""
+
+    def __init__(self, collection, name: str, lease_seconds: int = 300):
+        self.collection = collection
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+
+    def acquire(self, lease_seconds: Optional[float] = None) -> bool:
+        now = datetime.utcnow()
+        lease = timedelta(seconds=lease_seconds if lease_seconds is not None else self.lease_seconds)
+        try:
+            self.collection.find_one_and_update(
+                {"_id": self.name, "$or": [{"locked_until": {"$lte": now}}, {"owner": self.owner}]},
+                {"$set": {"owner": self.owner, "locked_until": now + lease,
+                          "acquired_at": now}},
+                upsert=True
+            )
+            return True
+        except DuplicateKeyError:
+            # El documento existe y lo tiene otro proceso
+            return False
+
+    def release(self):
+        self.collection.update_one(
+            {"_id": self.name, "owner": self.owner},
+            {"$set": {"locked_until": datetime.utcnow()}}
+        )
+
+
+class PeriodicJob:
+    def __init__(self, name: str, interval_seconds: float, func: Callable[[], Optional[dict]],
+                 lock: Optional[LeaseLock] = None):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.func = func
+        self.lock = lock
+        self.last_run_at: Optional[datetime] = None
+        self.last_result: Optional[dict] = None
+        self.last_error: Optional[str] = None
+
+    def run_once(self) -> Optional[dict]:
+        """Ejecutar la tarea si se obtiene el lock (síncrono).
+
+        El lease dura hasta la próxima ejecución y no se libera al terminar:
+        los demás workers, que despiertan con su propio desfase, encuentran
+        la tarea ya hecha en este intervalo. Si falla se libera para que otro
+        worker la reintente.
+        """
+        if self.lock is not None and not self.lock.acquire(max(self.interval_seconds, self.lock.lease_seconds)):
+            return None
+        try:
+            self.last_result = self.func()
+            self.last_error = None
+            return self.last_result
+        except Exception:
+            if self.lock is not None:
+                self.lock.release()
+            raise
+        finally:
+            self.last_run_at = datetime.utcnow()
+
+    async def run_forever(self):
+        # Desfasar el arranque para que los workers no compitan todos a la vez
+        await asyncio.sleep(random.uniform(0, min(self.interval_seconds, 60)))
+        while True:
+            try:
+                await asyncio.to_thread(self.run_once)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: background job {self.name} failed: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "interval_seconds": self.interval_seconds,
+            "last_run_at": self.last_run_at,
+            "last_result": self.last_result,
+            "last_error": self.last_error,
+        }
+
+
+class BackgroundJobs:
+    """Tareas periódicas de un proceso, arrancadas y detenidas por el lifespan"""
+
+    def __init__(self):
+        self.jobs = {}
+        self._startup = []
+        self._tasks = []
+
+    def add(self, job: PeriodicJob):
+        self.jobs[job.name] = job
+
+    def add_startup(self, name: str, func: Callable[[], None], lock: Optional[LeaseLock] = None):
+        """Tarea que corre una sola vez al arrancar el worker, sin demorar el arranque.
+        Con ``lock`` la corre solo el worker que lo obtiene; los demás la saltean"""
+        self._startup.append((name, func, lock))
+
+    def start(self):
+        for name, func, lock in self._startup:
+            self._tasks.append(asyncio.create_task(self._run_startup(name, func, lock), name=f"startup:{name}"))
+        for job in self.jobs.values():
+            self._tasks.append(asyncio.create_task(job.run_forever(), name=f"job:{job.name}"))
+
+    async def _run_startup(self, name: str, func: Callable[[], None], lock: Optional[LeaseLock] = None):
+        if lock is not None and not await asyncio.to_thread(lock.acquire):
+            return
+        try:
+            await asyncio.to_thread(func)
+        except Exception as e:
+            print(f"Warning: startup task {name} failed: {e}")
+        finally:
+            if lock is not None:
+                await asyncio.to_thread(lock.release)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,296 @@
+"""Métricas en formato de texto de Prometheus.
+
+Registro mínimo sin dependencias externas:
+    - latencia por ruta (histograma), códigos de estado y solicitudes en curso,
+      medidos por un middleware ASGI
+    - latencia de comandos de Mongo por colección y operación, y estado del
+      pool de conexiones, vía los listeners de monitoreo de pymongo
+    - colectores registrables que se evalúan al momento del scrape (caches,
+      colas, rate limiting)
+
+Las métricas son por proceso: con varios workers cada uno expone las suyas.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Optional
+
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Scope ASGI de la solicitud en curso; permite atribuir comandos de Mongo a una ruta
+current_request_scope: ContextVar[Optional[dict]] = ContextVar("current_request_scope", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: tuple, labelvalues: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labelvalues)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def header(self) -> list:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def inc(self, labelvalues: tuple = (), amount: float = 1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self) -> list:
+        lines = self.header()
+        with self._lock:
+            items = list(self._values.items())
+        for labelvalues, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, labelvalues: tuple = (), amount: float = 1):
+        self.inc(labelvalues, -amount)
+
+    def set(self, labelvalues: tuple = (), value: float = 0):
+        with self._lock:
+            self._values[labelvalues] = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, labelvalues: tuple, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labelvalues)
+            if state is None:
+                # [conteos por bucket (+Inf al final), suma, cantidad]
+                state = self._values[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self) -> list:
+        lines = self.header()
+        with self._lock:
+            items = [(labels, (list(s[0]), s[1], s[2])) for labels, s in self._values.items()]
+        bounds = self.buckets + (float("inf"),)
+        for labelvalues, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labelvalues, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {total!r}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+        self.http_requests = self.counter(
+            "pasto_http_requests_total", "Solicitudes HTTP por ruta y código de estado",
+            ("method", "route", "status"))
+        self.http_latency = self.histogram(
+            "pasto_http_request_duration_seconds", "Latencia de solicitudes HTTP por ruta",
+            ("method", "route"))
+        self.http_in_flight = self.gauge(
+            "pasto_http_requests_in_flight", "Solicitudes HTTP en curso", ("method",))
+        self.mongo_latency = self.histogram(
+            "pasto_mongo_command_duration_seconds", "Latencia de comandos de Mongo por colección y operación",
+            ("collection", "command"))
+        self.mongo_failures = self.counter(
+            "pasto_mongo_command_failures_total", "Comandos de Mongo fallidos", ("collection", "command"))
+        self.mongo_pool = self.gauge(
+            "pasto_mongo_pool_connections", "Conexiones del pool de Mongo por servidor y estado",
+            ("address", "state"))
+
+    def counter(self, name: str, documentation: str, labelnames: tuple = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: tuple = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: tuple = (),
+                  buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list]):
+        """Registrar una función que devuelve métricas a evaluar en cada scrape.
+
+        Debe devolver una lista de tuplas ``(nombre, tipo, ayuda, muestras)``,
+        donde ``muestras`` es una lista de ``(dict de labels, valor)``.
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception as e:
+                print(f"Warning: metrics collector failed: {e}")
+                continue
+            for name, type_name, documentation, samples in families:
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {type_name}")
+                for labels, value in samples:
+                    labelnames = tuple(labels)
+                    lines.append(f"{name}{_format_labels(labelnames, tuple(labels[k] for k in labelnames))} "
+                                 f"{_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """Middleware ASGI que mide latencia, estado y concurrencia por ruta"""
+
+    def __init__(self, app, metrics: MetricsRegistry):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        token = current_request_scope.set(scope)
+        metrics.http_in_flight.inc((method,))
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            metrics.http_in_flight.dec((method,))
+            current_request_scope.reset(token)
+            route = route_template(scope)
+            metrics.http_latency.observe((method, route), elapsed)
+            metrics.http_requests.inc((method, route, str(status_code)))
+
+
+def route_template(scope: Optional[dict]) -> str:
+    """Plantilla de la ruta resuelta (p. ej. /api/services/{service_id}/accept)"""
+    if scope is None:
+        return "-"
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "-")
+    if scope.get("root_path", "").endswith("/uploads"):
+        return "/uploads"
+    return "unmatched"
+
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Latencia de comandos de Mongo por colección y operación"""
+
+    def __init__(self, metrics: MetricsRegistry):
+        self.metrics = metrics
+        self._collections = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if not isinstance(collection, str):
+            collection = "-"
+        self._collections[(event.connection_id, event.request_id)] = collection
+
+    def succeeded(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        self.metrics.mongo_latency.observe((collection, event.command_name), event.duration_micros / 1e6)
+
+    def failed(self, event):
+        collection = self._collections.pop((event.connection_id, event.request_id), "-")
+        self.metrics.mongo_latency.observe((collection, event.command_name), event.duration_micros / 1e6)
+        self.metrics.mongo_failures.inc((collection, event.command_name))
+
+
+class MongoPoolMetrics(monitoring.ConnectionPoolListener):
+    """Conexiones abiertas y en uso del pool de Mongo"""
+
+    def __init__(self, metrics: MetricsRegistry):
+        self.metrics = metrics
+
+    def _address(self, event) -> str:
+        host, port = event.address
+        return f"{host}:{port}"
+
+    def connection_created(self, event):
+        self.metrics.mongo_pool.inc((self._address(event), "open"))
+
+    def connection_closed(self, event):
+        self.metrics.mongo_pool.dec((self._address(event), "open"))
+
+    def connection_checked_out(self, event):
+        self.metrics.mongo_pool.inc((self._address(event), "in_use"))
+
+    def connection_checked_in(self, event):
+        self.metrics.mongo_pool.dec((self._address(event), "in_use"))
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_check_out_failed(self, event):
+        pass
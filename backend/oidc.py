@@ -0,0 +1,273 @@
+"""Verificación local de ID tokens de OpenID Connect (Google).
+
+``OpenIDProvider`` guarda en memoria el documento de discovery y las
+claves públicas (JWKS) del proveedor y los renueva en segundo plano antes
+de que venzan (``Cache-Control: max-age`` de la respuesta, acotado por
+``refresh_seconds``). Un ID token se verifica localmente contra esas
+claves: firma, ``aud``, ``iss`` y vencimiento. En el caso común un ingreso
+con Google no hace ninguna llamada saliente; solo un ``kid`` desconocido
+(rotación de claves) fuerza una recarga del JWKS, como mucho una vez por
+``min_refresh_seconds``. Si el proveedor no responde se sigue usando la
+última copia.
+
+``FakeIdentityProvider`` es un proveedor local con su propia clave RSA que
+sirve discovery, JWKS y el endpoint de token por un transporte httpx en
+memoria: el flujo completo se prueba y se mide sin red.
+"""
+import asyncio
+import json
+import re
+import time
+import uuid
+from typing import Optional
+
+import httpx
+import jwt
+from jwt.algorithms import RSAAlgorithm
+
+SIGNING_ALGORITHMS = ["RS256"]
+
+
+class IdTokenError(Exception):
+    """El ID token no es válido (firma, audiencia, emisor o vencimiento)"""
+
+
+class ProviderUnavailable(Exception):
+    """No hay metadatos ni claves del proveedor y no se pudieron descargar"""
+
+
+def _max_age(response: httpx.Response) -> Optional[float]:
+    match = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+    return float(match.group(1)) if match else None
+
+
+class OpenIDProvider:
+    name = "oidc_refresh"
+
+    def __init__(self, metadata_url: str, client_id: Optional[str], client_secret: Optional[str] = None, *,
+                 refresh_seconds: float = 3600, min_refresh_seconds: float = 60, leeway_seconds: int = 60,
+                 timeout_seconds: float = 5.0, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.metadata_url = metadata_url
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_seconds = refresh_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self.leeway_seconds = leeway_seconds
+        self._client_kwargs = {"timeout": httpx.Timeout(timeout_seconds), "transport": transport}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self.metadata: Optional[dict] = None
+        self._keys = {}
+        self._expires_at = 0.0
+        self._last_fetch = 0.0
+        self.fetches = 0
+        self.last_error: Optional[str] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Se crea dentro del event loop del worker que lo usa
+        if self._client is None:
+            self._client = httpx.AsyncClient(**self._client_kwargs)
+        return self._client
+
+    async def _get(self, url: str) -> httpx.Response:
+        self.fetches += 1
+        response = await self.client.get(url)
+        response.raise_for_status()
+        return response
+
+    async def refresh(self):
+        """Descargar discovery y JWKS; conserva la copia anterior si falla"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        requested_at = time.monotonic()
+        async with self._lock:
+            # Otra solicitud descargó mientras se esperaba el lock: usar esa copia
+            if self._last_fetch > requested_at:
+                if self.metadata is None:
+                    raise ProviderUnavailable(f"Proveedor OpenID no disponible: {self.last_error}")
+                return
+            try:
+                metadata_response = await self._get(self.metadata_url)
+                metadata = metadata_response.json()
+                jwks_response = await self._get(metadata["jwks_uri"])
+                keys = {key["kid"]: jwt.PyJWK(key) for key in jwks_response.json()["keys"]
+                        if key.get("use", "sig") == "sig" and key.get("kid")}
+            except (httpx.HTTPError, KeyError, ValueError, jwt.PyJWKError) as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                raise ProviderUnavailable(f"Proveedor OpenID no disponible: {self.last_error}") from e
+            finally:
+                self._last_fetch = time.monotonic()
+            ttl = min(filter(None, [_max_age(jwks_response), _max_age(metadata_response), self.refresh_seconds]))
+            self.metadata, self._keys = metadata, keys
+            self._expires_at = time.monotonic() + ttl
+            self.last_error = None
+
+    async def _key(self, kid: Optional[str]) -> jwt.PyJWK:
+        if self.metadata is None or time.monotonic() >= self._expires_at:
+            try:
+                await self.refresh()
+            except ProviderUnavailable:
+                if self.metadata is None:
+                    raise
+        key = self._keys.get(kid)
+        # kid desconocido: las claves rotaron; recargar, pero no en cada token inválido
+        if key is None and time.monotonic() - self._last_fetch >= self.min_refresh_seconds:
+            await self.refresh()
+            key = self._keys.get(kid)
+        if key is None:
+            raise IdTokenError("Clave de firma desconocida")
+        return key
+
+    def _issuers(self) -> set:
+        issuer = self.metadata["issuer"]
+        # Google emite tokens con y sin esquema en "iss"
+        return {issuer, issuer.removeprefix("https://")}
+
+    async def verify_id_token(self, id_token: str, nonce: Optional[str] = None) -> dict:
+        """Claims del ID token verificado localmente"""
+        try:
+            header = jwt.get_unverified_header(id_token)
+        except jwt.PyJWTError as e:
+            raise IdTokenError("ID token mal formado") from e
+        key = await self._key(header.get("kid"))
+        try:
+            claims = jwt.decode(id_token, key.key, algorithms=SIGNING_ALGORITHMS, audience=self.client_id,
+                                leeway=self.leeway_seconds, options={"require": ["exp", "iat", "iss", "sub", "aud"]})
+        except jwt.PyJWTError as e:
+            raise IdTokenError(f"ID token inválido: {e}") from e
+        if claims["iss"] not in self._issuers():
+            raise IdTokenError("Emisor del ID token inválido")
+        if nonce is not None and claims.get("nonce") != nonce:
+            raise IdTokenError("Nonce del ID token inválido")
+        if claims.get("email") and claims.get("email_verified") is False:
+            raise IdTokenError("Email de Google no verificado")
+        return claims
+
+    async def exchange_code(self, code: str, redirect_uri: str) -> str:
+        """Canjear un código de autorización por el ID token (una llamada al proveedor)"""
+        if self.metadata is None:
+            await self.refresh()
+        try:
+            response = await self.client.post(self.metadata["token_endpoint"], data={
+                "grant_type": "authorization_code",
+                "code": code,
+                "redirect_uri": redirect_uri,
+                "client_id": self.client_id,
+                "client_secret": self.client_secret,
+            })
+        except httpx.HTTPError as e:
+            raise ProviderUnavailable(f"Proveedor OpenID no disponible: {type(e).__name__}") from e
+        if response.status_code >= 500:
+            raise ProviderUnavailable(f"Proveedor OpenID respondió {response.status_code}")
+        id_token = response.json().get("id_token") if response.status_code == 200 else None
+        if not id_token:
+            raise IdTokenError("Código de autorización inválido")
+        return id_token
+
+    async def run_forever(self):
+        """Renovar discovery y JWKS antes de que venzan, así nunca se descargan en una solicitud"""
+        while True:
+            try:
+                await self.refresh()
+                delay = max(self._expires_at - time.monotonic() - self.min_refresh_seconds, self.min_refresh_seconds)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Warning: OpenID refresh failed: {e}")
+                delay = self.min_refresh_seconds
+            await asyncio.sleep(delay)
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "issuer": self.metadata["issuer"] if self.metadata else None,
+            "keys": sorted(self._keys),
+            "expires_in_seconds": round(max(self._expires_at - time.monotonic(), 0.0)),
+            "fetches": self.fetches,
+            "last_error": self.last_error,
+        }
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class FakeIdentityProvider:
+    """Proveedor OpenID local para tests y benchmarks (sin red)"""
+
+    def __init__(self, client_id: str = "pasto-test-client", issuer: str = "https://idp.pasto.test",
+                 max_age_seconds: int = 3600):
+        self.client_id = client_id
+        self.issuer = issuer
+        self.max_age_seconds = max_age_seconds
+        self.metadata_url = f"{issuer}/.well-known/openid-configuration"
+        self.requests = {}
+        self._codes = {}
+        self._signing_keys = {}
+        self.rotate_key()
+
+    def rotate_key(self) -> str:
+        """Agregar una clave nueva y firmar con ella desde ahora"""
+        from cryptography.hazmat.primitives.asymmetric import rsa
+
+        self.kid = uuid.uuid4().hex[:16]
+        self._signing_keys[self.kid] = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+        return self.kid
+
+    def issue_id_token(self, sub: str, email: str, name: str = "", picture: Optional[str] = None, *,
+                       audience: Optional[str] = None, nonce: Optional[str] = None, expires_in: int = 3600,
+                       email_verified: bool = True) -> str:
+        now = int(time.time())
+        claims = {"iss": self.issuer, "aud": audience or self.client_id, "sub": sub, "email": email,
+                  "email_verified": email_verified, "name": name, "iat": now, "exp": now + expires_in}
+        if picture:
+            claims["picture"] = picture
+        if nonce:
+            claims["nonce"] = nonce
+        return jwt.encode(claims, self._signing_keys[self.kid], algorithm="RS256", headers={"kid": self.kid})
+
+    def issue_code(self, **claims) -> str:
+        """Código de autorización que el endpoint de token canjea por un ID token"""
+        code = uuid.uuid4().hex
+        self._codes[code] = self.issue_id_token(**claims)
+        return code
+
+    def _handle(self, request: httpx.Request) -> httpx.Response:
+        path = request.url.path
+        self.requests[path] = self.requests.get(path, 0) + 1
+        cache_headers = {"cache-control": f"public, max-age={self.max_age_seconds}"}
+        if path == "/.well-known/openid-configuration":
+            return httpx.Response(200, headers=cache_headers, json={
+                "issuer": self.issuer,
+                "jwks_uri": f"{self.issuer}/jwks",
+                "token_endpoint": f"{self.issuer}/token",
+                "authorization_endpoint": f"{self.issuer}/authorize",
+                "id_token_signing_alg_values_supported": SIGNING_ALGORITHMS,
+            })
+        if path == "/jwks":
+            keys = []
+            for kid, private_key in self._signing_keys.items():
+                key = json.loads(RSAAlgorithm.to_jwk(private_key.public_key()))
+                keys.append({**key, "kid": kid, "use": "sig", "alg": "RS256"})
+            return httpx.Response(200, headers=cache_headers, json={"keys": keys})
+        if path == "/token" and request.method == "POST":
+            form = dict(httpx.QueryParams(request.content.decode("utf-8")))
+            id_token = self._codes.pop(form.get("code"), None)
+            if id_token is None:
+                return httpx.Response(400, json={"error": "invalid_grant"})
+            return httpx.Response(200, json={"id_token": id_token, "token_type": "Bearer"})
+        return httpx.Response(404)
+
+    @property
+    def transport(self) -> httpx.MockTransport:
+        return httpx.MockTransport(self._handle)
+
+    def provider(self, **kwargs) -> OpenIDProvider:
+        """``OpenIDProvider`` apuntado a este proveedor"""
+        return OpenIDProvider(self.metadata_url, self.client_id, "secret", transport=self.transport, **kwargs)
+
+    @property
+    def outbound_requests(self) -> int:
+        return sum(self.requests.values())
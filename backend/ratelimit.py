@@ -0,0 +1,153 @@
+"""Rate limiting con token bucket para rutas costosas (bcrypt, SMS).
+
+Cada regla define la capacidad del bucket y cuántos tokens se reponen por
+segundo. La verificación se hace antes de cualquier trabajo caro; si el
+bucket está vacío la solicitud se rechaza con 429 y se cuenta como descartada.
+
+Backends:
+    InMemoryBackend  por proceso, sin dependencias
+    MongoBackend     compartido entre workers/hosts, una sola operación atómica
+"""
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from fastapi import HTTPException, Request, status
+from pymongo import ReturnDocument
+
+
+@dataclass(frozen=True)
+class RateLimitRule:
+    name: str
+    capacity: float
+    refill_per_second: float
+    cost: float = 1.0
+
+    def seconds_to_full(self) -> float:
+        return self.capacity / self.refill_per_second
+
+
+# Reglas por defecto
+LOGIN_PER_IP = RateLimitRule("login_ip", capacity=20, refill_per_second=20 / 60)
+LOGIN_PER_EMAIL = RateLimitRule("login_email", capacity=5, refill_per_second=5 / 300)
+REGISTER_PER_IP = RateLimitRule("register_ip", capacity=10, refill_per_second=10 / 3600)
+REGISTER_PER_EMAIL = RateLimitRule("register_email", capacity=3, refill_per_second=3 / 3600)
+SMS_PER_PHONE = RateLimitRule("sms_phone", capacity=3, refill_per_second=3 / 600)
+SMS_PER_IP = RateLimitRule("sms_ip", capacity=10, refill_per_second=10 / 3600)
+
+
+class InMemoryBackend:
+    """Buckets en memoria del proceso, con un máximo de claves (LRU)"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, rule: RateLimitRule, key: str) -> tuple:
+        """Consumir tokens. Devuelve (permitido, segundos hasta reintentar)"""
+        bucket_key = f"{rule.name}:{key}"
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(bucket_key, (rule.capacity, now))
+            tokens = min(rule.capacity, tokens + (now - updated_at) * rule.refill_per_second)
+            allowed = tokens >= rule.cost
+            if allowed:
+                tokens -= rule.cost
+            self._buckets[bucket_key] = (tokens, now)
+            if len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        if allowed:
+            return True, 0.0
+        return False, (rule.cost - tokens) / rule.refill_per_second
+
+
+class MongoBackend:
+    """Buckets compartidos en una colección de Mongo.
+
+    La recarga y el consumo se calculan en el servidor con un pipeline de
+    actualización, así que cada verificación es un único find_one_and_update.
+    Los buckets inactivos expiran por índice TTL.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+        self._indexes_ready = False
+
+    def ensure_indexes(self):
+        if not self._indexes_ready:
+            self.collection.create_index("expires_at", expireAfterSeconds=0)
+            self._indexes_ready = True
+
+    def consume(self, rule: RateLimitRule, key: str) -> tuple:
+        self.ensure_indexes()
+        now = time.time()
+        expires_at = datetime.utcnow() + timedelta(seconds=rule.seconds_to_full())
+        refilled = {
+            "$min": [
+                rule.capacity,
+                {"$add": [
+                    {"$ifNull": ["$tokens", rule.capacity]},
+                    {"$multiply": [{"$subtract": [now, {"$ifNull": ["$ts", now]}]}, rule.refill_per_second]}
+                ]}
+            ]
+        }
+        bucket = self.collection.find_one_and_update(
+            {"_id": f"{rule.name}:{key}"},
+            [
+                {"$set": {"tokens": refilled, "ts": now, "expires_at": expires_at}},
+                {"$set": {"allowed": {"$gte": ["$tokens", rule.cost]}}},
+                {"$set": {"tokens": {"$cond": ["$allowed", {"$subtract": ["$tokens", rule.cost]}, "$tokens"]}}},
+            ],
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        if bucket["allowed"]:
+            return True, 0.0
+        return False, (rule.cost - bucket["tokens"]) / rule.refill_per_second
+
+
+class RateLimiter:
+    def __init__(self, backend=None, enabled: bool = True):
+        self.backend = backend or InMemoryBackend()
+        self.enabled = enabled
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def _count(self, rule: RateLimitRule, outcome: str):
+        with self._lock:
+            counters = self._counters.setdefault(rule.name, {"allowed": 0, "shed": 0})
+            counters[outcome] += 1
+
+    def check(self, rule: RateLimitRule, key: str):
+        """Consumir un token o rechazar la solicitud con 429"""
+        if not self.enabled or not key:
+            return
+        allowed, retry_after = self.backend.consume(rule, key)
+        if allowed:
+            self._count(rule, "allowed")
+            return
+        self._count(rule, "shed")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Demasiados intentos. Intente nuevamente más tarde",
+            headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+        )
+
+    def stats(self) -> dict:
+        """Contadores de solicitudes permitidas y descartadas por regla"""
+        with self._lock:
+            return {name: dict(counters) for name, counters in self._counters.items()}
+
+
+def client_ip(request: Request) -> str:
+    """IP del cliente. Detrás de un proxy es la de X-Forwarded-For solo si el proxy
+    está en ``forwarded_allow_ips`` (ver launcher.py)"""
+    return request.client.host if request.client else ""
+
+
+def normalize_email(email: str) -> str:
+    return email.strip().lower()
@@ -0,0 +1,54 @@
+"""Lecturas en secundarios del replica set, con sesiones causales.
+
+Las lecturas pesadas que toleran datos apenas atrasados (listados de admin,
+historiales, búsqueda, estadísticas) van a ``secondary``: preferencia
+``secondaryPreferred`` con ``maxStalenessSeconds``, así nunca se lee de un
+secundario más atrasado que la cota y, sin secundarios sanos (o con un solo
+nodo en desarrollo), se lee del primario. Todo lo demás sigue en el primario.
+
+Leer lo propio después de escribir (una solicitud recién creada o aceptada
+en "mis solicitudes"/"mis trabajos") se garantiza con una sesión causal
+anclada en el primario: la primera lectura de la sesión es la versión del
+listado del usuario (``user_versions``, que create/accept incrementan), y
+su ``operationTime`` ya incluye esas escrituras. La lectura siguiente en el
+secundario lleva ``afterClusterTime`` y espera a que el secundario las haya
+replicado. No depende de memoria del proceso: funciona aunque la escritura
+la haya atendido otro worker.
+
+``python -m benchmarks.read_scaling`` lo verifica contra un replica set local.
+"""
+from contextlib import contextmanager
+from typing import Callable
+
+from pymongo.read_preferences import SecondaryPreferred
+
+# El servidor rechaza cotas menores (heartbeat + período de escritura en reposo)
+MIN_MAX_STALENESS_SECONDS = 90
+
+
+class ReadRouter:
+    def __init__(self, db: Callable, enabled: bool = False, max_staleness_seconds: int = MIN_MAX_STALENESS_SECONDS):
+        self._db = db
+        self.enabled = enabled
+        self.max_staleness_seconds = max(max_staleness_seconds, MIN_MAX_STALENESS_SECONDS)
+
+    @property
+    def primary(self):
+        return self._db()
+
+    @property
+    def secondary(self):
+        """Base para lecturas elegibles; el primario si el ruteo está desactivado"""
+        db = self._db()
+        if not self.enabled:
+            return db
+        return db.with_options(read_preference=SecondaryPreferred(max_staleness=self.max_staleness_seconds))
+
+    @contextmanager
+    def causal_session(self):
+        """Sesión causal para leer en el primario y luego en ``secondary``; None si está desactivado"""
+        if not self.enabled:
+            yield None
+            return
+        with self._db().client.start_session(causal_consistency=True) as session:
+            yield session
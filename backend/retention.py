@@ -0,0 +1,125 @@
+"""Retención de notificaciones.
+
+- Las notificaciones leídas vencen por índice TTL sobre ``read_at``.
+- Las no leídas más antiguas que el límite se archivan en lotes a archivos
+  NDJSON comprimidos con gzip y luego se eliminan de la colección.
+
+Así ``db.notifications`` queda acotada a lo que los usuarios realmente
+consultan (``get_notifications`` solo muestra las últimas 50).
+
+Las leídas antes de que existiera ``read_at`` lo reciben de
+``backfill_read_at`` (su ``created_at``); sin eso nunca vencerían.
+
+El archivado invalida el listado de cada usuario afectado. El borrado por
+TTL no pasa por la aplicación y no lo hace: un cliente puede seguir
+recibiendo 304 con notificaciones leídas que ya vencieron, hasta la próxima
+notificación o lectura de ese usuario. Se acepta porque solo afecta a
+notificaciones leídas hace más de ``read_ttl_days``.
+"""
+import gzip
+import os
+from datetime import datetime, timedelta
+
+from bson import json_util
+from pymongo import UpdateOne
+
+from maintenance import ensure_ttl_index
+from versions import NOTIFICATIONS, bump_versions
+
+
+def ensure_notification_indexes(db, read_ttl_days: int):
+    notifications = db.notifications
+    # Listado de get_notifications
+    notifications.create_index([("user_id", 1), ("created_at", -1)])
+    notifications.create_index("notification_id")
+    # Vencimiento de las leídas
+    ensure_ttl_index(notifications, "read_at", read_ttl_days * 86400)
+    # Búsqueda de no leídas antiguas para archivar
+    notifications.create_index(
+        "created_at",
+        name="unread_created_at",
+        partialFilterExpression={"read": False}
+    )
+
+
+def backfill_read_at(db, batch_size: int = 1000, max_batches: int = 1000) -> int:
+    """Completar ``read_at`` de las leídas que no lo tienen, por lotes"""
+    updated = 0
+    for _ in range(max_batches):
+        batch = list(db.notifications.find(
+            {"read": True, "read_at": {"$exists": False}}, {"created_at": 1}).limit(batch_size))
+        if not batch:
+            break
+        now = datetime.utcnow()
+        db.notifications.bulk_write([UpdateOne(
+            {"_id": doc["_id"], "read_at": {"$exists": False}},
+            {"$set": {"read_at": doc.get("created_at") or now}}
+        ) for doc in batch], ordered=False)
+        updated += len(batch)
+        if len(batch) < batch_size:
+            break
+    return updated
+
+
+def archive_unread_notifications(db, directory: str, older_than_days: int,
+                                 batch_size: int = 1000, max_batches: int = 50) -> dict:
+    """Archivar no leídas antiguas a NDJSON comprimido, por lotes"""
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    os.makedirs(directory, exist_ok=True)
+    archived = 0
+    files = []
+
+    for _ in range(max_batches):
+        batch = list(
+            db.notifications.find({"read": False, "created_at": {"$lt": cutoff}})
+            .sort("created_at", 1)
+            .limit(batch_size)
+        )
+        if not batch:
+            break
+
+        filename = f"notifications-{datetime.utcnow():%Y%m%dT%H%M%S}-{batch[0]['_id']}.ndjson.gz"
+        path = os.path.join(directory, filename)
+        # Escribir a un temporal y renombrar: nunca queda un archivo a medias
+        with gzip.open(path + ".tmp", "wt", encoding="utf-8") as archive:
+            for notification in batch:
+                archive.write(json_util.dumps(notification) + "\n")
+        os.replace(path + ".tmp", path)
+
+        # Solo se borra lo que quedó escrito en el archivo
+        result = db.notifications.delete_many({"_id": {"$in": [n["_id"] for n in batch]}})
+        archived += result.deleted_count
+        files.append(filename)
+        bump_versions(db, [n["user_id"] for n in batch], NOTIFICATIONS)
+
+        if len(batch) < batch_size:
+            break
+
+    return {"archived": archived, "files": files, "cutoff": cutoff}
+
+
+def notifications_report(db, archive_directory: str) -> dict:
+    """Tamaño de la colección de notificaciones y de los archivos archivados"""
+    try:
+        stats = db.command("collStats", "notifications")
+    except Exception:
+        stats = {}
+
+    oldest_unread = db.notifications.find_one({"read": False}, {"created_at": 1}, sort=[("created_at", 1)])
+
+    archive_files = []
+    if os.path.isdir(archive_directory):
+        archive_files = [name for name in os.listdir(archive_directory) if name.endswith(".ndjson.gz")]
+    archive_bytes = sum(os.path.getsize(os.path.join(archive_directory, name)) for name in archive_files)
+
+    return {
+        "documents": stats.get("count", db.notifications.estimated_document_count()),
+        "size_bytes": stats.get("size"),
+        "avg_document_bytes": stats.get("avgObjSize"),
+        "storage_bytes": stats.get("storageSize"),
+        "index_bytes": stats.get("totalIndexSize"),
+        "unread": db.notifications.count_documents({"read": False}),
+        "oldest_unread_at": oldest_unread["created_at"] if oldest_unread else None,
+        "archive_files": len(archive_files),
+        "archive_bytes": archive_bytes,
+    }
@@ -0,0 +1,185 @@
+"""Estadísticas agregadas de servicios para el panel de administración.
+
+Los contadores se mantienen con ``$inc`` en cada alta y cambio de estado:
+    service_stats   "totals": servicios por estado y tipo, ingresos
+                    "day:AAAA-MM-DD": altas por tipo, completados e ingresos del día
+    gardener_stats  un documento por jardinero con completados e ingresos
+
+Leer el panel cuesta lo mismo sin importar cuánta historia haya. Una tarea de
+conciliación reconstruye todo con un pipeline de agregación, sobre servicios
+activos y archivados, para corregir cualquier desvío.
+"""
+from datetime import datetime, timedelta
+
+from pymongo import ReplaceOne, UpdateOne
+
+TOTALS_ID = "totals"
+
+
+def _value(enum_or_str) -> str:
+    return getattr(enum_or_str, "value", enum_or_str)
+
+
+def day_id(moment: datetime) -> str:
+    return f"day:{moment:%Y-%m-%d}"
+
+
+def service_revenue(service: dict) -> float:
+    """Ingreso de un servicio completado: precio final o, si no hay, el estimado"""
+    if service.get("final_price") is not None:
+        return float(service["final_price"])
+    return float(service.get("estimated_price") or 0.0)
+
+
+def ensure_rollup_indexes(db):
+    db.gardener_stats.create_index([("completed", -1)])
+
+
+def record_service_created(db, service: dict):
+    status_value = _value(service["status"])
+    type_value = _value(service["service_type"])
+    db.service_stats.bulk_write([
+        UpdateOne({"_id": TOTALS_ID}, {"$inc": {
+            "services": 1,
+            f"status.{status_value}": 1,
+            f"type.{type_value}": 1,
+        }}, upsert=True),
+        UpdateOne({"_id": day_id(service["created_at"])}, {"$inc": {
+            "created": 1,
+            f"created_by_type.{type_value}": 1,
+        }}, upsert=True),
+    ], ordered=False)
+
+
+def record_status_change(db, before: dict, new_status, changed_at: datetime):
+    """Aplicar una transición de estado. ``before`` es el documento previo al cambio"""
+    old_value, new_value = _value(before["status"]), _value(new_status)
+    if old_value == new_value:
+        return
+
+    revenue = service_revenue(before)
+    totals_inc = {f"status.{old_value}": -1, f"status.{new_value}": 1}
+    operations = []
+
+    # Completar suma ingresos; salir de completado (corrección manual) los descuenta
+    sign = 1 if new_value == "completed" else -1 if old_value == "completed" else 0
+    if sign:
+        totals_inc["revenue"] = sign * revenue
+        totals_inc["completed"] = sign
+        completed_day = changed_at if sign > 0 else (before.get("completed_at") or changed_at)
+        operations.append(UpdateOne({"_id": day_id(completed_day)}, {"$inc": {
+            "completed": sign,
+            "revenue": sign * revenue,
+        }}, upsert=True))
+        if before.get("gardener_id"):
+            db.gardener_stats.update_one(
+                {"_id": before["gardener_id"]},
+                {"$inc": {"completed": sign, "revenue": sign * revenue},
+                 "$set": {"gardener_name": before.get("gardener_name")}},
+                upsert=True
+            )
+
+    operations.insert(0, UpdateOne({"_id": TOTALS_ID}, {"$inc": totals_inc}, upsert=True))
+    db.service_stats.bulk_write(operations, ordered=False)
+
+
+def read_dashboard(db, days: int = 30, top_gardeners: int = 10) -> dict:
+    """Panel: totales, serie diaria de los últimos días y ranking de jardineros"""
+    totals = db.service_stats.find_one({"_id": TOTALS_ID}) or {}
+    today = datetime.utcnow()
+    first_day = day_id(today - timedelta(days=days - 1))
+    daily = {
+        doc["_id"][4:]: doc
+        for doc in db.service_stats.find({"_id": {"$gte": first_day, "$lte": day_id(today)}})
+    }
+    series = []
+    for offset in range(days - 1, -1, -1):
+        day = f"{today - timedelta(days=offset):%Y-%m-%d}"
+        doc = daily.get(day, {})
+        series.append({
+            "day": day,
+            "created": doc.get("created", 0),
+            "created_by_type": doc.get("created_by_type", {}),
+            "completed": doc.get("completed", 0),
+            "revenue": round(doc.get("revenue", 0.0), 2),
+        })
+
+    gardeners = [
+        {"gardener_id": doc["_id"], "gardener_name": doc.get("gardener_name"),
+         "completed": doc.get("completed", 0), "revenue": round(doc.get("revenue", 0.0), 2)}
+        for doc in db.gardener_stats.find({}).sort("completed", -1).limit(top_gardeners)
+    ]
+
+    return {
+        "services": totals.get("services", 0),
+        "by_status": totals.get("status", {}),
+        "by_type": totals.get("type", {}),
+        "completed": totals.get("completed", 0),
+        "revenue": round(totals.get("revenue", 0.0), 2),
+        "reconciled_at": totals.get("reconciled_at"),
+        "daily": series,
+        "top_gardeners": gardeners,
+    }
+
+
+def reconcile_rollups(db) -> dict:
+    """Reconstruir todos los contadores desde services y services_archive"""
+    revenue_expr = {"$ifNull": ["$final_price", {"$ifNull": ["$estimated_price", 0]}]}
+    completed_day_expr = {"$dateToString": {"format": "%Y-%m-%d", "date": {"$ifNull": ["$completed_at", "$updated_at"]}}}
+    completed_only = {"$match": {"status": "completed"}}
+    pipeline = [
+        {"$unionWith": "services_archive"},
+        {"$facet": {
+            "by_status": [{"$group": {"_id": "$status", "count": {"$sum": 1}}}],
+            "by_type": [{"$group": {"_id": "$service_type", "count": {"$sum": 1}}}],
+            "created_by_day": [{"$group": {
+                "_id": {"day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}},
+                        "type": "$service_type"},
+                "count": {"$sum": 1},
+            }}],
+            "completed_by_day": [completed_only, {"$group": {
+                "_id": completed_day_expr, "count": {"$sum": 1}, "revenue": {"$sum": revenue_expr},
+            }}],
+            "gardeners": [completed_only, {"$match": {"gardener_id": {"$ne": None}}}, {"$group": {
+                "_id": "$gardener_id", "gardener_name": {"$last": "$gardener_name"},
+                "completed": {"$sum": 1}, "revenue": {"$sum": revenue_expr},
+            }}],
+        }},
+    ]
+    result = next(db.services.aggregate(pipeline, allowDiskUse=True))
+
+    now = datetime.utcnow()
+    completed_total = sum(row["count"] for row in result["completed_by_day"])
+    totals = {
+        "_id": TOTALS_ID,
+        "services": sum(row["count"] for row in result["by_status"]),
+        "status": {row["_id"]: row["count"] for row in result["by_status"]},
+        "type": {row["_id"]: row["count"] for row in result["by_type"]},
+        "completed": completed_total,
+        "revenue": sum(row["revenue"] for row in result["completed_by_day"]),
+        "reconciled_at": now,
+    }
+
+    days = {}
+    for row in result["created_by_day"]:
+        doc = days.setdefault(row["_id"]["day"], {"created": 0, "created_by_type": {}, "completed": 0, "revenue": 0.0})
+        doc["created"] += row["count"]
+        doc["created_by_type"][row["_id"]["type"]] = row["count"]
+    for row in result["completed_by_day"]:
+        doc = days.setdefault(row["_id"], {"created": 0, "created_by_type": {}, "completed": 0, "revenue": 0.0})
+        doc["completed"] = row["count"]
+        doc["revenue"] = row["revenue"]
+
+    operations = [ReplaceOne({"_id": TOTALS_ID}, totals, upsert=True)]
+    operations += [ReplaceOne({"_id": f"day:{day}"}, {"_id": f"day:{day}", **doc}, upsert=True)
+                   for day, doc in days.items()]
+    db.service_stats.bulk_write(operations, ordered=False)
+    # Días que ya no tienen servicios (p. ej. usuarios eliminados)
+    db.service_stats.delete_many({"_id": {"$regex": "^day:", "$nin": [f"day:{day}" for day in days]}})
+
+    gardener_ops = [ReplaceOne({"_id": row["_id"]}, row, upsert=True) for row in result["gardeners"]]
+    if gardener_ops:
+        db.gardener_stats.bulk_write(gardener_ops, ordered=False)
+    db.gardener_stats.delete_many({"_id": {"$nin": [row["_id"] for row in result["gardeners"]]}})
+
+    return {"services": totals["services"], "days": len(days), "gardeners": len(gardener_ops)}
@@ -0,0 +1,134 @@
+"""Planificación de la ruta diaria de un jardinero.
+
+Con la matriz de distancias haversine (calculada de una vez con numpy) se
+arma un recorrido abierto por vecino más cercano y se mejora con 2-opt:
+invertir un tramo del recorrido si eso acorta el total, hasta que ninguna
+inversión mejore. Cada pasada de 2-opt evalúa todos los cortes posibles de
+un extremo con operaciones vectorizadas, así 30 paradas se resuelven en
+pocos milisegundos (``python -m benchmarks.route_planning``).
+
+El orden minimiza distancia; los horarios programados solo se respetan al
+calcular las ETAs (si se llega antes, se espera).
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_matrix(latitudes, longitudes) -> np.ndarray:
+    """Distancias en km entre todos los pares de puntos"""
+    lat = np.radians(np.asarray(latitudes, dtype=float))
+    lng = np.radians(np.asarray(longitudes, dtype=float))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def nearest_neighbour(distances: np.ndarray, start: int = 0) -> list:
+    size = len(distances)
+    visited = np.zeros(size, dtype=bool)
+    order = [start]
+    visited[start] = True
+    for _ in range(size - 1):
+        candidates = np.where(visited, np.inf, distances[order[-1]])
+        following = int(np.argmin(candidates))
+        order.append(following)
+        visited[following] = True
+    return order
+
+
+def path_length(order: list, distances: np.ndarray) -> float:
+    route = np.asarray(order)
+    return float(distances[route[:-1], route[1:]].sum())
+
+
+def two_opt(order: list, distances: np.ndarray, max_passes: int = 50) -> list:
+    """Mejorar un recorrido abierto que empieza en ``order[0]`` (fijo)"""
+    route = np.asarray(order)
+    size = len(route)
+    if size < 4:
+        return list(route)
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, size - 1):
+            # Invertir route[i..j]: cambian las aristas (i-1, i) y (j, j+1)
+            a, b = route[i - 1], route[i]
+            j = np.arange(i + 1, size)
+            c = route[j]
+            removed = distances[a, b] + np.where(j + 1 < size, distances[c, route[np.minimum(j + 1, size - 1)]], 0.0)
+            added = distances[a, c] + np.where(j + 1 < size, distances[b, route[np.minimum(j + 1, size - 1)]], 0.0)
+            delta = added - removed
+            best = int(np.argmin(delta))
+            if delta[best] < -1e-9:
+                end = int(j[best])
+                route[i:end + 1] = route[i:end + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return list(route)
+
+
+def plan_route(stops: list, start: Optional[tuple] = None, start_time: Optional[datetime] = None,
+               speed_kmh: float = 30.0) -> dict:
+    """Ordenar paradas ``{"latitude", "longitude", "estimated_duration", ...}`` y calcular ETAs.
+
+    ``start`` es (lat, lng) del punto de partida; si falta, se parte de la
+    parada más alejada del centro (un extremo, buen inicio para un
+    recorrido abierto).
+    """
+    if not stops:
+        return {"stops": [], "total_km": 0.0, "nearest_neighbour_km": 0.0, "travel_minutes": 0, "finish_at": start_time}
+
+    latitudes = [stop["latitude"] for stop in stops]
+    longitudes = [stop["longitude"] for stop in stops]
+    if start is not None:
+        latitudes.insert(0, start[0])
+        longitudes.insert(0, start[1])
+    distances = haversine_matrix(latitudes, longitudes)
+
+    if start is not None:
+        first = 0
+    else:
+        center_lat, center_lng = float(np.mean(latitudes)), float(np.mean(longitudes))
+        first = int(np.argmax(haversine_matrix(latitudes + [center_lat], longitudes + [center_lng])[-1, :-1]))
+
+    initial = nearest_neighbour(distances, first)
+    order = two_opt(initial, distances)
+
+    offset = 1 if start is not None else 0
+    clock = start_time or datetime.utcnow()
+    planned = []
+    total_travel_minutes = 0.0
+    previous = order[0]
+    for index in order[offset:]:
+        stop = stops[index - offset]
+        travel_km = float(distances[previous, index]) if index != previous else 0.0
+        travel_minutes = travel_km / speed_kmh * 60
+        total_travel_minutes += travel_minutes
+        arrival = clock + timedelta(minutes=travel_minutes)
+        # Si está programado más tarde, esperar a la hora pactada
+        scheduled = stop.get("scheduled_date")
+        begins = max(arrival, scheduled) if scheduled else arrival
+        clock = begins + timedelta(minutes=stop.get("estimated_duration") or 0)
+        planned.append({
+            **stop,
+            "order": len(planned) + 1,
+            "travel_km": round(travel_km, 2),
+            "eta": arrival,
+            "start_at": begins,
+            "finish_at": clock,
+        })
+        previous = index
+
+    return {
+        "stops": planned,
+        "total_km": round(path_length(order, distances), 2),
+        "nearest_neighbour_km": round(path_length(initial, distances), 2),
+        "travel_minutes": round(total_travel_minutes),
+        "finish_at": clock,
+    }
@@ -0,0 +1,165 @@
+"""Despacho de servicios programados (no inmediatos).
+
+Un servicio con ``scheduled_date`` se crea con ``released: False`` y no
+aparece en ``available`` hasta ``release_lead`` antes de la fecha. Una vez
+aceptado, el jardinero y el cliente reciben un recordatorio
+``reminder_lead`` antes.
+
+Cada worker mantiene un heap con los eventos de las próximas
+``horizon`` horas. El heap se recarga cada ``refresh_seconds`` con
+consultas por rango sobre índices parciales de ``scheduled_date``, que solo
+contienen servicios programados, nunca recorriendo ``db.services``. Varios
+workers pueden tener el mismo evento: cada uno se reclama con un
+``find_one_and_update`` condicional y solo el que gana notifica.
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+
+from pymongo import ReturnDocument
+
+RELEASE = "release"
+REMINDER = "reminder"
+
+
+def ensure_scheduler_indexes(db):
+    db.services.create_index(
+        "scheduled_date", name="scheduled_unreleased", partialFilterExpression={"released": False})
+    db.services.create_index(
+        "scheduled_date", name="scheduled_services", partialFilterExpression={"is_immediate": False})
+
+
+def to_utc_naive(moment: Optional[datetime]) -> Optional[datetime]:
+    """Las fechas se guardan en UTC sin zona, como el resto de la base"""
+    if moment is not None and moment.tzinfo is not None:
+        return moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return moment
+
+
+def is_released_on_create(scheduled_date: Optional[datetime], is_immediate: bool,
+                          release_lead: timedelta, now: datetime) -> bool:
+    return is_immediate or scheduled_date is None or scheduled_date - release_lead <= now
+
+
+class ServiceScheduler:
+    name = "service_scheduler"
+
+    def __init__(self, db: Callable, on_release: Callable[[dict], None], on_reminder: Callable[[dict], None], *,
+                 release_lead: timedelta, reminder_lead: timedelta, horizon: timedelta,
+                 refresh_seconds: float = 60):
+        self._db = db
+        self.on_release = on_release
+        self.on_reminder = on_reminder
+        self.release_lead = release_lead
+        self.reminder_lead = reminder_lead
+        self.horizon = horizon
+        self.refresh_seconds = refresh_seconds
+        self._heap = []
+        self._pending = set()
+        self._sequence = itertools.count()
+        self.last_load_at: Optional[datetime] = None
+        self.fired = {RELEASE: 0, REMINDER: 0}
+        self.last_error: Optional[str] = None
+
+    def _push(self, when: datetime, kind: str, service_id: str):
+        if (kind, service_id) not in self._pending:
+            self._pending.add((kind, service_id))
+            heapq.heappush(self._heap, (when, next(self._sequence), kind, service_id))
+
+    def load(self, now: Optional[datetime] = None):
+        """Cargar los eventos de la ventana [ahora, ahora + horizon)"""
+        db = self._db()
+        now = now or datetime.utcnow()
+        window_end = now + self.horizon
+
+        # Sin cota inferior: también los que quedaron atrasados con el proceso caído
+        for service in db.services.find(
+            {"released": False, "status": "pending", "scheduled_date": {"$lt": window_end + self.release_lead}},
+            {"service_id": 1, "scheduled_date": 1}
+        ):
+            self._push(service["scheduled_date"] - self.release_lead, RELEASE, service["service_id"])
+
+        for service in db.services.find(
+            {"is_immediate": False, "scheduled_date": {"$gte": now, "$lt": window_end + self.reminder_lead},
+             "status": "accepted", "reminder_sent_at": None},
+            {"service_id": 1, "scheduled_date": 1}
+        ):
+            self._push(service["scheduled_date"] - self.reminder_lead, REMINDER, service["service_id"])
+
+        self.last_load_at = now
+
+    def pop_due(self, now: datetime) -> list:
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, kind, service_id = heapq.heappop(self._heap)
+            self._pending.discard((kind, service_id))
+            due.append((kind, service_id))
+        return due
+
+    def fire(self, kind: str, service_id: str, now: Optional[datetime] = None) -> bool:
+        """Reclamar el evento; False si otro worker ya lo hizo o el servicio cambió"""
+        db = self._db()
+        now = now or datetime.utcnow()
+        if kind == RELEASE:
+            # Solo pendientes: uno cancelado antes de publicarse no se publica
+            service = db.services.find_one_and_update(
+                {"service_id": service_id, "released": False, "status": "pending"},
+                {"$set": {"released": True, "released_at": now}},
+                return_document=ReturnDocument.AFTER
+            )
+            callback = self.on_release
+        else:
+            service = db.services.find_one_and_update(
+                {"service_id": service_id, "status": "accepted", "reminder_sent_at": None},
+                {"$set": {"reminder_sent_at": now}},
+                return_document=ReturnDocument.AFTER
+            )
+            callback = self.on_reminder
+        if service is None:
+            return False
+        callback(service)
+        self.fired[kind] += 1
+        return True
+
+    def run_once(self, now: Optional[datetime] = None) -> int:
+        """Recargar y disparar lo vencido (síncrono; scripts y tests)"""
+        now = now or datetime.utcnow()
+        self.load(now)
+        due = self.pop_due(now)
+        return sum(self.fire(kind, service_id, now) for kind, service_id in due)
+
+    async def run_forever(self):
+        next_load = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_load:
+                    await asyncio.to_thread(self.load)
+                    next_load = time.monotonic() + self.refresh_seconds
+                for kind, service_id in self.pop_due(datetime.utcnow()):
+                    await asyncio.to_thread(self.fire, kind, service_id)
+                self.last_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e)
+                print(f"Warning: service scheduler failed: {e}")
+
+            # Dormir hasta el próximo evento o la próxima recarga
+            sleep_seconds = max(next_load - time.monotonic(), 0.0)
+            if self._heap:
+                until_next = (self._heap[0][0] - datetime.utcnow()).total_seconds()
+                sleep_seconds = min(sleep_seconds, max(until_next, 0.0))
+            await asyncio.sleep(max(sleep_seconds, 0.05))
+
+    def status(self) -> dict:
+        return {
+            "name": self.name,
+            "pending_events": len(self._heap),
+            "next_event_at": self._heap[0][0] if self._heap else None,
+            "last_load_at": self.last_load_at,
+            "fired": dict(self.fired),
+            "last_error": self.last_error,
+        }
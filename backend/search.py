@@ -0,0 +1,180 @@
+"""Búsqueda de servicios y usuarios.
+
+- Texto completo: índices de texto de Mongo sobre ``address``/``notes`` de
+  servicios y ``full_name`` de usuarios, ordenados por relevancia.
+- Autocompletado: cada servicio guarda los tokens normalizados (minúsculas,
+  sin acentos) de su dirección en un arreglo indexado, y cada usuario su
+  email normalizado.
+  Un prefijo se resuelve con una expresión regular anclada (``^prefijo``),
+  que Mongo convierte en un rango sobre el índice en vez de recorrer la
+  colección.
+
+Los resultados se proyectan a pocos campos y se paginan con skip/limit
+acotados (el orden por relevancia no admite paginar por cursor).
+"""
+import re
+import unicodedata
+from typing import Optional
+
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import OperationFailure
+
+from servicedocs import expand_service
+
+MAX_PAGE_SIZE = 50
+MAX_SKIP = 1000
+MIN_PREFIX_LENGTH = 2
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+BACKFILL_ID = "search_fields"
+
+SERVICE_SEARCH_PROJECTION = {
+    "_id": 0,
+    "service_id": 1,
+    "service_type": 1,
+    "status": 1,
+    "address": 1,
+    "client_name": 1,
+    "gardener_name": 1,
+    "estimated_price": 1,
+    "scheduled_date": 1,
+    "created_at": 1,
+}
+USER_SEARCH_PROJECTION = {
+    "_id": 0,
+    "user_id": 1,
+    "email": 1,
+    "full_name": 1,
+    "role": 1,
+    "is_active": 1,
+}
+
+
+def normalize_text(text: str) -> str:
+    """Minúsculas y sin acentos: "Córdoba" -> "cordoba\""""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).lower()
+
+
+def tokenize(text: str) -> list:
+    tokens = re.findall(r"\w+", normalize_text(text))
+    return list(dict.fromkeys(token for token in tokens if len(token) >= MIN_PREFIX_LENGTH))
+
+
+def service_search_fields(address: str) -> dict:
+    return {"address_tokens": tokenize(address)}
+
+
+def user_search_fields(email: str) -> dict:
+    return {"email_normalized": normalize_text(email).strip()}
+
+
+def ensure_search_indexes(db):
+    db.services.create_index(
+        [("address", "text"), ("notes", "text")],
+        name="services_text",
+        default_language="spanish",
+        weights={"address": 3, "notes": 1}
+    )
+    db.services.create_index("address_tokens")
+    db.users.create_index([("full_name", "text")], name="users_text", default_language="spanish")
+    db.users.create_index("email_normalized")
+    # Tokens de nombre de usuarios: ninguna consulta los usaba
+    try:
+        db.users.drop_index("search_tokens_1")
+    except OperationFailure:
+        pass
+
+
+def backfill_search_fields(db, batch_size: int = 500, max_batches: int = 200) -> dict:
+    """Completar los tokens de documentos creados antes de la búsqueda, por lotes.
+    Una vez terminado queda registrado y no vuelve a recorrer las colecciones"""
+    if db[MIGRATIONS_COLLECTION].find_one({"_id": BACKFILL_ID, "finished_at": {"$ne": None}}):
+        return {"skipped": True}
+    updated = {"services": 0, "users": 0}
+    complete = True
+    targets = [
+        ("services", "address_tokens", {"address": 1}, lambda doc: service_search_fields(doc.get("address", ""))),
+        ("users", "email_normalized", {"email": 1}, lambda doc: user_search_fields(doc.get("email", ""))),
+    ]
+    for collection_name, field, projection, fields_for in targets:
+        collection = db[collection_name]
+        for _ in range(max_batches):
+            batch = list(collection.find({field: {"$exists": False}}, projection).limit(batch_size))
+            if not batch:
+                break
+            collection.bulk_write([UpdateOne({"_id": doc["_id"]}, {"$set": fields_for(doc)}) for doc in batch],
+                                  ordered=False)
+            updated[collection_name] += len(batch)
+            if len(batch) < batch_size:
+                break
+        else:
+            complete = False
+    db.users.update_many({"search_tokens": {"$exists": True}}, {"$unset": {"search_tokens": ""}})
+    db[MIGRATIONS_COLLECTION].update_one({"_id": BACKFILL_ID}, {"$set": {
+        "updated": updated, "finished_at": datetime.utcnow() if complete else None}}, upsert=True)
+    return updated
+
+
+def _page(cursor, limit: int, skip: int) -> dict:
+    limit = min(max(limit, 1), MAX_PAGE_SIZE)
+    skip = min(max(skip, 0), MAX_SKIP)
+    # Uno de más para saber si hay otra página sin contar
+    items = list(cursor.skip(skip).limit(limit + 1))
+    return {"items": items[:limit], "limit": limit, "skip": skip, "has_more": len(items) > limit}
+
+
+def search_services(db, text: str, scope: Optional[dict] = None, limit: int = 20, skip: int = 0) -> dict:
+    """Servicios por relevancia en dirección y notas; ``scope`` restringe (p. ej. client_id)"""
+    query = {"$text": {"$search": text}, **(scope or {})}
+    cursor = db.services.find(query, {**SERVICE_SEARCH_PROJECTION, "score": {"$meta": "textScore"}}).sort(
+        [("score", {"$meta": "textScore"})])
+    page = _page(cursor, limit, skip)
+    # Los nulos no se guardan: completar los campos proyectados
+    page["items"] = [expand_service(item, SERVICE_SEARCH_PROJECTION) for item in page["items"]]
+    return page
+
+
+def search_users(db, text: str, limit: int = 20, skip: int = 0) -> dict:
+    """Usuarios por nombre; si el texto parece un email, por prefijo de email"""
+    if "@" in text:
+        cursor = db.users.find(
+            {"email_normalized": {"$regex": f"^{re.escape(normalize_text(text.strip()))}"}},
+            USER_SEARCH_PROJECTION
+        ).sort("email_normalized", 1)
+    else:
+        cursor = db.users.find(
+            {"$text": {"$search": text}},
+            {**USER_SEARCH_PROJECTION, "score": {"$meta": "textScore"}}
+        ).sort([("score", {"$meta": "textScore"})])
+    return _page(cursor, limit, skip)
+
+
+def autocomplete_addresses(db, prefix: str, scope: Optional[dict] = None, limit: int = 10) -> list:
+    """Direcciones distintas con alguna palabra que empieza con ``prefix``"""
+    tokens = tokenize(prefix)
+    if not tokens:
+        return []
+    # Todas las palabras menos la última están completas; la última es el prefijo
+    query = {"address_tokens": {"$regex": f"^{re.escape(tokens[-1])}"}, **(scope or {})}
+    if len(tokens) > 1:
+        query["address_tokens"] = {"$all": tokens[:-1], **query["address_tokens"]}
+    suggestions = []
+    for service in db.services.find(query, {"_id": 0, "address": 1}).limit(limit * 5):
+        if service["address"] not in suggestions:
+            suggestions.append(service["address"])
+            if len(suggestions) == limit:
+                break
+    return suggestions
+
+
+def autocomplete_emails(db, prefix: str, limit: int = 10) -> list:
+    normalized = normalize_text(prefix.strip())
+    if len(normalized) < MIN_PREFIX_LENGTH:
+        return []
+    return list(db.users.find(
+        {"email_normalized": {"$regex": f"^{re.escape(normalized)}"}},
+        {"_id": 0, "user_id": 1, "email": 1, "full_name": 1}
+    ).sort("email_normalized", 1).limit(limit))
@@ -1,14 +1,14 @@
-from fastapi import FastAPI, HTTPException, Depends, status, UploadFile, File, Request
+from fastapi import APIRouter, FastAPI, HTTPException, Depends, status, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from fastapi.responses import PlainTextResponse, Response
 from fastapi.staticfiles import StaticFiles
-from starlette.middleware.sessions import SessionMiddleware
-from pymongo import MongoClient
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from pymongo.database import Database
 from pydantic import BaseModel, Field
 from typing import Optional, List
-from authlib.integrations.starlette_client import OAuth
-from twilio.rest import Client as TwilioClient
-from twilio.base.exceptions import TwilioException
+from contextlib import asynccontextmanager
 import os
 import uuid
 from datetime import datetime, timedelta
@@ -18,53 +18,56 @@ from enum import Enum
 import base64
 import json
 import re
+import asyncio
 
-# Configuración de la aplicación
-app = FastAPI(title="PASTO! API", version="2.0.0")
-
-# Configuración CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+from config import Settings
+from metrics import MetricsMiddleware
+from encoding import ApiResponse, Compressor, EncodingMiddleware
+from dependencies import AppDependencies, get_db, get_deps, get_queue, get_rate_limiter, get_secondary_db
+from maintenance import LeaseLock, PeriodicJob
+from retention import archive_unread_notifications, backfill_read_at, notifications_report
+from archival import archive_terminal_services, find_services_history
+from jobqueue import DEAD, STATES, JobQueue
+from sms import SmsProviderError, SmsUnavailable
+from oidc import IdTokenError, ProviderUnavailable
+from versions import NOTIFICATIONS, SERVICES, bump_versions, etag_matches, list_etag, read_version
+from scheduler import ServiceScheduler, is_released_on_create, to_utc_naive
+from routing import plan_route
+from accounts import insert_account, new_gardener_profile, upsert_google_account
+from userdeletion import DONE as DELETION_DONE, run_user_deletion, start_user_deletion
+from servicedocs import (
+    MIGRATION_ID,
+    MIGRATIONS_COLLECTION,
+    compact_service,
+    expand_service,
+    migrate_service_documents,
+    storage_projection,
+    storage_report,
 )
-
-# Middleware para sesiones (necesario para OAuth)
-app.add_middleware(SessionMiddleware, secret_key=os.environ.get('JWT_SECRET', 'pasto_secret_key_2024'))
-
-# Configuración de OAuth
-oauth = OAuth()
-oauth.register(
-    name='google',
-    client_id=os.environ.get('GOOGLE_CLIENT_ID'),
-    client_secret=os.environ.get('GOOGLE_CLIENT_SECRET'),
-    server_metadata_url='https://accounts.google.com/.well-known/openid_configuration',
-    client_kwargs={
-        'scope': 'openid email profile'
-    }
+from heatmap import (
+    MIN_PRECISION,
+    STORAGE_PRECISION,
+    reconcile_demand_tiles,
+    record_tile_created,
+    record_tile_released,
+    record_tile_status_change,
+    tiles_in_bounds,
+)
+from search import (
+    autocomplete_addresses,
+    autocomplete_emails,
+    backfill_search_fields,
+    search_services,
+    search_users,
+    service_search_fields,
+    user_search_fields,
+)
+from idempotency import IDEMPOTENCY_HEADER, IdempotencyKey, fingerprint, idempotency_key_id
+from rollups import read_dashboard, reconcile_rollups, record_service_created, record_status_change
+from ratelimit import (
+    LOGIN_PER_EMAIL, LOGIN_PER_IP, REGISTER_PER_EMAIL, REGISTER_PER_IP, SMS_PER_IP, SMS_PER_PHONE,
+    RateLimiter, client_ip, normalize_email,
 )
-
-# Configuración de Twilio (opcional para desarrollo local)
-twilio_client = None
-TWILIO_VERIFY_SERVICE_SID = os.environ.get('TWILIO_VERIFY_SERVICE_SID')
-
-# Inicializar Twilio solo si las credenciales están disponibles
-if os.environ.get('TWILIO_ACCOUNT_SID') and os.environ.get('TWILIO_AUTH_TOKEN'):
-    try:
-        twilio_client = TwilioClient(
-            os.environ.get('TWILIO_ACCOUNT_SID'),
-            os.environ.get('TWILIO_AUTH_TOKEN')
-        )
-    except Exception as e:
-        print(f"Warning: Could not initialize Twilio client: {e}")
-        twilio_client = None
-
-# Configuración de la base de datos
-MONGO_URL = os.environ.get('MONGO_URL', 'mongodb://localhost:27017/')
-client = MongoClient(MONGO_URL)
-db = client.pasto_db
 
 # Configuración JWT
 JWT_SECRET = os.environ.get('JWT_SECRET', 'pasto_secret_key_2024')
@@ -74,9 +77,8 @@ ACCESS_TOKEN_EXPIRE_HOURS = 24
 # Security
 security = HTTPBearer()
 
-# Crear directorio para uploads si no existe
-os.makedirs("uploads", exist_ok=True)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Las rutas se registran en un router; create_app() arma la aplicación
+router = APIRouter()
 
 # Enums
 class UserRole(str, Enum):
@@ -109,6 +111,7 @@ class NotificationType(str, Enum):
     SERVICE_COMPLETED = "service_completed"
     NEW_SERVICE_AVAILABLE = "new_service_available"
     GARDENER_ON_WAY = "gardener_on_way"
+    SERVICE_REMINDER = "service_reminder"
 
 class AuthProvider(str, Enum):
     EMAIL = "email"
@@ -123,7 +126,10 @@ class UserRegistration(BaseModel):
     phone: Optional[str] = None
 
 class GoogleAuthRequest(BaseModel):
-    code: str
+    # ID token del cliente (Google Identity Services) o código de autorización
+    id_token: Optional[str] = None
+    code: Optional[str] = None
+    redirect_uri: str = "postmessage"
     role: UserRole
 
 class PhoneVerificationRequest(BaseModel):
@@ -257,7 +263,7 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     encoded_jwt = jwt.encode(to_encode, JWT_SECRET, algorithm=JWT_ALGORITHM)
     return encoded_jwt
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Database = Depends(get_db)):
     try:
         payload = jwt.decode(credentials.credentials, JWT_SECRET, algorithms=[JWT_ALGORITHM])
         user_id: str = payload.get("sub")
@@ -274,6 +280,12 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
                 detail="Usuario no encontrado",
                 headers={"WWW-Authenticate": "Bearer"},
             )
+        if not user.get("is_active", True):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Usuario desactivado",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
         return user
     except jwt.PyJWTError:
         raise HTTPException(
@@ -282,7 +294,28 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def send_notification(user_id: str, notification_type: NotificationType, title: str, message: str, data: dict = {}):
+def get_idempotency_key(
+    request: Request,
+    current_user: dict = Depends(get_current_user),
+    deps: AppDependencies = Depends(get_deps)
+):
+    """Clave de idempotencia del header; se libera si el handler no llega a guardar respuesta"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        yield IdempotencyKey()
+        return
+    
+    idempotency = IdempotencyKey(
+        deps.db.idempotency_keys,
+        idempotency_key_id(current_user["user_id"], request.method, request.url.path, key),
+        ttl_seconds=deps.settings.idempotency_ttl_seconds
+    )
+    try:
+        yield idempotency
+    finally:
+        idempotency.release()
+
+def send_notification(db: Database, user_id: str, notification_type: NotificationType, title: str, message: str, data: dict = {}):
     """Enviar notificación a un usuario"""
     notification = {
         "notification_id": str(uuid.uuid4()),
@@ -295,8 +328,28 @@ def send_notification(user_id: str, notification_type: NotificationType, title:
         "created_at": datetime.utcnow()
     }
     db.notifications.insert_one(notification)
+    bump_versions(db, [user_id], NOTIFICATIONS)
     return notification
 
+def enqueue_new_service_available(queue: JobQueue, service: dict):
+    """Avisar a los jardineros disponibles que hay un servicio nuevo"""
+    return queue.enqueue("notify_available_gardeners", {
+        "type": NotificationType.NEW_SERVICE_AVAILABLE,
+        "title": "¡Nuevo trabajo disponible!",
+        "message": f"Nuevo servicio de {ServiceType(service['service_type'])} en {service['address']}",
+        "data": {"service_id": service["service_id"]}
+    })
+
+def enqueue_notification(queue: JobQueue, user_id: str, notification_type: NotificationType, title: str, message: str, data: dict = {}):
+    """Encolar una notificación; la escribe un worker de la cola"""
+    return queue.enqueue("send_notification", {
+        "user_id": user_id,
+        "type": notification_type,
+        "title": title,
+        "message": message,
+        "data": data
+    })
+
 def calculate_service_price(service_type: ServiceType, terrain_width: float, terrain_length: float, 
                           pruning_difficulty: Optional[PruningDifficulty] = None) -> dict:
     """Calcular precio estimado y duración del servicio"""
@@ -346,7 +399,7 @@ def calculate_service_price(service_type: ServiceType, terrain_width: float, ter
         "area_calculated": area
     }
 
-def update_user_rating(user_id: str, new_rating: int):
+def update_user_rating(db: Database, user_id: str, new_rating: int):
     """Actualizar rating promedio del usuario"""
     user = db.users.find_one({"user_id": user_id})
     if user:
@@ -367,7 +420,7 @@ def validate_phone_number(phone: str) -> bool:
     pattern = r'^\+[1-9]\d{1,14}$'
     return re.match(pattern, phone) is not None
 
-def send_sms_verification(phone_number: str) -> dict:
+def send_sms_verification(deps: AppDependencies, phone_number: str, requester_ip: Optional[str] = None) -> dict:
     """Enviar código de verificación SMS"""
     if not validate_phone_number(phone_number):
         raise HTTPException(
@@ -375,88 +428,63 @@ def send_sms_verification(phone_number: str) -> dict:
             detail="Formato de número de teléfono inválido. Use formato E.164 (+1234567890)"
         )
     
+    # Limitar intentos antes de gastar en SMS
+    if requester_ip:
+        deps.rate_limiter.check(SMS_PER_IP, requester_ip)
+    deps.rate_limiter.check(SMS_PER_PHONE, phone_number)
+    
     # Para desarrollo local, simular envío de SMS
-    if not twilio_client or not TWILIO_VERIFY_SERVICE_SID:
-        # Simular verificación para desarrollo
-        db.phone_verifications.insert_one({
-            "phone_number": phone_number,
-            "status": "pending",
-            "created_at": datetime.utcnow(),
-            "verified": False,
-            "code": "123456"  # Código fijo para desarrollo
-        })
-        return {"status": "pending", "phone_number": phone_number, "message": "Código de verificación simulado: 123456"}
+    simulated_code = deps.sms.local_code
+    if simulated_code is not None:
+        deps.verifications.start(phone_number, "pending", code=simulated_code)
+        return {"status": "pending", "phone_number": phone_number, "message": f"Código de verificación simulado: {simulated_code}"}
     
-    try:
-        verification = twilio_client.verify.services(TWILIO_VERIFY_SERVICE_SID).verifications.create(
-            to=phone_number,
-            channel='sms'
-        )
-        
-        # Guardar intento de verificación en la base de datos
-        db.phone_verifications.insert_one({
-            "phone_number": phone_number,
-            "status": verification.status,
-            "created_at": datetime.utcnow(),
-            "verified": False
-        })
-        
-        return {"status": verification.status, "phone_number": phone_number}
-    except TwilioException as e:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Error al enviar SMS: {str(e)}"
-        )
+    # Guardar intento de verificación (un documento por número); el proveedor se llama desde la cola
+    deps.verifications.start(phone_number, "pending")
+    deps.queue.enqueue("sms_verification", {"phone_number": phone_number})
+    
+    return {"status": "pending", "phone_number": phone_number}
+
+async def deliver_sms_verification(deps: AppDependencies, phone_number: str) -> dict:
+    """Pedir al proveedor el envío del código (trabajo de la cola; un error reintenta)"""
+    return {"status": await deps.sms.start_verification(phone_number)}
 
-def verify_sms_code(phone_number: str, code: str) -> bool:
+async def verify_sms_code(deps: AppDependencies, phone_number: str, code: str) -> bool:
     """Verificar código SMS"""
-    # Para desarrollo local, aceptar código 123456
-    if not twilio_client or not TWILIO_VERIFY_SERVICE_SID:
-        verification = db.phone_verifications.find_one({
-            "phone_number": phone_number,
-            "verified": False
-        })
-        
-        if verification and code == "123456":
-            db.phone_verifications.update_one(
-                {"phone_number": phone_number, "verified": False},
-                {"$set": {"verified": True, "verified_at": datetime.utcnow()}}
-            )
-            
-            # Actualizar usuario si existe
-            db.users.update_one(
-                {"phone": phone_number},
-                {"$set": {"phone_verified": True}}
-            )
-            return True
-        return False
+    provider = deps.sms
+    verifications = deps.verifications
     
-    try:
-        check = twilio_client.verify.services(TWILIO_VERIFY_SERVICE_SID).verification_checks.create(
-            to=phone_number,
-            code=code
-        )
-        
-        is_valid = check.status == "approved"
-        
-        # Actualizar estado de verificación
-        if is_valid:
-            db.phone_verifications.update_one(
-                {"phone_number": phone_number, "verified": False},
-                {"$set": {"verified": True, "verified_at": datetime.utcnow()}}
-            )
-            
-            # Actualizar usuario si existe
-            db.users.update_one(
-                {"phone": phone_number},
-                {"$set": {"phone_verified": True}}
+    # Para desarrollo local, el código se verifica contra el guardado
+    if provider.local_code is not None:
+        is_valid = verifications.check_and_consume(phone_number, code)
+    else:
+        # Cortar antes de llamar al proveedor si el intento venció o se agotaron los intentos
+        if not verifications.register_attempt(phone_number):
+            return False
+        try:
+            is_valid = await provider.check_verification(phone_number, code)
+        except SmsUnavailable:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="El servicio de SMS no está disponible, intente más tarde",
+                headers={"Retry-After": "30"}
             )
+        except SmsProviderError:
+            return False
         
-        return is_valid
-    except TwilioException:
-        return False
+        if is_valid:
+            verifications.mark_verified(phone_number)
+    
+    # Actualizar usuario si existe
+    if is_valid:
+        deps.db.users.update_one(
+            {"phone": phone_number},
+            {"$set": {"phone_verified": True}}
+        )
+    
+    return is_valid
 
-def create_or_update_user_from_google(google_user: dict, role: UserRole) -> dict:
+def create_or_update_user_from_google(db: Database, google_user: dict, role: UserRole) -> dict:
     """Crear o actualizar usuario desde datos de Google"""
     email = google_user.get('email')
     google_id = google_user.get('sub')
@@ -467,91 +495,53 @@ def create_or_update_user_from_google(google_user: dict, role: UserRole) -> dict
             detail="Datos de Google incompletos"
         )
     
-    # Buscar usuario existente por email o google_id
-    existing_user = db.users.find_one({
-        "$or": [
-            {"email": email},
-            {"google_id": google_id}
-        ]
-    })
-    
-    if existing_user:
-        # Actualizar datos de Google si no están presentes
-        update_data = {}
-        if not existing_user.get("google_id"):
-            update_data["google_id"] = google_id
-            update_data["auth_provider"] = AuthProvider.GOOGLE
-        
-        if not existing_user.get("avatar_url") and google_user.get("picture"):
-            update_data["avatar_url"] = google_user.get("picture")
-        
-        if update_data:
-            db.users.update_one(
-                {"user_id": existing_user["user_id"]},
-                {"$set": update_data}
-            )
-            existing_user.update(update_data)
-        
-        return existing_user
-    else:
-        # Crear nuevo usuario
-        user_id = str(uuid.uuid4())
-        user_doc = {
-            "user_id": user_id,
-            "email": email,
-            "password": None,  # No password for Google users
-            "full_name": google_user.get('name', ''),
-            "role": role,
-            "phone": None,
-            "phone_verified": False,
-            "auth_provider": AuthProvider.GOOGLE,
-            "google_id": google_id,
-            "created_at": datetime.utcnow(),
-            "is_active": True,
-            "avatar_url": google_user.get('picture'),
-            "rating": 0.0,
-            "total_ratings": 0
-        }
-        
-        db.users.insert_one(user_doc)
-        
-        # Si es jardinero, crear perfil de jardinero
-        if role == UserRole.GARDENER:
-            gardener_doc = {
-                "user_id": user_id,
-                "tools": [],
-                "coverage_areas": [],
-                "base_rates": {},
-                "availability": {},
-                "is_available": True,
-                "rating": 0.0,
-                "completed_jobs": 0,
-                "specialties": [],
-                "bio": None,
-                "years_experience": 0,
-                "created_at": datetime.utcnow()
-            }
-            db.gardeners.insert_one(gardener_doc)
-        
-        return user_doc
+    # Un solo upsert por email; el perfil de jardinero solo si la cuenta es nueva
+    user_id = str(uuid.uuid4())
+    user_doc = {
+        "user_id": user_id,
+        "email": email,
+        "password": None,  # No password for Google users
+        "full_name": google_user.get('name', ''),
+        "role": role,
+        "phone": None,
+        "phone_verified": False,
+        "auth_provider": AuthProvider.GOOGLE,
+        "google_id": google_id,
+        "created_at": datetime.utcnow(),
+        "is_active": True,
+        "avatar_url": google_user.get('picture'),
+        "rating": 0.0,
+        "total_ratings": 0,
+        **user_search_fields(email)
+    }
+    gardener_doc = new_gardener_profile(user_id) if role == UserRole.GARDENER else None
+    return upsert_google_account(db, user_doc, gardener_doc)
 
 # Rutas de API optimizadas
 
-@app.get("/api/health")
+@router.get("/metrics", include_in_schema=False)
+async def metrics(deps: AppDependencies = Depends(get_deps)):
+    # Algunos collectors consultan Mongo (serverStatus, cola de trabajos) con
+    # pymongo síncrono: en un hilo, sin frenar el event loop
+    body = await asyncio.to_thread(deps.metrics.render)
+    return PlainTextResponse(body, media_type="text/plain; version=0.0.4")
+
+@router.get("/api/health")
 async def health_check():
     return {"status": "healthy", "message": "PASTO! API funcionando", "version": "2.1.0"}
 
-@app.post("/api/auth/register")
-async def register_user(user_data: UserRegistration):
-    # Verificar si el usuario ya existe
-    existing_user = db.users.find_one({"email": user_data.email})
-    if existing_user:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="El email ya está registrado"
-        )
+@router.post("/api/auth/register")
+async def register_user(
+    user_data: UserRegistration,
+    request: Request,
+    db: Database = Depends(get_db),
+    limiter: RateLimiter = Depends(get_rate_limiter)
+):
+    # Limitar intentos antes de calcular el hash bcrypt
+    limiter.check(REGISTER_PER_IP, client_ip(request))
+    limiter.check(REGISTER_PER_EMAIL, normalize_email(user_data.email))
     
-    # Crear nuevo usuario
+    # Crear nuevo usuario; el índice único de email rechaza los duplicados
     user_id = str(uuid.uuid4())
     hashed_password = hash_password(user_data.password)
     
@@ -569,28 +559,19 @@ async def register_user(user_data: UserRegistration):
         "is_active": True,
         "avatar_url": None,
         "rating": 0.0,
-        "total_ratings": 0
+        "total_ratings": 0,
+        **user_search_fields(user_data.email)
     }
     
-    db.users.insert_one(user_doc)
-    
-    # Si es jardinero, crear perfil básico
-    if user_data.role == UserRole.GARDENER:
-        gardener_doc = {
-            "user_id": user_id,
-            "tools": [],
-            "coverage_areas": [],
-            "base_rates": {},
-            "availability": {},
-            "is_available": True,
-            "rating": 0.0,
-            "completed_jobs": 0,
-            "specialties": [],
-            "bio": None,
-            "years_experience": 0,
-            "created_at": datetime.utcnow()
-        }
-        db.gardeners.insert_one(gardener_doc)
+    # Si es jardinero, el perfil básico se escribe junto con el usuario
+    gardener_doc = new_gardener_profile(user_id) if user_data.role == UserRole.GARDENER else None
+    try:
+        insert_account(db, user_doc, gardener_doc)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El email ya está registrado"
+        )
     
     # Crear token de acceso
     access_token = create_access_token(data={"sub": user_id})
@@ -611,8 +592,17 @@ async def register_user(user_data: UserRegistration):
         )
     }
 
-@app.post("/api/auth/login")
-async def login_user(user_data: UserLogin):
+@router.post("/api/auth/login")
+async def login_user(
+    user_data: UserLogin,
+    request: Request,
+    db: Database = Depends(get_db),
+    limiter: RateLimiter = Depends(get_rate_limiter)
+):
+    # Limitar intentos antes de consultar la base y verificar bcrypt
+    limiter.check(LOGIN_PER_IP, client_ip(request))
+    limiter.check(LOGIN_PER_EMAIL, normalize_email(user_data.email))
+    
     user = db.users.find_one({"email": user_data.email})
     if not user:
         raise HTTPException(
@@ -634,6 +624,12 @@ async def login_user(user_data: UserLogin):
             detail="Email o contraseña incorrectos"
         )
     
+    if not user.get("is_active", True):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Usuario desactivado"
+        )
+    
     access_token = create_access_token(data={"sub": user["user_id"]})
     
     return {
@@ -656,7 +652,7 @@ async def login_user(user_data: UserLogin):
         )
     }
 
-@app.get("/api/auth/me")
+@router.get("/api/auth/me")
 async def get_current_user_profile(current_user: dict = Depends(get_current_user)):
     return UserProfile(
         user_id=current_user["user_id"],
@@ -674,19 +670,42 @@ async def get_current_user_profile(current_user: dict = Depends(get_current_user
         total_ratings=current_user.get("total_ratings", 0)
     )
 
-@app.post("/api/auth/google/complete")
-async def google_complete_auth(auth_data: GoogleAuthRequest):
-    """Completar autenticación con Google (simplificado)"""
+@router.post("/api/auth/google/complete")
+async def google_complete_auth(
+    auth_data: GoogleAuthRequest,
+    db: Database = Depends(get_db),
+    deps: AppDependencies = Depends(get_deps)
+):
+    """Completar autenticación con Google.
+
+    El ID token se verifica localmente contra las claves de Google en
+    memoria: sin llamadas salientes salvo el canje de un ``code``.
+    """
+    if not auth_data.id_token and not auth_data.code:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Se requiere id_token o code"
+        )
     try:
-        # Simular datos de usuario de Google
-        google_user = {
-            "sub": "google_user_id_" + str(uuid.uuid4()),
-            "email": "user@example.com",
-            "name": "Usuario Google",
-            "picture": "https://example.com/avatar.jpg"
-        }
+        if deps.google_enabled:
+            provider = deps.oidc
+            id_token = auth_data.id_token or await provider.exchange_code(auth_data.code, auth_data.redirect_uri)
+            google_user = await provider.verify_id_token(id_token)
+        else:
+            # Sin Google configurado (desarrollo): simular datos de usuario de Google
+            google_user = {
+                "sub": "google_user_id_" + str(uuid.uuid4()),
+                "email": "user@example.com",
+                "name": "Usuario Google",
+                "picture": "https://example.com/avatar.jpg"
+            }
         
-        user_doc = create_or_update_user_from_google(google_user, auth_data.role)
+        user_doc = create_or_update_user_from_google(db, google_user, auth_data.role)
+        if not user_doc.get("is_active", True):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Usuario desactivado"
+            )
         access_token = create_access_token(data={"sub": user_doc["user_id"]})
         
         return {
@@ -695,6 +714,19 @@ async def google_complete_auth(auth_data: GoogleAuthRequest):
             "user": UserProfile(**user_doc)
         }
         
+    except HTTPException:
+        raise
+    except IdTokenError as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Token de Google inválido: {str(e)}"
+        )
+    except ProviderUnavailable:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="El servicio de Google no está disponible, intente más tarde",
+            headers={"Retry-After": "30"}
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -702,7 +734,7 @@ async def google_complete_auth(auth_data: GoogleAuthRequest):
         )
 
 # Endpoints de servicios optimizados
-@app.post("/api/services/estimate")
+@router.post("/api/services/estimate")
 async def estimate_service_price(
     service_type: ServiceType,
     terrain_width: float,
@@ -726,10 +758,14 @@ async def estimate_service_price(
         "currency": "ARS"
     }
 
-@app.post("/api/services/request")
+@router.post("/api/services/request")
 async def create_service_request(
     service_data: ServiceRequest,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_db),
+    deps: AppDependencies = Depends(get_deps),
+    queue: JobQueue = Depends(get_queue),
+    idempotency: IdempotencyKey = Depends(get_idempotency_key)
 ):
     if current_user["role"] != UserRole.CLIENT:
         raise HTTPException(
@@ -737,6 +773,11 @@ async def create_service_request(
             detail="Solo los clientes pueden solicitar servicios"
         )
     
+    # Un reintento con la misma Idempotency-Key no crea otro servicio ni notifica de nuevo
+    replayed = idempotency.replay(fingerprint(service_data.model_dump(mode="json")))
+    if replayed is not None:
+        return replayed
+    
     # Calcular precio y duración
     estimation = calculate_service_price(
         service_data.service_type,
@@ -745,6 +786,16 @@ async def create_service_request(
         service_data.pruning_difficulty
     )
     
+    # Un servicio programado se publica recién con la anticipación configurada
+    now = datetime.utcnow()
+    scheduled_date = to_utc_naive(service_data.scheduled_date)
+    released = is_released_on_create(
+        scheduled_date,
+        service_data.is_immediate,
+        timedelta(minutes=deps.settings.schedule_release_lead_minutes),
+        now
+    )
+    
     service_id = str(uuid.uuid4())
     service_doc = {
         "service_id": service_id,
@@ -760,8 +811,9 @@ async def create_service_request(
         "terrain_length": service_data.terrain_length,
         "images": service_data.images,
         "pruning_difficulty": service_data.pruning_difficulty,
-        "scheduled_date": service_data.scheduled_date,
+        "scheduled_date": scheduled_date,
         "is_immediate": service_data.is_immediate,
+        "released": released,
         "estimated_price": estimation["estimated_price"],
         "estimated_duration": estimation["estimated_duration"],
         "final_price": None,
@@ -775,77 +827,267 @@ async def create_service_request(
         "client_rating": None,
         "gardener_rating": None,
         "client_review": None,
-        "gardener_review": None
+        "gardener_review": None,
+        **service_search_fields(service_data.address)
     }
     
-    db.services.insert_one(service_doc)
-    
-    # Notificar solo a jardineros disponibles y activos
-    available_gardeners = db.gardeners.find({"is_available": True}, {"user_id": 1}).limit(20)
-    for gardener in available_gardeners:
-        send_notification(
-            gardener["user_id"],
-            NotificationType.NEW_SERVICE_AVAILABLE,
-            "¡Nuevo trabajo disponible!",
-            f"Nuevo servicio de {service_data.service_type} en {service_data.address}",
-            {"service_id": service_id}
-        )
+    db.services.insert_one(compact_service(service_doc))
+    record_service_created(db, service_doc)
+    record_tile_created(db, service_doc, deps.settings.heatmap_recent_days)
+    bump_versions(db, [current_user["user_id"]], SERVICES)
     
-    return ServiceResponse(**service_doc)
+    # Notificar solo a jardineros disponibles y activos, fuera de la solicitud
+    if released:
+        enqueue_new_service_available(queue, service_doc)
+    
+    return idempotency.store(ServiceResponse(**service_doc))
 
-@app.get("/api/services/available")
-async def get_available_services(current_user: dict = Depends(get_current_user)):
+@router.get("/api/services/available")
+async def get_available_services(current_user: dict = Depends(get_current_user), db: Database = Depends(get_db)):
     if current_user["role"] != UserRole.GARDENER:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los jardineros pueden ver servicios disponibles"
         )
     
-    # Optimizar query - solo servicios pendientes ordenados por fecha
+    # Optimizar query - solo servicios pendientes ordenados por fecha; los programados
+    # aparecen cuando el scheduler los publica (released=False solo en los no publicados)
     services = list(db.services.find(
-        {"status": ServiceStatus.PENDING}
+        {"status": ServiceStatus.PENDING, "released": {"$ne": False}}
     ).sort("created_at", -1).limit(50))
     
-    return [ServiceResponse(**service) for service in services]
+    return [ServiceResponse(**expand_service(service)) for service in services]
+
+@router.get("/api/services/heatmap")
+async def get_demand_heatmap(
+    precision: int = 5,
+    min_lat: Optional[float] = None,
+    min_lng: Optional[float] = None,
+    max_lat: Optional[float] = None,
+    max_lng: Optional[float] = None,
+    current_user: dict = Depends(get_current_user),
+    deps: AppDependencies = Depends(get_deps)
+):
+    """Demanda por celda de geohash: pendientes, precio medio y creados recientes"""
+    if current_user["role"] not in (UserRole.GARDENER, UserRole.ADMIN):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los jardineros pueden ver el mapa de demanda"
+        )
+    
+    if not MIN_PRECISION <= precision <= STORAGE_PRECISION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"La precisión debe estar entre {MIN_PRECISION} y {STORAGE_PRECISION}"
+        )
+    
+    bounds = (min_lat, min_lng, max_lat, max_lng)
+    if any(value is None for value in bounds):
+        bounds = None
+    
+    # Servido desde la cache del proceso; se recalcula como mucho una vez por TTL
+    generated_at, tiles = deps.heatmap.get(deps.db, precision)
+    return {
+        "precision": precision,
+        "generated_at": generated_at,
+        "recent_days": deps.settings.heatmap_recent_days,
+        "tiles": tiles_in_bounds(tiles, bounds)
+    }
 
-@app.get("/api/services/my-requests")
-async def get_my_service_requests(current_user: dict = Depends(get_current_user)):
+@router.get("/api/services/my-route")
+async def get_my_route(
+    date: Optional[str] = None,
+    start_lat: Optional[float] = None,
+    start_lng: Optional[float] = None,
+    start_time: Optional[datetime] = None,
+    speed_kmh: float = 30.0,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_db)
+):
+    """Orden sugerido de los trabajos aceptados del día, con distancias y ETAs"""
+    if current_user["role"] != UserRole.GARDENER:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los jardineros pueden planificar su ruta"
+        )
+    
+    try:
+        day = datetime.strptime(date, "%Y-%m-%d") if date else datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Fecha inválida, use el formato AAAA-MM-DD"
+        )
+    if not 1 <= speed_kmh <= 120:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="La velocidad debe estar entre 1 y 120 km/h"
+        )
+    
+    # Programados para ese día; los inmediatos aceptados solo cuentan para hoy
+    day_filter = [{"scheduled_date": {"$gte": day, "$lt": day + timedelta(days=1)}}]
+    if day.date() == datetime.utcnow().date():
+        day_filter.append({"scheduled_date": None})
+    fields = ["service_id", "address", "latitude", "longitude", "estimated_duration",
+              "scheduled_date", "client_name", "service_type"]
+    jobs = [expand_service(job, fields) for job in db.services.find(
+        {"gardener_id": current_user["user_id"], "status": ServiceStatus.ACCEPTED, "$or": day_filter},
+        {"_id": 0, **storage_projection(fields)}
+    ).limit(100)]
+    
+    start = (start_lat, start_lng) if start_lat is not None and start_lng is not None else None
+    if start_time is None:
+        start_time = max(datetime.utcnow(), day + timedelta(hours=8)) if day.date() == datetime.utcnow().date() else day + timedelta(hours=8)
+    route = plan_route(jobs, start=start, start_time=to_utc_naive(start_time), speed_kmh=speed_kmh)
+    return {"date": f"{day:%Y-%m-%d}", "speed_kmh": speed_kmh, **route}
+
+@router.get("/api/services/my-requests")
+async def get_my_service_requests(
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    before: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user),
+    deps: AppDependencies = Depends(get_deps)
+):
     if current_user["role"] != UserRole.CLIENT:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los clientes pueden ver sus solicitudes"
         )
     
-    # Optimizar query - limitado a últimas 100 solicitudes
-    services = list(db.services.find(
-        {"client_id": current_user["user_id"]}
-    ).sort("created_at", -1).limit(100))
+    with deps.reads.causal_session() as session:
+        # Sin cambios desde el último poll: 304 sin correr la consulta. La versión
+        # se lee del primario y ancla la sesión causal: el secundario ya verá
+        # las escrituras propias que la incrementaron
+        version = read_version(deps.db, current_user["user_id"], SERVICES, session=session)
+        etag = list_etag(current_user["user_id"], SERVICES, version, limit, before)
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        
+        # Páginas de hasta 100 solicitudes; "before" pagina hacia atrás por created_at
+        services = find_services_history(
+            deps.reads.secondary,
+            {"client_id": current_user["user_id"]},
+            limit=min(max(limit, 1), 100),
+            before=before,
+            hot_window_days=deps.settings.service_archive_days,
+            session=session
+        )
     
-    return [ServiceResponse(**service) for service in services]
+    return [ServiceResponse(**expand_service(service)) for service in services]
 
-@app.get("/api/services/my-jobs")
-async def get_my_jobs(current_user: dict = Depends(get_current_user)):
+@router.get("/api/services/my-jobs")
+async def get_my_jobs(
+    request: Request,
+    response: Response,
+    limit: int = 100,
+    before: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user),
+    deps: AppDependencies = Depends(get_deps)
+):
     if current_user["role"] != UserRole.GARDENER:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los jardineros pueden ver sus trabajos"
         )
     
-    # Optimizar query - limitado a últimos 100 trabajos
-    services = list(db.services.find(
-        {"gardener_id": current_user["user_id"]}
-    ).sort("created_at", -1).limit(100))
+    with deps.reads.causal_session() as session:
+        # Sin cambios desde el último poll: 304 sin correr la consulta. La versión
+        # se lee del primario y ancla la sesión causal: el secundario ya verá
+        # las escrituras propias que la incrementaron
+        version = read_version(deps.db, current_user["user_id"], SERVICES, session=session)
+        etag = list_etag(current_user["user_id"], SERVICES, version, limit, before)
+        if etag_matches(request, etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        response.headers["ETag"] = etag
+        
+        # Páginas de hasta 100 trabajos; "before" pagina hacia atrás por created_at
+        services = find_services_history(
+            deps.reads.secondary,
+            {"gardener_id": current_user["user_id"]},
+            limit=min(max(limit, 1), 100),
+            before=before,
+            hot_window_days=deps.settings.service_archive_days,
+            session=session
+        )
     
-    return [ServiceResponse(**service) for service in services]
+    return [ServiceResponse(**expand_service(service)) for service in services]
+
+def service_search_scope(current_user: dict) -> dict:
+    """Servicios que cada rol puede buscar: el admin todos, el cliente los suyos
+    y el jardinero los suyos más los pendientes publicados (como en "available")"""
+    if current_user["role"] == UserRole.CLIENT:
+        return {"client_id": current_user["user_id"]}
+    if current_user["role"] == UserRole.GARDENER:
+        return {"$or": [{"gardener_id": current_user["user_id"]},
+                        {"status": ServiceStatus.PENDING, "released": {"$ne": False}}]}
+    return {}
+
+def validate_search_text(text: str) -> str:
+    text = text.strip()
+    if not text or len(text) > 200:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El texto de búsqueda debe tener entre 1 y 200 caracteres"
+        )
+    return text
+
+@router.get("/api/search/services")
+async def search_services_endpoint(
+    q: str,
+    limit: int = 20,
+    skip: int = 0,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_secondary_db)
+):
+    """Buscar servicios por dirección y notas, por relevancia"""
+    return search_services(db, validate_search_text(q), service_search_scope(current_user), limit=limit, skip=skip)
 
-@app.post("/api/services/{service_id}/accept")
-async def accept_service(service_id: str, current_user: dict = Depends(get_current_user)):
+@router.get("/api/search/autocomplete")
+async def autocomplete(
+    prefix: str,
+    field: str = "address",
+    limit: int = 10,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_secondary_db)
+):
+    """Sugerencias por prefijo: direcciones de servicios o emails de usuarios (solo admin)"""
+    prefix = validate_search_text(prefix)
+    limit = min(max(limit, 1), 20)
+    if field == "address":
+        return autocomplete_addresses(db, prefix, service_search_scope(current_user), limit=limit)
+    if field == "email":
+        if current_user["role"] != UserRole.ADMIN:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Solo los administradores pueden buscar usuarios"
+            )
+        return autocomplete_emails(db, prefix, limit=limit)
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Campo de autocompletado inválido"
+    )
+
+@router.post("/api/services/{service_id}/accept")
+async def accept_service(
+    service_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_db),
+    queue: JobQueue = Depends(get_queue),
+    idempotency: IdempotencyKey = Depends(get_idempotency_key)
+):
     if current_user["role"] != UserRole.GARDENER:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los jardineros pueden aceptar servicios"
         )
     
+    replayed = idempotency.replay(fingerprint({"service_id": service_id}))
+    if replayed is not None:
+        return replayed
+    
     service = db.services.find_one({"service_id": service_id})
     if not service:
         raise HTTPException(
@@ -859,9 +1101,9 @@ async def accept_service(service_id: str, current_user: dict = Depends(get_curre
             detail="El servicio ya no está disponible"
         )
     
-    # Actualizar servicio
-    db.services.update_one(
-        {"service_id": service_id},
+    # Actualizar servicio solo si sigue pendiente: dos jardineros no pueden aceptarlo a la vez
+    updated_service = db.services.find_one_and_update(
+        {"service_id": service_id, "status": ServiceStatus.PENDING, "released": {"$ne": False}},
         {
             "$set": {
                 "gardener_id": current_user["user_id"],
@@ -869,11 +1111,21 @@ async def accept_service(service_id: str, current_user: dict = Depends(get_curre
                 "status": ServiceStatus.ACCEPTED,
                 "updated_at": datetime.utcnow()
             }
-        }
+        },
+        return_document=ReturnDocument.AFTER
     )
+    if updated_service is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="El servicio ya no está disponible"
+        )
+    record_status_change(db, service, ServiceStatus.ACCEPTED, updated_service["updated_at"])
+    record_tile_status_change(db, service, ServiceStatus.ACCEPTED)
+    bump_versions(db, [service["client_id"], current_user["user_id"]], SERVICES)
     
     # Notificar al cliente
-    send_notification(
+    enqueue_notification(
+        queue,
         service["client_id"],
         NotificationType.SERVICE_ACCEPTED,
         "¡Servicio aceptado!",
@@ -881,14 +1133,15 @@ async def accept_service(service_id: str, current_user: dict = Depends(get_curre
         {"service_id": service_id, "gardener_name": current_user["full_name"]}
     )
     
-    updated_service = db.services.find_one({"service_id": service_id})
-    return ServiceResponse(**updated_service)
+    return idempotency.store(ServiceResponse(**expand_service(updated_service)))
 
-@app.post("/api/services/{service_id}/update-status")
+@router.post("/api/services/{service_id}/update-status")
 async def update_service_status(
     service_id: str,
     status_update: StatusUpdate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_db),
+    queue: JobQueue = Depends(get_queue)
 ):
     service = db.services.find_one({"service_id": service_id})
     if not service:
@@ -918,10 +1171,20 @@ async def update_service_status(
     if status_update.notes:
         update_data["notes"] = status_update.notes
     
-    db.services.update_one(
+    # El documento previo da el estado real del que se sale, para las estadísticas
+    previous_service = db.services.find_one_and_update(
         {"service_id": service_id},
-        {"$set": update_data}
+        {"$set": update_data},
+        return_document=ReturnDocument.BEFORE
     )
+    if previous_service is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Servicio no encontrado"
+        )
+    record_status_change(db, previous_service, status_update.status, update_data["updated_at"])
+    record_tile_status_change(db, previous_service, status_update.status)
+    bump_versions(db, [previous_service["client_id"], previous_service.get("gardener_id")], SERVICES)
     
     # Notificaciones optimizadas
     notification_messages = {
@@ -931,7 +1194,8 @@ async def update_service_status(
     }
     
     if status_update.status in notification_messages:
-        send_notification(
+        enqueue_notification(
+            queue,
             service["client_id"],
             NotificationType.SERVICE_STARTED if status_update.status == ServiceStatus.IN_PROGRESS else NotificationType.SERVICE_COMPLETED,
             "Actualización de servicio",
@@ -939,11 +1203,22 @@ async def update_service_status(
             {"service_id": service_id, "status": status_update.status}
         )
     
-    updated_service = db.services.find_one({"service_id": service_id})
-    return ServiceResponse(**updated_service)
+    return ServiceResponse(**expand_service({**previous_service, **update_data}))
 
-@app.get("/api/notifications")
-async def get_notifications(current_user: dict = Depends(get_current_user)):
+@router.get("/api/notifications")
+async def get_notifications(
+    request: Request,
+    response: Response,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_db)
+):
+    # Sin cambios desde el último poll: 304 sin consultar las notificaciones
+    version = read_version(db, current_user["user_id"], NOTIFICATIONS)
+    etag = list_etag(current_user["user_id"], NOTIFICATIONS, version)
+    if etag_matches(request, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    
     # Optimizar query - solo últimas 50 notificaciones
     notifications = list(db.notifications.find(
         {"user_id": current_user["user_id"]}
@@ -951,11 +1226,12 @@ async def get_notifications(current_user: dict = Depends(get_current_user)):
     
     return [Notification(**notification) for notification in notifications]
 
-@app.post("/api/notifications/{notification_id}/read")
-async def mark_notification_as_read(notification_id: str, current_user: dict = Depends(get_current_user)):
+@router.post("/api/notifications/{notification_id}/read")
+async def mark_notification_as_read(notification_id: str, current_user: dict = Depends(get_current_user), db: Database = Depends(get_db)):
+    # read_at habilita el vencimiento por TTL de las notificaciones leídas
     result = db.notifications.update_one(
         {"notification_id": notification_id, "user_id": current_user["user_id"]},
-        {"$set": {"read": True}}
+        {"$set": {"read": True, "read_at": datetime.utcnow()}}
     )
     
     if result.matched_count == 0:
@@ -963,11 +1239,13 @@ async def mark_notification_as_read(notification_id: str, current_user: dict = D
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Notificación no encontrada"
         )
+    if result.modified_count:
+        bump_versions(db, [current_user["user_id"]], NOTIFICATIONS)
     
     return {"message": "Notificación marcada como leída"}
 
-@app.post("/api/admin/create-admin")
-async def create_admin():
+@router.post("/api/admin/create-admin")
+async def create_admin(db: Database = Depends(get_db)):
     """Crear usuario administrador (solo para configuración inicial)"""
     admin_email = "admin@pasto.com"
     admin_password = "admin123"
@@ -995,10 +1273,14 @@ async def create_admin():
         "is_active": True,
         "avatar_url": None,
         "rating": 5.0,
-        "total_ratings": 1
+        "total_ratings": 1,
+        **user_search_fields(admin_email)
     }
     
-    db.users.insert_one(admin_doc)
+    try:
+        db.users.insert_one(admin_doc)
+    except DuplicateKeyError:
+        return {"message": "El usuario administrador ya existe"}
     
     return {
         "message": "Usuario administrador creado exitosamente",
@@ -1007,8 +1289,8 @@ async def create_admin():
         "user_id": user_id
     }
 
-@app.get("/api/admin/users")
-async def get_all_users(current_user: dict = Depends(get_current_user)):
+@router.get("/api/admin/users")
+async def get_all_users(current_user: dict = Depends(get_current_user), db: Database = Depends(get_secondary_db)):
     """Obtener todos los usuarios (solo admin)"""
     if current_user["role"] != UserRole.ADMIN:
         raise HTTPException(
@@ -1016,7 +1298,7 @@ async def get_all_users(current_user: dict = Depends(get_current_user)):
             detail="Solo los administradores pueden ver todos los usuarios"
         )
     
-    users = list(db.users.find({}, {"password": 0}))  # No incluir passwords
+    users = list(db.users.find({}, {"password": 0, "email_normalized": 0}))  # No incluir passwords
     
     # Convert MongoDB ObjectId to string
     for user in users:
@@ -1025,16 +1307,44 @@ async def get_all_users(current_user: dict = Depends(get_current_user)):
     
     return users
 
-@app.get("/api/admin/services")
-async def get_all_services(current_user: dict = Depends(get_current_user)):
-    """Obtener todos los servicios (solo admin)"""
+@router.get("/api/admin/search/users")
+async def search_users_endpoint(
+    q: str,
+    limit: int = 20,
+    skip: int = 0,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_secondary_db)
+):
+    """Buscar usuarios por nombre, o por prefijo de email si el texto tiene "@" (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden buscar usuarios"
+        )
+    
+    return search_users(db, validate_search_text(q), limit=limit, skip=skip)
+
+@router.get("/api/admin/services")
+async def get_all_services(
+    limit: Optional[int] = None,
+    before: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user),
+    deps: AppDependencies = Depends(get_deps)
+):
+    """Obtener todos los servicios, incluidos los archivados (solo admin)"""
     if current_user["role"] != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los administradores pueden ver todos los servicios"
         )
     
-    services = list(db.services.find({}))
+    services = [expand_service(service) for service in find_services_history(
+        deps.reads.secondary,
+        {},
+        limit=max(limit, 1) if limit else None,
+        before=before,
+        hot_window_days=deps.settings.service_archive_days
+    )]
     
     # Convert MongoDB ObjectId to string
     for service in services:
@@ -1043,28 +1353,196 @@ async def get_all_services(current_user: dict = Depends(get_current_user)):
     
     return services
 
-@app.delete("/api/admin/users/{user_id}")
-async def delete_user(user_id: str, current_user: dict = Depends(get_current_user)):
-    """Eliminar usuario (solo admin)"""
+@router.get("/api/admin/services/storage")
+async def get_service_storage_report(
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_db)
+):
+    """Tamaño de los documentos de servicios y resultado de la última compactación (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver este reporte"
+        )
+    
+    return {
+        "services": storage_report(db, "services"),
+        "services_archive": storage_report(db, "services_archive"),
+        "last_migration": db[MIGRATIONS_COLLECTION].find_one({"_id": MIGRATION_ID}, {"_id": 0}),
+    }
+
+@router.get("/api/admin/rate-limits")
+async def get_rate_limit_stats(
+    current_user: dict = Depends(get_current_user),
+    limiter: RateLimiter = Depends(get_rate_limiter)
+):
+    """Solicitudes permitidas y descartadas por regla de rate limiting (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver estas estadísticas"
+        )
+    
+    return {"enabled": limiter.enabled, "rules": limiter.stats()}
+
+@router.get("/api/admin/stats")
+async def get_admin_stats(
+    days: int = 30,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_secondary_db)
+):
+    """Estadísticas del panel desde los contadores agregados (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver las estadísticas"
+        )
+    
+    return read_dashboard(db, days=min(max(days, 1), 366))
+
+@router.get("/api/admin/slow-queries")
+async def get_slow_queries(
+    limit: int = 50,
+    sort_by: str = "total_ms",
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_secondary_db)
+):
+    """Formas de consultas lentas con su plan de ejecución (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver las consultas lentas"
+        )
+    
+    if sort_by not in ("total_ms", "max_ms", "count", "last_seen"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Orden inválido"
+        )
+    
+    slow_queries = list(db.slow_queries.find({}).sort(sort_by, -1).limit(min(max(limit, 1), 200)))
+    for slow_query in slow_queries:
+        slow_query["shape"] = json.loads(slow_query["shape"])
+        if slow_query.get("plan"):
+            slow_query["plan"] = json.loads(slow_query["plan"])
+        slow_query["avg_ms"] = round(slow_query["total_ms"] / slow_query["count"], 2)
+    
+    return slow_queries
+
+@router.get("/api/admin/notifications/report")
+async def get_notifications_report(
+    current_user: dict = Depends(get_current_user),
+    deps: AppDependencies = Depends(get_deps)
+):
+    """Tamaño de la colección de notificaciones y estado del archivado (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver este reporte"
+        )
+    
+    report = notifications_report(deps.reads.secondary, deps.settings.notification_archive_dir)
+    report["read_ttl_days"] = deps.settings.notification_read_ttl_days
+    report["archive_after_days"] = deps.settings.notification_archive_days
+    retention_job = deps.jobs.jobs.get("notification_retention")
+    report["last_archive_run"] = retention_job.status() if retention_job else None
+    return report
+
+@router.get("/api/admin/jobs")
+async def get_jobs(
+    state: str = DEAD,
+    limit: int = 50,
+    current_user: dict = Depends(get_current_user),
+    queue: JobQueue = Depends(get_queue)
+):
+    """Trabajos de la cola por estado, con los más recientes del estado pedido (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver la cola de trabajos"
+        )
+    
+    if state not in STATES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Estado inválido"
+        )
+    
+    jobs = list(queue.collection.find({"state": state}).sort("updated_at", -1).limit(min(max(limit, 1), 200)))
+    for job in jobs:
+        job["job_id"] = job.pop("_id")
+    return {"counts": queue.counts(), "jobs": jobs}
+
+@router.post("/api/admin/jobs/{job_id}/retry")
+async def retry_job(job_id: str, current_user: dict = Depends(get_current_user), queue: JobQueue = Depends(get_queue)):
+    """Reencolar un trabajo muerto (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden reintentar trabajos"
+        )
+    
+    if not queue.retry(job_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Trabajo muerto no encontrado"
+        )
+    
+    return {"message": "Trabajo reencolado"}
+
+@router.delete("/api/admin/users/{user_id}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_user(
+    user_id: str,
+    current_user: dict = Depends(get_current_user),
+    db: Database = Depends(get_db),
+    queue: JobQueue = Depends(get_queue)
+):
+    """Eliminar usuario (solo admin): se desactiva ya y sus datos se borran en segundo plano"""
     if current_user["role"] != UserRole.ADMIN:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Solo los administradores pueden eliminar usuarios"
         )
     
-    result = db.users.delete_one({"user_id": user_id})
-    if result.deleted_count == 0:
+    if db.users.find_one({"user_id": user_id}, {"_id": 1}) is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Usuario no encontrado"
         )
     
-    return {"message": "Usuario eliminado exitosamente"}
+    # Un segundo DELETE mientras el borrado sigue en curso no encola otro
+    if start_user_deletion(db, user_id, current_user["user_id"]):
+        queue.enqueue("delete_user_cascade", {"user_id": user_id})
+    
+    return {
+        "message": "Usuario desactivado; sus datos se eliminan en segundo plano",
+        "deletion": db.user_deletions.find_one({"_id": user_id})
+    }
+
+@router.get("/api/admin/users/{user_id}/deletion")
+async def get_user_deletion(user_id: str, current_user: dict = Depends(get_current_user), db: Database = Depends(get_db)):
+    """Progreso del borrado de un usuario (solo admin)"""
+    if current_user["role"] != UserRole.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Solo los administradores pueden ver el borrado de usuarios"
+        )
+    
+    deletion = db.user_deletions.find_one({"_id": user_id})
+    if deletion is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No hay un borrado para este usuario"
+        )
+    
+    return deletion
 
-@app.post("/api/upload/image")
+@router.post("/api/upload/image")
 async def upload_image(
     file: UploadFile = File(...),
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    deps: AppDependencies = Depends(get_deps),
+    idempotency: IdempotencyKey = Depends(get_idempotency_key)
 ):
     if not file.content_type.startswith("image/"):
         raise HTTPException(
@@ -1075,15 +1553,196 @@ async def upload_image(
     # Generar nombre único para el archivo
     file_extension = file.filename.split(".")[-1] if "." in file.filename else "jpg"
     unique_filename = f"{current_user['user_id']}_{uuid.uuid4()}.{file_extension}"
-    file_path = f"uploads/{unique_filename}"
     
-    # Guardar archivo
-    with open(file_path, "wb") as buffer:
-        content = await file.read()
-        buffer.write(content)
+    content = await file.read()
+    replayed = idempotency.replay(fingerprint(content))
+    if replayed is not None:
+        return replayed
+    
+    # Guardar archivo en un hilo: la URL tiene que ser válida al responder
+    image_url = await asyncio.to_thread(deps.storage.save, unique_filename, content)
     
     # Retornar URL del archivo
-    return {"image_url": f"/uploads/{unique_filename}"}
+    return idempotency.store({"image_url": image_url})
+
+def release_scheduled_service(deps: AppDependencies, service: dict):
+    """Un servicio programado se publicó: cuenta en el mapa de demanda y se avisa"""
+    if getattr(service["status"], "value", service["status"]) != ServiceStatus.PENDING.value:
+        return
+    record_tile_released(deps.db, service)
+    enqueue_new_service_available(deps.queue, service)
+
+def enqueue_service_reminders(queue: JobQueue, service: dict):
+    """Recordatorio de un servicio programado al jardinero y al cliente"""
+    scheduled = f"{service['scheduled_date']:%d/%m %H:%M} UTC"
+    data = {"service_id": service["service_id"], "scheduled_date": service["scheduled_date"].isoformat()}
+    enqueue_notification(queue, service["gardener_id"], NotificationType.SERVICE_REMINDER,
+                         "Recordatorio de trabajo", f"Tienes un trabajo en {service['address']} el {scheduled}", data)
+    enqueue_notification(queue, service["client_id"], NotificationType.SERVICE_REMINDER,
+                         "Recordatorio de servicio", f"{service['gardener_name']} irá a {service['address']} el {scheduled}", data)
+
+def register_job_handlers(deps: AppDependencies):
+    """Handlers de la cola de trabajos; se registran en todos los procesos"""
+    queue = deps.queue
+    
+    def notify_available_gardeners(payload: dict) -> dict:
+        gardeners = deps.db.gardeners.find({"is_available": True}, {"user_id": 1}).limit(20)
+        notified = 0
+        for gardener in gardeners:
+            send_notification(deps.db, gardener["user_id"], payload["type"], payload["title"],
+                              payload["message"], payload["data"])
+            notified += 1
+        return {"notified": notified}
+    
+    def notify_user(payload: dict) -> dict:
+        notification = send_notification(deps.db, payload["user_id"], payload["type"], payload["title"],
+                                         payload["message"], payload["data"])
+        return {"notification_id": notification["notification_id"]}
+    
+    queue.register("send_notification", notify_user)
+    queue.register("notify_available_gardeners", notify_available_gardeners)
+    async def sms_verification(payload: dict) -> dict:
+        return await deliver_sms_verification(deps, payload["phone_number"])
+    
+    queue.register("sms_verification", sms_verification)
+    def delete_user_cascade(payload: dict) -> dict:
+        settings = deps.settings
+        deletion = run_user_deletion(
+            deps.db,
+            deps.storage,
+            payload["user_id"],
+            batch_size=settings.user_deletion_batch_size,
+            max_batches=settings.user_deletion_batches_per_run
+        )
+        if deletion is None:
+            return {"state": None}
+        # Seguir más tarde: cede los workers y la base al tráfico normal entre tandas
+        if deletion["state"] != DELETION_DONE:
+            queue.enqueue("delete_user_cascade", payload, delay_seconds=settings.user_deletion_pause_seconds)
+        return {"state": deletion["state"], "step": deletion["step"], "counts": deletion["counts"]}
+    
+    queue.register("delete_user_cascade", delete_user_cascade)
+
+def register_background_jobs(deps: AppDependencies):
+    """Tareas de mantenimiento del worker; el lease evita que corran en paralelo"""
+    settings = deps.settings
+    job_locks = deps.db.job_locks
+    
+    deps.jobs.add_startup("ensure_indexes", deps.ensure_indexes)
+    deps.jobs.add_startup(
+        "backfill_search_fields",
+        lambda: backfill_search_fields(deps.db),
+        lock=LeaseLock(job_locks, "backfill_search_fields", lease_seconds=3600)
+    )
+    deps.jobs.add_startup("backfill_notification_read_at", lambda: backfill_read_at(deps.db))
+    # Migración de toda la colección: un solo worker, y nada una vez terminada
+    deps.jobs.add_startup(
+        "compact_service_documents",
+        lambda: migrate_service_documents(deps.db),
+        lock=LeaseLock(job_locks, "compact_service_documents", lease_seconds=3600)
+    )
+    if deps.google_enabled:
+        # Discovery y JWKS de Google siempre en memoria antes de que venzan
+        deps.jobs.add(deps.oidc)
+    deps.jobs.add(PeriodicJob(
+        "notification_retention",
+        settings.retention_interval_seconds,
+        lambda: archive_unread_notifications(
+            deps.db,
+            settings.notification_archive_dir,
+            settings.notification_archive_days,
+            batch_size=settings.notification_archive_batch_size
+        ),
+        lock=LeaseLock(job_locks, "notification_retention")
+    ))
+    deps.jobs.add(PeriodicJob(
+        "service_archival",
+        settings.retention_interval_seconds,
+        lambda: archive_terminal_services(
+            deps.db,
+            settings.service_archive_days,
+            batch_size=settings.service_archive_batch_size
+        ),
+        lock=LeaseLock(job_locks, "service_archival")
+    ))
+    deps.jobs.add(ServiceScheduler(
+        lambda: deps.db,
+        lambda service: release_scheduled_service(deps, service),
+        lambda service: enqueue_service_reminders(deps.queue, service),
+        release_lead=timedelta(minutes=settings.schedule_release_lead_minutes),
+        reminder_lead=timedelta(minutes=settings.schedule_reminder_lead_minutes),
+        horizon=timedelta(hours=settings.scheduler_horizon_hours),
+        refresh_seconds=settings.scheduler_refresh_seconds
+    ))
+    deps.jobs.add(PeriodicJob(
+        "demand_tiles_reconcile",
+        settings.stats_reconcile_interval_seconds,
+        lambda: reconcile_demand_tiles(deps.db, settings.heatmap_recent_days),
+        lock=LeaseLock(job_locks, "demand_tiles_reconcile")
+    ))
+    deps.jobs.add(PeriodicJob(
+        "stats_reconcile",
+        settings.stats_reconcile_interval_seconds,
+        lambda: reconcile_rollups(deps.db),
+        lock=LeaseLock(job_locks, "stats_reconcile")
+    ))
+
+def create_app(settings: Optional[Settings] = None, **overrides) -> FastAPI:
+    """Crear la aplicación.
+
+    No abre conexiones: db, oidc, sms y storage se crean al primer uso en
+    cada worker, o se pasan ya construidos como ``overrides``.
+    """
+    settings = settings or Settings.from_env()
+    deps = AppDependencies(settings, **overrides)
+    register_job_handlers(deps)
+
+    @asynccontextmanager
+    async def lifespan(app: FastAPI):
+        # Antes de atender solicitudes, haya o no tareas de fondo: el registro,
+        # las verificaciones y la idempotencia dependen de estos índices
+        await asyncio.to_thread(deps.ensure_required_indexes)
+        if settings.background_jobs_enabled:
+            register_background_jobs(deps)
+            deps.jobs.start()
+            deps.queue.start()
+        try:
+            yield
+        finally:
+            await deps.queue.stop()
+            await deps.jobs.stop()
+            await deps.aclose()
+
+    app = FastAPI(title="PASTO! API", version="2.0.0", lifespan=lifespan, default_response_class=ApiResponse)
+    app.state.deps = deps
+
+    # Configuración CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Compresión negociada y MessagePack por Accept
+    app.add_middleware(
+        EncodingMiddleware,
+        minimum_size=settings.compression_min_bytes,
+        compressor=Compressor() if settings.compression_enabled else None
+    )
+
+    # Métricas por ruta; se agrega al final para medir también los demás middlewares
+    if settings.metrics_enabled:
+        app.add_middleware(MetricsMiddleware, metrics=deps.metrics)
+
+    app.include_router(router)
+
+    # El directorio de uploads se crea con el primer archivo subido
+    app.mount("/uploads", StaticFiles(directory=settings.upload_dir, check_dir=False), name="uploads")
+    return app
+
+app = create_app()
 
 if __name__ == "__main__":
     import uvicorn
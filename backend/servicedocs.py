@@ -0,0 +1,211 @@
+"""Esquema compacto de los documentos de ``services``.
+
+Al guardar se omiten los campos nulos y los valores por defecto (``images``
+vacío, ``is_immediate`` y ``released`` verdaderos), y los campos que solo
+se leen de vuelta enteros, nunca en filtros, índices ni agregaciones, usan
+nombres cortos (``STORAGE_NAMES``). Un servicio recién creado pasa de ~30
+campos a ~18: menos bytes por documento, en los índices que lo cubren y en
+la cache de WiredTiger.
+
+Las consultas no cambian: en Mongo ``{"campo": None}`` también encuentra los
+documentos sin el campo, y ``{"released": {"$ne": False}}`` los que no lo
+tienen. ``expand_service`` devuelve la forma completa (nombres largos y
+nulos explícitos) para construir ``ServiceResponse`` o devolver el
+documento tal cual. Una escritura nueva de un campo renombrado debe usar
+``storage_name``.
+
+``client_name``/``gardener_name`` siguen desnormalizados: quitarlos
+obligaría a buscar usuarios en cada página de los listados.
+
+``migrate_service_documents`` reescribe los documentos viejos por lotes, sin
+bloquear la colección, y guarda un reporte de tamaño antes/después. Una vez
+terminada (``finished_at`` en el registro) no vuelve a recorrer la colección.
+"""
+import time
+from datetime import datetime
+from typing import Iterable, Optional
+
+from pymongo import UpdateOne
+
+STORAGE_NAMES = {
+    "terrain_width": "tw",
+    "terrain_length": "tl",
+    "pruning_difficulty": "pd",
+    "estimated_duration": "dur",
+    "actual_duration": "adur",
+    "images": "img",
+    "client_rating": "crt",
+    "gardener_rating": "grt",
+    "client_review": "crv",
+    "gardener_review": "grv",
+}
+FIELD_NAMES = {short: name for name, short in STORAGE_NAMES.items()}
+
+# Forma completa de lectura: lo que falta en el documento toma este valor
+SERVICE_DEFAULTS = {
+    "gardener_id": None,
+    "client_name": None,
+    "gardener_name": None,
+    "images": [],
+    "pruning_difficulty": None,
+    "scheduled_date": None,
+    "is_immediate": True,
+    "estimated_price": None,
+    "estimated_duration": None,
+    "final_price": None,
+    "actual_duration": None,
+    "started_at": None,
+    "completed_at": None,
+    "notes": None,
+    "client_rating": None,
+    "gardener_rating": None,
+    "client_review": None,
+    "gardener_review": None,
+}
+# Valores que no se guardan (None se omite siempre)
+OMITTED_VALUES = {"images": [], "is_immediate": True, "released": True}
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+# v2 también encuentra los valores omitidos guardados con el nombre corto
+# (``img: []``): las bases que ya terminaron la v1 la recorren una vez más
+MIGRATION_ID = "services_compact_v2"
+
+
+def storage_name(field: str) -> str:
+    return STORAGE_NAMES.get(field, field)
+
+
+def storage_projection(fields: Iterable[str]) -> dict:
+    """Proyección por nombres largos; los documentos leídos pasan por ``expand_service``"""
+    return {storage_name(field): 1 for field in fields}
+
+
+def _omitted(field: str, value) -> bool:
+    field = FIELD_NAMES.get(field, field)
+    return value is None or (field in OMITTED_VALUES and value == OMITTED_VALUES[field])
+
+
+def compact_service(doc: dict) -> dict:
+    """Documento para guardar: sin nulos ni valores por defecto, con nombres cortos"""
+    return {storage_name(field): value for field, value in doc.items() if not _omitted(field, value)}
+
+
+def expand_service(doc: dict, fields: Optional[Iterable[str]] = None) -> dict:
+    """Forma completa de lectura. Con ``fields`` solo se completan esos campos
+    (los de una proyección)"""
+    expanded = {FIELD_NAMES.get(field, field): value for field, value in doc.items()}
+    defaults = SERVICE_DEFAULTS if fields is None else {
+        field: SERVICE_DEFAULTS[field] for field in fields if field in SERVICE_DEFAULTS}
+    for field, value in defaults.items():
+        if field not in expanded:
+            expanded[field] = list(value) if isinstance(value, list) else value
+    return expanded
+
+
+def _needs_migration_query() -> dict:
+    # Un documento cuyo único resto es ``images: []`` (o ``img: []``) también se migra
+    omitted = [{name: {"$size": 0} if value == [] else value}
+               for field, value in OMITTED_VALUES.items() for name in dict.fromkeys([field, storage_name(field)])]
+    return {"$or": [{field: {"$exists": True}} for field in STORAGE_NAMES]
+            + [{field: {"$in": [None], "$exists": True}} for field in SERVICE_DEFAULTS]
+            + omitted}
+
+
+def _migration_update(doc: dict) -> Optional[UpdateOne]:
+    """Renombrar y quitar campos de a uno, condicionado a que sigan como se leyeron:
+    si otra escritura los cambió en el medio, el documento queda para el próximo lote"""
+    guard = {"_id": doc["_id"]}
+    rename, unset = {}, {}
+    for field, value in doc.items():
+        if field == "_id":
+            continue
+        if _omitted(field, value):
+            unset[field] = ""
+            guard[field] = {"$size": 0} if value == [] else value
+        elif field in STORAGE_NAMES:
+            rename[field] = STORAGE_NAMES[field]
+    if not rename and not unset:
+        return None
+    update = {}
+    if rename:
+        update["$rename"] = rename
+    if unset:
+        update["$unset"] = unset
+    return UpdateOne(guard, update)
+
+
+def storage_report(db, collection_name: str = "services") -> dict:
+    """Tamaño medio de documento e índices, y aciertos de la cache de WiredTiger"""
+    try:
+        stats = db.command("collStats", collection_name)
+    except Exception:
+        stats = {}
+    report = {
+        "collection": collection_name,
+        "documents": stats.get("count", db[collection_name].estimated_document_count()),
+        "avg_document_bytes": stats.get("avgObjSize"),
+        "data_bytes": stats.get("size"),
+        "index_bytes": stats.get("totalIndexSize"),
+        "cache_hit_ratio": None,
+        "measured_at": datetime.utcnow(),
+    }
+    try:
+        cache = db.client.admin.command("serverStatus", repl=0, metrics=0, locks=0)["wiredTiger"]["cache"]
+        requested = cache.get("pages requested from the cache", 0)
+        if requested:
+            # Acumulado desde el arranque del servidor
+            report["cache_hit_ratio"] = round(1 - cache.get("pages read into cache", 0) / requested, 4)
+    except Exception:
+        pass
+    return report
+
+
+def migration_finished(db) -> bool:
+    return db[MIGRATIONS_COLLECTION].find_one({"_id": MIGRATION_ID, "finished_at": {"$ne": None}}) is not None
+
+
+def migrate_service_documents(db, batch_size: int = 500, pause_seconds: float = 0.05,
+                              max_batches: int = 10_000, force: bool = False) -> dict:
+    """Compactar los documentos existentes por lotes y guardar el reporte antes/después"""
+    if not force and migration_finished(db):
+        return {"skipped": True}
+    query = _needs_migration_query()
+    migrated = {"services": 0, "services_archive": 0}
+    before = None
+    complete = True
+    for collection_name in migrated:
+        collection = db[collection_name]
+        last_id = None
+        for _ in range(max_batches):
+            page = query if last_id is None else {"$and": [query, {"_id": {"$gt": last_id}}]}
+            batch = list(collection.find(page).sort("_id", 1).limit(batch_size))
+            if not batch:
+                break
+            if before is None:
+                before = {name: storage_report(db, name) for name in migrated}
+            operations = [operation for operation in map(_migration_update, batch) if operation is not None]
+            if operations:
+                migrated[collection_name] += collection.bulk_write(operations, ordered=False).modified_count
+            last_id = batch[-1]["_id"]
+            if len(batch) < batch_size:
+                break
+            # Ceder I/O y cache al tráfico normal entre lotes
+            time.sleep(pause_seconds)
+        else:
+            # Se agotaron los lotes: falta trabajo para el próximo arranque
+            complete = False
+
+    finished_at = datetime.utcnow() if complete else None
+    if before is None:
+        db[MIGRATIONS_COLLECTION].update_one(
+            {"_id": MIGRATION_ID}, {"$set": {"finished_at": finished_at}}, upsert=True)
+        return {"migrated": migrated, "finished_at": finished_at}
+    result = {
+        "_id": MIGRATION_ID,
+        "migrated": migrated,
+        "before": before,
+        "after": {name: storage_report(db, name) for name in migrated},
+        "finished_at": finished_at,
+    }
+    db[MIGRATIONS_COLLECTION].replace_one({"_id": MIGRATION_ID}, result, upsert=True)
+    return result
@@ -0,0 +1,227 @@
+"""Registro de consultas lentas de Mongo con planes de ejecución.
+
+Un CommandListener de pymongo mide cada comando. Los que superan el umbral
+se agrupan por "forma" (el comando con los valores reemplazados por su tipo)
+y se acumulan en la colección ``slow_queries``. La primera vez que aparece
+una forma, un hilo en segundo plano ejecuta ``explain`` y marca los planes
+con COLLSCAN o SORT en memoria. Del plan solo se guarda el árbol de etapas
+con los índices usados (``plan_summary``): ``parsedQuery``, ``filter`` e
+``indexBounds`` llevan los valores literales de la consulta. Nunca se ejecutan comandos dentro del
+listener: todo el trabajo contra la base ocurre en ese hilo.
+"""
+import hashlib
+import json
+import queue
+import threading
+from datetime import datetime
+from typing import Optional
+
+from bson import json_util
+from pymongo import monitoring
+
+from metrics import current_request_scope, route_template
+
+# Comandos que tiene sentido agrupar y explicar
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+
+# Campos de sesión/transporte que no forman parte de la consulta
+TRANSPORT_FIELDS = {
+    "lsid", "$clusterTime", "$db", "txnNumber", "$readPreference", "autocommit",
+    "startTransaction", "readConcern", "writeConcern", "signature", "$query", "apiVersion",
+}
+
+SLOW_QUERIES_COLLECTION = "slow_queries"
+
+
+def redact(value):
+    """Reemplazar valores por su tipo, conservando claves y operadores"""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Las listas se reducen a las formas distintas de sus elementos
+        shapes = []
+        for item in value:
+            shape = redact(item)
+            if shape not in shapes:
+                shapes.append(shape)
+        return shapes
+    return f"<{type(value).__name__}>"
+
+
+def command_shape(command_name: str, command: dict) -> dict:
+    """Forma redactada del comando, sin campos de transporte"""
+    shape = {}
+    for key, value in command.items():
+        if key in TRANSPORT_FIELDS or key == command_name:
+            continue
+        # Las operaciones de escritura en lote se describen por su primer elemento
+        if key in ("updates", "deletes") and isinstance(value, list) and value:
+            value = value[:1]
+        shape[key] = redact(value)
+    return shape
+
+
+# Del plan se conservan estos campos de cada etapa...
+PLAN_FIELDS = {"stage", "indexName", "keyPattern", "isMultiKey", "direction", "namespace", "error", "code"}
+# ...y se recorren estos hijos (los planes rechazados no)
+PLAN_CHILDREN = {"queryPlanner", "winningPlan", "queryPlan", "inputStage", "inputStages", "stages", "$cursor",
+                 "shards"}
+
+
+def plan_summary(node):
+    """Árbol de etapas del plan, sin filtros ni límites de índice (tienen valores)"""
+    if isinstance(node, list):
+        return [plan_summary(child) for child in node]
+    if not isinstance(node, dict):
+        return None
+    summary = {key: node[key] for key in PLAN_FIELDS if key in node}
+    for key in PLAN_CHILDREN:
+        if key in node:
+            summary[key] = plan_summary(node[key])
+    if not summary:
+        # Etapa de un pipeline ($match, $group...): solo el nombre
+        summary = {"stage": next((key for key in node if key.startswith("$")), None)}
+    return summary
+
+
+def plan_flags(explain_output: dict) -> list:
+    """Etapas problemáticas en un plan: COLLSCAN y SORT en memoria"""
+    flags = set()
+
+    def walk(node):
+        if isinstance(node, dict):
+            stage = node.get("stage")
+            if stage == "COLLSCAN":
+                flags.add("COLLSCAN")
+            elif stage == "SORT":
+                flags.add("IN_MEMORY_SORT")
+            for key, child in node.items():
+                # Los planes rechazados no describen lo que realmente se ejecuta
+                if key != "rejectedPlans":
+                    walk(child)
+        elif isinstance(node, list):
+            for child in node:
+                walk(child)
+
+    walk(explain_output)
+    return sorted(flags)
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    def __init__(self, threshold_ms: float = 100, max_pending: int = 1000):
+        self.threshold_ms = threshold_ms
+        self.client = None
+        self.database_name: Optional[str] = None
+        self._started = {}
+        self._explained = set()
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def attach(self, client, database_name: str):
+        """Asociar el cliente con el que se guardan los registros y se piden los planes"""
+        self.client = client
+        self.database_name = database_name
+
+    def started(self, event):
+        if event.command_name not in EXPLAINABLE_COMMANDS:
+            return
+        collection = event.command.get(event.command_name)
+        if collection == SLOW_QUERIES_COLLECTION:
+            return
+        self._started[(event.connection_id, event.request_id)] = (
+            event.database_name, collection, event.command, route_template(current_request_scope.get())
+        )
+
+    def succeeded(self, event):
+        self._finished(event)
+
+    def failed(self, event):
+        self._finished(event)
+
+    def _finished(self, event):
+        started = self._started.pop((event.connection_id, event.request_id), None)
+        if started is None or self.client is None:
+            return
+        duration_ms = event.duration_micros / 1000
+        if duration_ms < self.threshold_ms:
+            return
+
+        database_name, collection, command, route = started
+        # Los filtros contienen claves con "$", que no se pueden guardar como campos
+        shape = json.dumps(command_shape(event.command_name, command), sort_keys=True)
+        shape_id = hashlib.sha1(f"{database_name}|{collection}|{event.command_name}|{shape}".encode()).hexdigest()
+
+        with self._lock:
+            needs_explain = shape_id not in self._explained
+            if needs_explain:
+                self._explained.add(shape_id)
+
+        record = {
+            "shape_id": shape_id,
+            "database": database_name,
+            "collection": collection,
+            "command_name": event.command_name,
+            "shape": shape,
+            "duration_ms": duration_ms,
+            "route": route,
+            "seen_at": datetime.utcnow(),
+            # El comando original solo viaja al hilo de explain; nunca se guarda
+            "command": command if needs_explain else None,
+        }
+        self._ensure_worker()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            pass
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name="slow-query-log", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            try:
+                self._store(record)
+            except Exception as e:
+                print(f"Warning: could not record slow query: {e}")
+
+    def _store(self, record: dict):
+        collection = self.client[self.database_name][SLOW_QUERIES_COLLECTION]
+        update = {
+            "$setOnInsert": {
+                "database": record["database"],
+                "collection": record["collection"],
+                "command_name": record["command_name"],
+                "shape": record["shape"],
+                "first_seen": record["seen_at"],
+            },
+            "$set": {"last_seen": record["seen_at"], "last_route": record["route"]},
+            "$inc": {"count": 1, "total_ms": record["duration_ms"]},
+            "$max": {"max_ms": record["duration_ms"]},
+            "$addToSet": {"routes": record["route"]},
+        }
+        if record["command"] is not None:
+            explain = self._explain(record)
+            if explain is not None:
+                update["$set"].update({
+                    "plan": json_util.dumps(plan_summary(explain)),
+                    "plan_flags": plan_flags(explain),
+                    "explained_at": datetime.utcnow(),
+                })
+        collection.update_one({"_id": record["shape_id"]}, update, upsert=True)
+
+    def _explain(self, record: dict) -> Optional[dict]:
+        command = {key: value for key, value in record["command"].items() if key not in TRANSPORT_FIELDS}
+        try:
+            output = self.client[record["database"]].command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+        except Exception as e:
+            # El mensaje del servidor puede citar la consulta: solo el tipo y el código
+            return {"stage": "EXPLAIN_FAILED", "error": type(e).__name__, "code": getattr(e, "code", None)}
+        return output
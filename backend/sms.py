@@ -0,0 +1,188 @@
+"""Proveedores de verificación por SMS.
+
+``TwilioVerifyProvider`` habla con la API REST de Twilio Verify con un
+cliente httpx asíncrono: un pool de conexiones por proceso, timeouts
+estrictos y un circuit breaker que, tras varios fallos seguidos del
+proveedor, rechaza de inmediato durante un rato en vez de colgar workers.
+
+``FakeSmsProvider`` es la verificación simulada de desarrollo (código fijo
+"123456"), que también sirve para tests y benchmarks sin red.
+"""
+import asyncio
+import time
+from typing import Optional
+
+import httpx
+
+TWILIO_VERIFY_URL = "https://verify.twilio.com/v2"
+
+
+class SmsProviderError(Exception):
+    """El proveedor rechazó la solicitud"""
+
+
+class SmsUnavailable(SmsProviderError):
+    """El proveedor no respondió a tiempo, falló o el circuito está abierto"""
+
+
+class CircuitBreaker:
+    """Abre el circuito tras ``failure_threshold`` fallos seguidos.
+
+    Con el circuito abierto se falla de inmediato; pasados ``reset_seconds``
+    se deja pasar una solicitud de prueba (half-open) que lo cierra o lo
+    vuelve a abrir.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_seconds: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if self._probing or time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self):
+        """Liberar la prueba que terminó sin resultado (cancelada o con otro error):
+        la próxima solicitud vuelve a probar"""
+        self._probing = False
+
+
+class FakeSmsProvider:
+    """Verificación simulada: el código siempre es ``code`` y se valida localmente"""
+
+    def __init__(self, code: str = "123456", latency_seconds: float = 0.0):
+        self.local_code = code
+        self.latency_seconds = latency_seconds
+        self.breaker = CircuitBreaker()
+        self.sent = []
+
+    async def start_verification(self, phone_number: str) -> str:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        self.sent.append(phone_number)
+        return "pending"
+
+    async def check_verification(self, phone_number: str, code: str) -> bool:
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return code == self.local_code
+
+    def stats(self) -> dict:
+        return {}
+
+    async def aclose(self):
+        pass
+
+
+class TwilioVerifyProvider:
+    # Sin código local: Twilio genera y valida el código
+    local_code = None
+
+    def __init__(self, account_sid: str, auth_token: str, service_sid: str, *,
+                 timeout_seconds: float = 5.0, connect_timeout_seconds: float = 2.0,
+                 max_connections: int = 20, breaker: Optional[CircuitBreaker] = None,
+                 base_url: str = TWILIO_VERIFY_URL, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.service_sid = service_sid
+        self.breaker = breaker or CircuitBreaker()
+        self._stats = {}
+        self._client_kwargs = {
+            "base_url": base_url,
+            "auth": (account_sid, auth_token),
+            "timeout": httpx.Timeout(timeout_seconds, connect=connect_timeout_seconds),
+            "limits": httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            "transport": transport,
+        }
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # Se crea dentro del event loop del worker que lo usa
+        if self._client is None:
+            self._client = httpx.AsyncClient(**self._client_kwargs)
+        return self._client
+
+    def _count(self, operation: str, outcome: str):
+        key = (operation, outcome)
+        self._stats[key] = self._stats.get(key, 0) + 1
+
+    async def _post(self, operation: str, path: str, data: dict) -> Optional[dict]:
+        """POST al proveedor; None si el recurso no existe (verificación vencida)"""
+        if not self.breaker.allow():
+            self._count(operation, "rejected")
+            raise SmsUnavailable("Proveedor de SMS no disponible (circuito abierto)")
+        try:
+            return await self._send(operation, path, data)
+        finally:
+            # Si fue la prueba de half-open y no registró resultado, no dejarla tomada
+            self.breaker.release_probe()
+
+    async def _send(self, operation: str, path: str, data: dict) -> Optional[dict]:
+        try:
+            response = await self.client.post(path, data=data)
+        except httpx.HTTPError as e:
+            self.breaker.record_failure()
+            self._count(operation, "error")
+            raise SmsUnavailable(f"Proveedor de SMS no disponible: {type(e).__name__}") from e
+
+        if response.status_code >= 500 or response.status_code == 429:
+            self.breaker.record_failure()
+            self._count(operation, "error")
+            raise SmsUnavailable(f"Proveedor de SMS respondió {response.status_code}")
+
+        # Un 4xx es un error de la solicitud, no del proveedor
+        self.breaker.record_success()
+        if response.status_code == 404:
+            self._count(operation, "not_found")
+            return None
+        if response.status_code >= 400:
+            self._count(operation, "rejected_by_provider")
+            raise SmsProviderError(response.json().get("message", f"HTTP {response.status_code}"))
+        self._count(operation, "ok")
+        return response.json()
+
+    async def start_verification(self, phone_number: str) -> str:
+        result = await self._post(
+            "start", f"/Services/{self.service_sid}/Verifications", {"To": phone_number, "Channel": "sms"})
+        if result is None:
+            raise SmsProviderError("Servicio de verificación inexistente")
+        return result["status"]
+
+    async def check_verification(self, phone_number: str, code: str) -> bool:
+        result = await self._post(
+            "check", f"/Services/{self.service_sid}/VerificationCheck", {"To": phone_number, "Code": code})
+        return result is not None and result.get("status") == "approved"
+
+    def stats(self) -> dict:
+        return dict(self._stats)
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,166 @@
+"""Borrado de usuarios en segundo plano, por lotes.
+
+El endpoint de admin solo desactiva al usuario (deja de poder autenticarse)
+y encola ``delete_user_cascade``. Cada ejecución del trabajo procesa como
+mucho ``max_batches`` lotes de ``batch_size`` documentos y, si queda
+trabajo, se vuelve a encolar con una pausa: un usuario con miles de
+servicios nunca ocupa un worker de la cola ni la base por mucho tiempo
+seguido. El progreso queda en ``user_deletions`` (un documento por
+usuario), así una ejecución interrumpida sigue desde el paso en que quedó.
+
+Pasos, en orden:
+    open_services   servicios abiertos: los del cliente se cancelan y los
+                    aceptados por el jardinero vuelven a pendiente (con las
+                    estadísticas y el mapa de demanda al día)
+    notifications   se borran
+    services        los terminados se anonimizan (nombre, dirección, notas,
+                    imágenes; coordenadas redondeadas a ~1 km), en services
+                    y services_archive: siguen contando en las estadísticas
+    uploads         se borran los archivos subidos por el usuario
+    profile         perfil de jardinero, versiones y por último el usuario
+"""
+from datetime import datetime
+from typing import Optional
+
+from pymongo import ReturnDocument, UpdateOne
+
+from heatmap import record_tile_status_change
+from rollups import record_status_change
+from versions import SERVICES, bump_versions
+
+RUNNING = "running"
+DONE = "done"
+STEPS = ("open_services", "notifications", "services", "uploads", "profile")
+
+DELETED_NAME = "Usuario eliminado"
+DELETED_ADDRESS = "Dirección eliminada"
+CLIENT_OPEN_STATUSES = ["pending", "accepted", "on_way", "in_progress"]
+GARDENER_OPEN_STATUSES = ["accepted", "on_way"]
+
+
+def start_user_deletion(db, user_id: str, requested_by: str) -> bool:
+    """Desactivar al usuario y registrar el borrado; False si ya estaba en curso"""
+    now = datetime.utcnow()
+    db.users.update_one({"user_id": user_id}, {"$set": {"is_active": False, "deleted_at": now}})
+    db.gardeners.update_one({"user_id": user_id}, {"$set": {"is_available": False}})
+    result = db.user_deletions.update_one(
+        {"_id": user_id},
+        {"$setOnInsert": {"state": RUNNING, "step": STEPS[0], "counts": {}, "runs": 0,
+                          "requested_by": requested_by, "started_at": now, "updated_at": now}},
+        upsert=True
+    )
+    return result.upserted_id is not None
+
+
+def _close_open_services(db, storage, user_id: str, batch_size: int) -> int:
+    now = datetime.utcnow()
+    processed = 0
+    for service in db.services.find(
+        {"$or": [{"client_id": user_id, "status": {"$in": CLIENT_OPEN_STATUSES}},
+                 {"gardener_id": user_id, "status": {"$in": GARDENER_OPEN_STATUSES}}]}
+    ).limit(batch_size):
+        if service["client_id"] == user_id:
+            new_status, update = "cancelled", {"$set": {"status": "cancelled", "updated_at": now}}
+            allowed = CLIENT_OPEN_STATUSES
+        else:
+            new_status = "pending"
+            update = {"$set": {"status": "pending", "updated_at": now},
+                      "$unset": {"gardener_id": "", "gardener_name": ""}}
+            allowed = GARDENER_OPEN_STATUSES
+        # Condicionado al estado leído: si cambió en el medio, se reintenta en el próximo lote
+        before = db.services.find_one_and_update(
+            {"_id": service["_id"], "status": {"$in": allowed}}, update, return_document=ReturnDocument.BEFORE)
+        if before is None:
+            continue
+        record_status_change(db, before, new_status, now)
+        record_tile_status_change(db, before, new_status)
+        bump_versions(db, [before["client_id"], before.get("gardener_id")], SERVICES)
+        processed += 1
+    return processed
+
+
+def _delete_notifications(db, storage, user_id: str, batch_size: int) -> int:
+    ids = [doc["_id"] for doc in db.notifications.find({"user_id": user_id}, {"_id": 1}).limit(batch_size)]
+    if not ids:
+        return 0
+    return db.notifications.delete_many({"_id": {"$in": ids}}).deleted_count
+
+
+def _anonymize_services(db, storage, user_id: str, batch_size: int) -> int:
+    processed = 0
+    for collection in (db.services, db.services_archive):
+        # limit(0) sería sin límite: cortar antes de llenar el lote
+        if processed >= batch_size:
+            break
+        client_side = list(collection.find(
+            {"client_id": user_id, "client_name": {"$ne": DELETED_NAME}},
+            {"latitude": 1, "longitude": 1}
+        ).limit(batch_size - processed))
+        if client_side:
+            # Coordenadas redondeadas: el mapa de demanda sigue sirviendo, el domicilio no
+            collection.bulk_write([UpdateOne({"_id": service["_id"]}, {
+                "$set": {"client_name": DELETED_NAME, "address": DELETED_ADDRESS,
+                         "latitude": round(service["latitude"], 2), "longitude": round(service["longitude"], 2)},
+                "$unset": {"notes": "", "img": "", "images": "", "address_tokens": ""},
+            }) for service in client_side], ordered=False)
+        processed += len(client_side)
+        if processed >= batch_size:
+            break
+
+        gardener_ids = [doc["_id"] for doc in collection.find(
+            {"gardener_id": user_id, "gardener_name": {"$ne": DELETED_NAME}}, {"_id": 1}
+        ).limit(batch_size - processed)]
+        if gardener_ids:
+            collection.update_many({"_id": {"$in": gardener_ids}}, {"$set": {"gardener_name": DELETED_NAME}})
+        processed += len(gardener_ids)
+    return processed
+
+
+def _delete_uploads(db, storage, user_id: str, batch_size: int) -> int:
+    return storage.delete_prefix(f"{user_id}_", limit=batch_size)
+
+
+def _delete_profile(db, storage, user_id: str, batch_size: int) -> int:
+    db.gardener_stats.update_one({"_id": user_id}, {"$set": {"gardener_name": DELETED_NAME}})
+    deleted = db.gardeners.delete_one({"user_id": user_id}).deleted_count
+    deleted += db.user_versions.delete_one({"_id": user_id}).deleted_count
+    deleted += db.users.delete_one({"user_id": user_id}).deleted_count
+    return deleted
+
+
+STEP_HANDLERS = {
+    "open_services": _close_open_services,
+    "notifications": _delete_notifications,
+    "services": _anonymize_services,
+    "uploads": _delete_uploads,
+    "profile": _delete_profile,
+}
+
+
+def run_user_deletion(db, storage, user_id: str, batch_size: int = 500, max_batches: int = 10) -> Optional[dict]:
+    """Avanzar el borrado como mucho ``max_batches`` lotes. Devuelve el progreso;
+    ``state`` sigue en running si falta trabajo"""
+    deletion = db.user_deletions.find_one({"_id": user_id})
+    if deletion is None or deletion["state"] == DONE:
+        return deletion
+
+    batches = 0
+    step_index = STEPS.index(deletion["step"])
+    while step_index < len(STEPS) and batches < max_batches:
+        step = STEPS[step_index]
+        processed = STEP_HANDLERS[step](db, storage, user_id, batch_size)
+        batches += 1
+        update = {"$set": {"updated_at": datetime.utcnow()}}
+        if processed:
+            update["$inc"] = {f"counts.{step}": processed}
+        # Un lote vacío cierra el paso (profile corre una sola vez)
+        if not processed or step == "profile":
+            step_index += 1
+            update["$set"]["step"] = STEPS[step_index] if step_index < len(STEPS) else step
+        db.user_deletions.update_one({"_id": user_id}, update)
+
+    done = step_index >= len(STEPS)
+    finish = {"$inc": {"runs": 1}}
+    if done:
+        finish["$set"] = {"state": DONE, "finished_at": datetime.utcnow()}
+    return db.user_deletions.find_one_and_update({"_id": user_id}, finish, return_document=ReturnDocument.AFTER)
@@ -0,0 +1,180 @@
+"""Almacén de verificaciones de teléfono.
+
+Un documento por número (upsert en cada envío), con vencimiento por índice
+TTL y un máximo de intentos. La verificación de un código local se resuelve
+en un único find_one_and_update: cuenta el intento y marca el número como
+verificado solo si el código coincide.
+
+Antes se insertaba un documento por envío, sin ``expires_at``: el índice
+único no se puede crear sobre esos datos. ``ensure_verification_indexes``
+migra una sola vez (deja el envío más reciente de cada número y completa
+``expires_at`` y ``attempts``) y después crea los índices; corre al
+arrancar, no en cada solicitud.
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+from pymongo import ReturnDocument
+
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 5
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+MIGRATION_ID = "phone_verifications_single"
+
+
+def migrate_verification_documents(db, ttl_seconds: int = DEFAULT_TTL_SECONDS) -> dict:
+    """Un documento por número (el más reciente) con ``expires_at`` y ``attempts``"""
+    collection = db.phone_verifications
+    duplicates = collection.aggregate([
+        {"$sort": {"created_at": -1}},
+        {"$group": {"_id": "$phone_number", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    removed = 0
+    for group in duplicates:
+        removed += collection.delete_many({"_id": {"$in": group["ids"][1:]}}).deleted_count
+
+    backfilled = 0
+    # Sin expires_at: vence ttl_seconds después de creado (los viejos, enseguida)
+    for doc in collection.find({"expires_at": {"$exists": False}}, {"created_at": 1}):
+        created_at = doc.get("created_at") or datetime.utcnow()
+        backfilled += collection.update_one({"_id": doc["_id"], "expires_at": {"$exists": False}}, {"$set": {
+            "expires_at": created_at + timedelta(seconds=ttl_seconds)}}).modified_count
+    collection.update_many({"attempts": {"$exists": False}}, {"$set": {"attempts": 0}})
+
+    result = {"_id": MIGRATION_ID, "removed": removed, "backfilled": backfilled, "finished_at": datetime.utcnow()}
+    db[MIGRATIONS_COLLECTION].replace_one({"_id": MIGRATION_ID}, result, upsert=True)
+    return result
+
+
+def ensure_verification_indexes(db, ttl_seconds: int = DEFAULT_TTL_SECONDS):
+    if db[MIGRATIONS_COLLECTION].find_one({"_id": MIGRATION_ID}) is None:
+        migrate_verification_documents(db, ttl_seconds)
+    db.phone_verifications.create_index("phone_number", unique=True)
+    db.phone_verifications.create_index("expires_at", expireAfterSeconds=0)
+
+
+class MongoVerificationStore:
+    def __init__(self, collection, ttl_seconds: int = DEFAULT_TTL_SECONDS,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+
+    def start(self, phone_number: str, status: str, code: Optional[str] = None):
+        """Registrar un envío; reemplaza cualquier intento anterior del número"""
+        now = datetime.utcnow()
+        self.collection.update_one(
+            {"phone_number": phone_number},
+            {"$set": {
+                "status": status,
+                "code": code,
+                "verified": False,
+                "attempts": 0,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            }, "$unset": {"verified_at": ""}},
+            upsert=True
+        )
+
+    def check_and_consume(self, phone_number: str, code: str) -> bool:
+        """Verificar un código guardado localmente en una sola operación atómica"""
+        now = datetime.utcnow()
+        verification = self.collection.find_one_and_update(
+            self._pending_filter(phone_number, now),
+            # $literal: un código como "$code" no se lee como ruta de campo
+            [{"$set": {
+                "attempts": {"$add": ["$attempts", 1]},
+                "verified": {"$eq": ["$code", {"$literal": code}]},
+                "verified_at": {"$cond": [{"$eq": ["$code", {"$literal": code}]}, now, None]},
+            }}],
+            return_document=ReturnDocument.AFTER
+        )
+        return bool(verification and verification["verified"])
+
+    def register_attempt(self, phone_number: str) -> bool:
+        """Contar un intento verificado por el proveedor; False si venció o se agotó"""
+        verification = self.collection.find_one_and_update(
+            self._pending_filter(phone_number, datetime.utcnow()),
+            {"$inc": {"attempts": 1}}
+        )
+        return verification is not None
+
+    def mark_verified(self, phone_number: str):
+        self.collection.update_one(
+            {"phone_number": phone_number, "verified": False},
+            {"$set": {"verified": True, "status": "approved", "verified_at": datetime.utcnow()}}
+        )
+
+    def _pending_filter(self, phone_number: str, now: datetime) -> dict:
+        return {
+            "phone_number": phone_number,
+            "verified": False,
+            "expires_at": {"$gt": now},
+            "attempts": {"$lt": self.max_attempts},
+        }
+
+
+class InMemoryVerificationStore:
+    """Misma interfaz que MongoVerificationStore, en memoria (tests y benchmarks)"""
+
+    def __init__(self, ttl_seconds: int = DEFAULT_TTL_SECONDS, max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.ttl_seconds = ttl_seconds
+        self.max_attempts = max_attempts
+        self._verifications = {}
+        self._lock = threading.Lock()
+
+    def start(self, phone_number: str, status: str, code: Optional[str] = None):
+        now = datetime.utcnow()
+        with self._lock:
+            self._purge_expired(now)
+            self._verifications[phone_number] = {
+                "phone_number": phone_number,
+                "status": status,
+                "code": code,
+                "verified": False,
+                "attempts": 0,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.ttl_seconds),
+            }
+
+    def check_and_consume(self, phone_number: str, code: str) -> bool:
+        with self._lock:
+            verification = self._pending(phone_number)
+            if verification is None:
+                return False
+            verification["attempts"] += 1
+            if verification["code"] != code:
+                return False
+            verification["verified"] = True
+            verification["verified_at"] = datetime.utcnow()
+            return True
+
+    def register_attempt(self, phone_number: str) -> bool:
+        with self._lock:
+            verification = self._pending(phone_number)
+            if verification is None:
+                return False
+            verification["attempts"] += 1
+            return True
+
+    def mark_verified(self, phone_number: str):
+        with self._lock:
+            verification = self._verifications.get(phone_number)
+            if verification and not verification["verified"]:
+                verification.update(verified=True, status="approved", verified_at=datetime.utcnow())
+
+    def _pending(self, phone_number: str) -> Optional[dict]:
+        verification = self._verifications.get(phone_number)
+        if (verification is None or verification["verified"]
+                or verification["expires_at"] <= datetime.utcnow()
+                or verification["attempts"] >= self.max_attempts):
+            return None
+        return verification
+
+    def _purge_expired(self, now: datetime):
+        expired = [phone for phone, v in self._verifications.items() if v["expires_at"] <= now]
+        for phone in expired:
+            del self._verifications[phone]
@@ -0,0 +1,47 @@
+"""Contadores de versión por usuario para GETs condicionales.
+
+Cada escritura que cambia un listado de un usuario incrementa su contador
+en ``user_versions`` (un documento por usuario, un campo por listado). El
+ETag del listado se deriva de ese contador, así un ``If-None-Match`` se
+responde con 304 tras leer un solo documento por _id, sin correr la
+consulta del listado ni serializar nada.
+
+La versión se lee antes de la consulta: si una escritura se cuela entre
+ambas, la respuesta lleva datos nuevos con el ETag viejo y el cliente solo
+vuelve a descargar en el siguiente poll (nunca se queda con datos viejos).
+"""
+import hashlib
+from typing import Iterable
+
+from fastapi import Request
+
+SERVICES = "services"
+NOTIFICATIONS = "notifications"
+
+
+def bump_versions(db, user_ids: Iterable[str], kind: str):
+    """Invalidar el listado ``kind`` de cada usuario"""
+    for user_id in {user_id for user_id in user_ids if user_id}:
+        db.user_versions.update_one({"_id": user_id}, {"$inc": {kind: 1}}, upsert=True)
+
+
+def read_version(db, user_id: str, kind: str, session=None) -> int:
+    doc = db.user_versions.find_one({"_id": user_id}, {kind: 1}, session=session)
+    return doc.get(kind, 0) if doc else 0
+
+
+def list_etag(user_id: str, kind: str, version: int, *params) -> str:
+    """ETag débil del listado; los parámetros de paginación forman parte de la clave"""
+    digest = hashlib.sha1(repr((user_id, params)).encode("utf-8")).hexdigest()[:12]
+    return f'W/"{kind}-{version}-{digest}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    # Comparación débil: W/ no cuenta
+    candidates = {candidate.strip().removeprefix("W/") for candidate in header.split(",")}
+    return etag.removeprefix("W/") in candidates
@@ -5,10 +5,12 @@ import random
 import string
 from datetime import datetime
 import json
+import os
 
 class PastoAPITester:
-    def __init__(self, base_url="https://8c0b897f-9481-473a-aee0-612b83ee3b64.preview.emergentagent.com"):
-        self.base_url = base_url
+    def __init__(self, base_url=None):
+        # Por defecto contra el servidor local; PASTO_API_URL permite apuntar a otro entorno
+        self.base_url = base_url or os.environ.get("PASTO_API_URL", "http://localhost:8001")
         self.client_token = None
         self.gardener_token = None
         self.admin_token = None